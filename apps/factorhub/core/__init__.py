@@ -4,12 +4,21 @@ Lazy imports to avoid startup errors with missing dependencies.
 Use these functions to access the modules when needed.
 """
 
+import threading
+
+_data_provider = None
+_data_provider_lock = threading.Lock()
+
 
 def get_data_provider():
-    """Get AKShareDataProvider instance"""
-    from apps.factorhub.core.data_provider import AKShareDataProvider
+    """Get the process-wide AKShareDataProvider instance"""
+    global _data_provider
+    with _data_provider_lock:
+        if _data_provider is None:
+            from apps.factorhub.core.data_provider import AKShareDataProvider
 
-    return AKShareDataProvider()
+            _data_provider = AKShareDataProvider()
+        return _data_provider
 
 
 def get_factor_library():
@@ -21,16 +30,20 @@ def get_factor_library():
 
 def get_factor_calculator():
     """Get FactorCalculator instance"""
+    from apps.factorhub.core.config import DEFAULT_CONFIG
+    from apps.factorhub.core.factor_cache import get_factor_cache
     from apps.factorhub.core.factor_calculator import FactorCalculator
 
-    return FactorCalculator()
+    cache = get_factor_cache() if DEFAULT_CONFIG["factor"]["result_cache"] else None
+    return FactorCalculator(cache=cache)
 
 
 def get_factor_analyzer():
     """Get FactorAnalyzer instance"""
     from apps.factorhub.core.factor_analyzer import FactorAnalyzer
+    from apps.factorhub.core.forward_returns import get_forward_returns
 
-    return FactorAnalyzer()
+    return FactorAnalyzer(forward_returns=get_forward_returns())
 
 
 def get_backtester(**kwargs):
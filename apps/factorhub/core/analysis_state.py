@@ -0,0 +1,221 @@
+"""
+增量因子分析状态
+
+每日重跑 IC、分层分析时，历史日期的截面结果不会变化，变化的只是新增的日期。这里为每个
+(因子定义, 持有期, 股票池) 持久化运行状态，新增日期只更新状态：
+
+    IC      Welford 均值/方差、|IC| 之和、正 IC 个数、最近 window 个 IC（滚动统计）
+    分层    各组平均收益与多空收益的 Welford 均值/方差、成员数与换手率累加、累计净值，
+            以及最后一个分层日期的分组（计算下一日期的换手率）
+
+状态记录处理到的最后日期、股票列表与历史数据版本（各分区的 generation，追加写入不变、
+整体重写时递增）。版本或股票列表变化、面板不再包含最后日期时从头重算。
+
+状态为 JSON 文件，先写临时文件再原子替换。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .config import ANALYSIS_STATE_DIR
+from .logger import logger
+from .panel import MarketPanel
+
+# 状态格式版本，累加方式变化时递增使旧状态失效
+STATE_FORMAT = 1
+
+
+def history_version(panel: MarketPanel) -> Optional[str]:
+    """
+    面板历史数据的版本，取自 get_panel 设置的各分区存储版本中的 generation
+
+    追加新日期时不变，分区整体重写（如复权数据重新下载）时变化；面板没有存储版本时返回 None。
+    """
+    version = panel.attrs.get("data_version")
+    if version is None:
+        return None
+    generations = sorted(
+        (symbol, "|".join(part.split(":")[0] for part in value.split("|")))
+        for symbol, value in version.items()
+    )
+    return hashlib.sha1(str(generations).encode()).hexdigest()
+
+
+class RunningMoments:
+    """按批合并的 Welford 均值/方差，size 为 None 时是标量，否则为 size 个独立序列"""
+
+    def __init__(self, size: int = None):
+        shape = () if size is None else (size,)
+        self.n = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def update(self, values: np.ndarray):
+        """加入一批样本（沿最后一维），NaN 忽略"""
+        values = np.asarray(values, dtype=float)
+        present = ~np.isnan(values)
+        n_batch = present.sum(axis=-1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            batch_mean = np.where(present, values, 0.0).sum(axis=-1) / n_batch
+            centered = np.where(present, values - np.expand_dims(batch_mean, -1), 0.0)
+            batch_m2 = (centered * centered).sum(axis=-1)
+            n = self.n + n_batch
+            delta = batch_mean - self.mean
+            mean = self.mean + delta * n_batch / n
+            m2 = self.m2 + batch_m2 + delta * delta * self.n * n_batch / n
+        updated = n_batch > 0
+        self.mean = np.where(updated, mean, self.mean)
+        self.m2 = np.where(updated, m2, self.m2)
+        self.n = n
+
+    def std(self) -> np.ndarray:
+        """样本标准差（ddof=1），样本不足 2 个为 NaN"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.n > 1, np.sqrt(self.m2 / (self.n - 1)), np.nan)
+
+    def to_dict(self) -> Dict:
+        return {"n": self.n.tolist(), "mean": self.mean.tolist(), "m2": self.m2.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RunningMoments":
+        moments = cls()
+        moments.n = np.asarray(data["n"], dtype=np.int64)
+        moments.mean = np.asarray(data["mean"], dtype=float)
+        moments.m2 = np.asarray(data["m2"], dtype=float)
+        return moments
+
+
+class AnalysisState:
+    """一个 (因子, 持有期, 股票池) 的 IC 与分层累加状态"""
+
+    def __init__(self, symbols: List[str], version: Optional[str], n_deciles: int):
+        self.symbols = list(symbols)
+        self.version = version
+        self.n_deciles = n_deciles
+        self.first_date: Optional[str] = None
+        self.last_date: Optional[str] = None
+        # IC
+        self.ic = RunningMoments()
+        self.ic_abs_sum = 0.0
+        self.ic_wins = 0
+        self.recent_ic: List[float] = []
+        # 分层
+        self.decile_returns = RunningMoments(n_deciles)
+        self.long_short = RunningMoments()
+        self.members = np.zeros(n_deciles)
+        self.turnover_sum = np.zeros(n_deciles)
+        self.turnover_count = np.zeros(n_deciles, dtype=np.int64)
+        self.decile_nav = np.ones(n_deciles)
+        self.long_short_nav = 1.0
+        self.last_buckets: Optional[np.ndarray] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "format": STATE_FORMAT,
+            "symbols": self.symbols,
+            "version": self.version,
+            "n_deciles": self.n_deciles,
+            "first_date": self.first_date,
+            "last_date": self.last_date,
+            "ic": self.ic.to_dict(),
+            "ic_abs_sum": self.ic_abs_sum,
+            "ic_wins": self.ic_wins,
+            "recent_ic": self.recent_ic,
+            "decile_returns": self.decile_returns.to_dict(),
+            "long_short": self.long_short.to_dict(),
+            "members": self.members.tolist(),
+            "turnover_sum": self.turnover_sum.tolist(),
+            "turnover_count": self.turnover_count.tolist(),
+            "decile_nav": self.decile_nav.tolist(),
+            "long_short_nav": self.long_short_nav,
+            "last_buckets": None if self.last_buckets is None else self.last_buckets.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "AnalysisState":
+        state = cls(data["symbols"], data["version"], data["n_deciles"])
+        state.first_date = data["first_date"]
+        state.last_date = data["last_date"]
+        state.ic = RunningMoments.from_dict(data["ic"])
+        state.ic_abs_sum = data["ic_abs_sum"]
+        state.ic_wins = data["ic_wins"]
+        state.recent_ic = list(data["recent_ic"])
+        state.decile_returns = RunningMoments.from_dict(data["decile_returns"])
+        state.long_short = RunningMoments.from_dict(data["long_short"])
+        state.members = np.asarray(data["members"], dtype=float)
+        state.turnover_sum = np.asarray(data["turnover_sum"], dtype=float)
+        state.turnover_count = np.asarray(data["turnover_count"], dtype=np.int64)
+        state.decile_nav = np.asarray(data["decile_nav"], dtype=float)
+        state.long_short_nav = data["long_short_nav"]
+        if data["last_buckets"] is not None:
+            state.last_buckets = np.asarray(data["last_buckets"], dtype=np.int8)
+        return state
+
+
+class AnalysisStateStore:
+    """磁盘上的增量分析状态"""
+
+    def __init__(self, root: Path = None):
+        """
+        Args:
+            root: 状态目录
+        """
+        self.root = Path(root) if root is not None else ANALYSIS_STATE_DIR
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.logger = logger
+
+    @staticmethod
+    def key(*parts) -> str:
+        return hashlib.sha1("|".join(map(str, (STATE_FORMAT,) + parts)).encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def load(self, key: str) -> Optional[AnalysisState]:
+        """读取状态，不存在、损坏或格式版本不符时返回 None"""
+        try:
+            with open(self._path(key)) as f:
+                data = json.load(f)
+            if data.get("format") != STATE_FORMAT:
+                return None
+            return AnalysisState.from_dict(data)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.warning(f"分析状态 {key[:12]} 读取失败，将重新计算: {str(e)[:50]}")
+            return None
+
+    def save(self, key: str, state: AnalysisState):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.stem}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp, "w") as f:
+                json.dump(state.to_dict(), f)
+            os.replace(tmp, path)
+        except OSError as e:
+            self.logger.warning(f"分析状态写入失败: {str(e)[:50]}")
+            tmp.unlink(missing_ok=True)
+
+    def delete(self, key: str):
+        self._path(key).unlink(missing_ok=True)
+
+
+_state_store = None
+_state_store_lock = threading.Lock()
+
+
+def get_analysis_state_store() -> AnalysisStateStore:
+    """进程内共享的增量分析状态存储"""
+    global _state_store
+    with _state_store_lock:
+        if _state_store is None:
+            _state_store = AnalysisStateStore()
+        return _state_store
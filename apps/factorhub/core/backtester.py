@@ -3,7 +3,7 @@
 """
 
 import warnings
-from typing import Dict
+from typing import Dict, Union
 
 import numpy as np
 import pandas as pd
@@ -11,6 +11,9 @@ import pandas as pd
 warnings.filterwarnings("ignore")
 
 from .logger import logger
+from .panel import MarketPanel
+from .rank_cache import RankCache, get_rank_cache
+from .trading_calendar import get_trading_calendar
 
 
 class Backtester:
@@ -22,12 +25,15 @@ class Backtester:
         commission: float = 0.0003,
         slippage: float = 0.001,
         benchmark: str = "000300",
+        rank_cache: RankCache = None,
     ):
         self.initial_capital = initial_capital
         self.commission = commission
         self.slippage = slippage
         self.benchmark = benchmark
         self.logger = logger
+        # 与分析器共享的截面分组缓存，同一因子的分位数分组只计算一次
+        self.rank_cache = rank_cache if rank_cache is not None else get_rank_cache()
         self.reset()
 
     def reset(self):
@@ -115,7 +121,7 @@ class Backtester:
 
     def run_backtest(
         self,
-        data: pd.DataFrame,
+        data: Union[pd.DataFrame, MarketPanel],
         factor_name: str,
         rebalance_freq: str = "weekly",
         long_quantile: int = 3,
@@ -125,56 +131,57 @@ class Backtester:
         self.reset()
 
         try:
-            dates = sorted(data["date"].unique())
-            symbols = data["symbol"].unique()
+            if isinstance(data, MarketPanel):
+                panel = data
+            else:
+                fields = ["close"] + ([factor_name] if factor_name in data.columns else [])
+                panel = MarketPanel.from_long(data, fields)
+            dates = panel.dates
+            symbols = panel.symbols
 
             if len(dates) < 10 or len(symbols) < 10:
                 return {"error": "数据量不足"}
 
-            # 确定再平衡日期
-            if rebalance_freq == "daily":
-                rebalance_dates = dates[20:]
-            elif rebalance_freq == "weekly":
-                rebalance_dates = [d for i, d in enumerate(dates) if i % 5 == 0]
-            elif rebalance_freq == "monthly":
-                rebalance_dates = [d for i, d in enumerate(dates) if i % 20 == 0]
+            # 停牌日沿用最近一次收盘价
+            close = panel.ffill("close")
+            factor_values = panel[factor_name] if factor_name in panel else None
+            # 全部日期的十分位分组一次计算（同逐日 pd.qcut），缺失为 -1
+            buckets = (
+                self.rank_cache.buckets(factor_values, 10) if factor_values is not None else None
+            )
+            symbol_index = {symbol: j for j, symbol in enumerate(symbols)}
+
+            # 确定再平衡日期：每周/每月首个交易日，数据缺失时顺延到之后最近的日期
+            if rebalance_freq in ("weekly", "monthly"):
+                calendar = get_trading_calendar()
+                targets = calendar.rebalance_dates(dates[0], dates[-1], rebalance_freq)
+                rebalance_rows = set(panel.dates.get_indexer(calendar.align(panel.dates, targets)))
             else:
-                rebalance_dates = dates[20:]
+                rebalance_rows = set(range(20, len(dates)))
 
             # 回测循环
             portfolio_values = []
-            for date in dates:
-                if date in rebalance_dates:
+            for i, date in enumerate(dates):
+                if i in rebalance_rows and factor_values is not None:
                     # 计算因子分位数
-                    date_data = data[data["date"] == date].copy()
-                    if factor_name not in date_data.columns:
+                    present = ~np.isnan(factor_values[i])
+                    if present.sum() < 10:
                         continue
 
-                    date_data = date_data.dropna(subset=[factor_name])
-                    if len(date_data) < 10:
-                        continue
-
-                    try:
-                        date_data["quantile"] = pd.qcut(
-                            date_data[factor_name], q=10, labels=False, duplicates="drop"
-                        )
-                    except:
-                        continue
+                    quantile = buckets[i, present]
+                    grouped = quantile >= 0
 
                     # 计算目标权重
-                    long_symbols = date_data[date_data["quantile"] <= long_quantile][
-                        "symbol"
-                    ].tolist()
-                    short_symbols = date_data[date_data["quantile"] >= short_quantile][
-                        "symbol"
-                    ].tolist()
+                    present_symbols = symbols[present]
+                    long_symbols = set(present_symbols[grouped & (quantile <= long_quantile)])
+                    short_symbols = set(present_symbols[quantile >= short_quantile])
 
                     n_long = max(1, len(long_symbols))
                     n_short = max(1, len(short_symbols))
 
-                    for symbol in symbols:
-                        price_data = self.load_price_data(data, symbol, date)
-                        if not price_data:
+                    for j, symbol in enumerate(symbols):
+                        price = close[i, j]
+                        if np.isnan(price):
                             continue
 
                         if symbol in long_symbols:
@@ -184,14 +191,14 @@ class Backtester:
                         else:
                             target_weight = 0
 
-                        self.execute_trade(symbol, target_weight, price_data["close"], date)
+                        self.execute_trade(symbol, target_weight, price, date)
 
                 # 更新组合价值
                 total_value = self.current_capital
                 for symbol, quantity in self.positions.items():
-                    price_data = self.load_price_data(data, symbol, date)
-                    if price_data:
-                        total_value += quantity * price_data["close"]
+                    price = close[i, symbol_index[symbol]]
+                    if not np.isnan(price):
+                        total_value += quantity * price
 
                 portfolio_values.append({"date": str(date), "value": total_value})
                 self.portfolio_value.append(total_value)
@@ -0,0 +1,332 @@
+"""
+列式行情存储
+
+每个 (symbol, adjust) 对应一个分区目录，每列一个定长二进制文件（固定 schema），
+按日期升序只追加写入。读取时通过内存映射只加载所需列和日期区间。
+分区的覆盖范围、行数、大小和校验和统一记录在缓存清单中。
+估值指标快照以 VALUATION_SCHEMA 按同样的方式存储在单独的目录中。
+"""
+
+import os
+import shutil
+import threading
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - 非POSIX平台退化为进程内锁
+    fcntl = None
+
+from .config import BARS_DIR
+from .logger import logger
+from .manifest import CacheManifest
+
+# 固定 schema：列名 -> 存储类型；date 以 datetime64[ns] 的 int64 形式存储
+SCHEMA = {
+    "date": "int64",
+    "open": "float64",
+    "high": "float64",
+    "low": "float64",
+    "close": "float64",
+    "volume": "float64",
+    "amount": "float64",
+    "outstanding_share": "float64",
+    "turnover": "float64",
+    "pct_change": "float64",
+    "change": "float64",
+    "return_1d": "float64",
+    "return_5d": "float64",
+}
+
+SCHEMA_VERSION = 1
+
+# 估值指标快照（未复权口径，分区的 adjust 固定为 VALUATION_ADJUST）
+VALUATION_SCHEMA = {
+    "date": "int64",
+    "pe": "float64",
+    "pe_static": "float64",
+    "pb": "float64",
+    "ps": "float64",
+    "pcf": "float64",
+    "market_cap": "float64",
+    "float_market_cap": "float64",
+}
+
+VALUATION_ADJUST = "none"
+
+
+class BarStore:
+    """按分区组织的列式日线存储"""
+
+    def __init__(self, root: Path = None, schema: Dict[str, str] = None):
+        """
+        Args:
+            root: 存储目录
+            schema: 列名 -> 存储类型，须包含 date 列，默认为日线 SCHEMA
+        """
+        self.root = Path(root) if root is not None else BARS_DIR
+        self.schema = schema if schema is not None else SCHEMA
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.logger = logger
+        self.manifest = CacheManifest(self.root)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def partition_dir(self, symbol: str, adjust: str) -> Path:
+        """分区目录"""
+        return self.root / f"{symbol}_{adjust}"
+
+    @contextmanager
+    def _lock(self, symbol: str, adjust: str):
+        """分区写锁：进程内线程锁 + 跨进程文件锁"""
+        key = f"{symbol}_{adjust}"
+        with self._locks_guard:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            lock = self._locks[key]
+
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.root / f".{key}.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _column_path(part_dir: Path, column: str, generation: int) -> Path:
+        return part_dir / f"{column}.{generation}.bin"
+
+    def info(self, symbol: str, adjust: str) -> Optional[Dict]:
+        """从清单读取分区元信息，不存在返回None"""
+        meta = self.manifest.get(symbol, adjust)
+        if meta is None or meta.get("schema_version") != SCHEMA_VERSION or meta["rows"] <= 0:
+            return None
+        return meta
+
+    def partitions(self) -> Iterator[Dict]:
+        """遍历所有分区元信息"""
+        for meta in self.manifest.entries():
+            if meta.get("schema_version") == SCHEMA_VERSION:
+                yield meta
+
+    def verify(self, symbol: str, adjust: str) -> bool:
+        """按清单中的校验和校验分区文件"""
+        meta = self.info(symbol, adjust)
+        if meta is None:
+            return False
+        part_dir = self.partition_dir(symbol, adjust)
+        for column, dtype in self.schema.items():
+            path = self._column_path(part_dir, column, meta["generation"])
+            try:
+                with open(path, "rb") as f:
+                    data = f.read(meta["rows"] * np.dtype(dtype).itemsize)
+            except FileNotFoundError:
+                return False
+            if zlib.crc32(data) != meta["checksums"][column]:
+                return False
+        return True
+
+    def _memmap(self, meta: Dict, column: str) -> np.ndarray:
+        part_dir = self.partition_dir(meta["symbol"], meta["adjust"])
+        path = self._column_path(part_dir, column, meta["generation"])
+        return np.memmap(path, dtype=self.schema[column], mode="r", shape=(meta["rows"],))
+
+    def read(
+        self,
+        symbol: str,
+        adjust: str,
+        start_date=None,
+        end_date=None,
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        读取分区数据
+
+        Args:
+            symbol: 股票代码
+            adjust: 复权类型
+            start_date: 开始日期（含），None表示不限
+            end_date: 结束日期（含），None表示不限
+            columns: 需要的列，None表示全部列
+        """
+
+        def locate(dates: np.ndarray, rows: int):
+            lo, hi = 0, rows
+            if start_date is not None:
+                lo = int(np.searchsorted(dates, pd.Timestamp(start_date).value, side="left"))
+            if end_date is not None:
+                hi = int(np.searchsorted(dates, pd.Timestamp(end_date).value, side="right"))
+            return lo, hi
+
+        return self._read(symbol, adjust, columns, locate)
+
+    def tail(
+        self, symbol: str, adjust: str, n: int, columns: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        """读取分区最后n行"""
+        return self._read(symbol, adjust, columns, lambda dates, rows: (max(rows - n, 0), rows))
+
+    def _read(self, symbol: str, adjust: str, columns, locate) -> pd.DataFrame:
+        columns = [c for c in (columns or list(self.schema)) if c in self.schema and c != "date"]
+        for attempt in range(2):
+            meta = self.info(symbol, adjust)
+            if meta is None:
+                return pd.DataFrame()
+            try:
+                dates = self._memmap(meta, "date")
+                lo, hi = locate(dates, meta["rows"])
+                if hi <= lo:
+                    return pd.DataFrame()
+
+                data = {"date": np.array(dates[lo:hi]).view("datetime64[ns]")}
+                for column in columns:
+                    data[column] = np.array(self._memmap(meta, column)[lo:hi])
+                break
+            except FileNotFoundError:
+                # 读取期间分区被重写，重新读取元信息后再试一次
+                if attempt == 1:
+                    self.logger.warning(f"读取分区失败 {symbol}_{adjust}")
+                    return pd.DataFrame()
+
+        df = pd.DataFrame(data)
+        df["symbol"] = symbol
+        return df
+
+    def _to_columns(self, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """将DataFrame转换为按schema类型化、按日期升序且去重的列数组"""
+        df = df.copy()
+        df["date"] = pd.to_datetime(df["date"])
+        df = df.drop_duplicates(subset=["date"], keep="last").sort_values("date")
+        arrays = {"date": df["date"].values.astype("datetime64[ns]").view("int64")}
+        for column, dtype in self.schema.items():
+            if column == "date":
+                continue
+            if column in df.columns:
+                values = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=dtype)
+            else:
+                values = np.full(len(df), np.nan, dtype=dtype)
+            arrays[column] = values
+        return arrays
+
+    def write(self, symbol: str, adjust: str, df: pd.DataFrame) -> Optional[Dict]:
+        """整体重写分区（写入新一代文件后原子切换清单条目）"""
+        if df is None or df.empty:
+            return None
+
+        arrays = self._to_columns(df)
+        with self._lock(symbol, adjust):
+            return self._write_locked(symbol, adjust, arrays)
+
+    def rewrite(
+        self, symbol: str, adjust: str, update: Callable[[pd.DataFrame], Optional[pd.DataFrame]]
+    ) -> Optional[Dict]:
+        """
+        在分区写锁内读取整个分区、变换后整体重写
+
+        读取与写入之间其他线程、进程的追加写入不会丢失。
+
+        Args:
+            symbol: 股票代码
+            adjust: 复权类型
+            update: 当前分区数据（不存在时为空表） -> 新数据，返回 None 或空表时不写入
+        """
+        with self._lock(symbol, adjust):
+            df = update(self.read(symbol, adjust))
+            if df is None or df.empty:
+                return self.info(symbol, adjust)
+            return self._write_locked(symbol, adjust, self._to_columns(df))
+
+    def _write_locked(self, symbol: str, adjust: str, arrays: Dict[str, np.ndarray]) -> Dict:
+        """写入新一代文件并提交，调用方须持有分区写锁"""
+        part_dir = self.partition_dir(symbol, adjust)
+        part_dir.mkdir(parents=True, exist_ok=True)
+        old_meta = self.info(symbol, adjust)
+        generation = (old_meta["generation"] + 1) if old_meta else 0
+
+        checksums = {}
+        for column, values in arrays.items():
+            data = values.tobytes()
+            with open(self._column_path(part_dir, column, generation), "wb") as f:
+                f.write(data)
+            checksums[column] = zlib.crc32(data)
+
+        dates = arrays["date"]
+        meta = {
+            "symbol": symbol,
+            "adjust": adjust,
+            "schema_version": SCHEMA_VERSION,
+            "generation": generation,
+            "rows": int(len(dates)),
+            "start_ns": int(dates[0]),
+            "start": pd.Timestamp(int(dates[0])).strftime("%Y-%m-%d"),
+            "checksums": checksums,
+        }
+        self._commit(meta, int(dates[-1]))
+
+        # 清理旧一代文件
+        for f in part_dir.glob("*.bin"):
+            if not f.name.endswith(f".{generation}.bin"):
+                f.unlink(missing_ok=True)
+        return meta
+
+    def append(self, symbol: str, adjust: str, df: pd.DataFrame) -> Optional[Dict]:
+        """
+        追加写入分区
+
+        只追加日期晚于分区最后日期的行；分区不存在时等同于 write。
+        """
+        if df is None or df.empty:
+            return self.info(symbol, adjust)
+
+        meta = self.info(symbol, adjust)
+        if meta is None:
+            return self.write(symbol, adjust, df)
+
+        arrays = self._to_columns(df)
+        with self._lock(symbol, adjust):
+            meta = self.info(symbol, adjust)
+            mask = arrays["date"] > meta["end_ns"]
+            if not mask.any():
+                return meta
+
+            part_dir = self.partition_dir(symbol, adjust)
+            rows = meta["rows"]
+            checksums = dict(meta["checksums"])
+            for column, values in arrays.items():
+                path = self._column_path(part_dir, column, meta["generation"])
+                data = values[mask].tobytes()
+                with open(path, "r+b") as f:
+                    # 截掉上次未提交（清单未更新）的尾部数据
+                    f.truncate(rows * np.dtype(self.schema[column]).itemsize)
+                    f.seek(0, os.SEEK_END)
+                    f.write(data)
+                checksums[column] = zlib.crc32(data, checksums[column])
+
+            new_dates = arrays["date"][mask]
+            meta = dict(meta, rows=rows + len(new_dates), checksums=checksums)
+            self._commit(meta, int(new_dates[-1]))
+            return meta
+
+    def delete(self, symbol: str, adjust: str):
+        """删除分区"""
+        with self._lock(symbol, adjust):
+            self.manifest.remove(symbol, adjust)
+            shutil.rmtree(self.partition_dir(symbol, adjust), ignore_errors=True)
+
+    def _commit(self, meta: Dict, end_ns: int):
+        """补全覆盖范围与大小信息后写入清单，作为本次写入的提交点"""
+        meta["end_ns"] = end_ns
+        meta["end"] = pd.Timestamp(end_ns).strftime("%Y-%m-%d")
+        meta["bytes"] = meta["rows"] * sum(np.dtype(t).itemsize for t in self.schema.values())
+        meta["checksum"] = f"{zlib.crc32(str(sorted(meta['checksums'].items())).encode()):08x}"
+        self.manifest.put(meta)
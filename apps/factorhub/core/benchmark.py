@@ -0,0 +1,285 @@
+"""
+因子计算性能基准
+
+对比逐股票计算（groupby + 逐因子 merge，即原 FactorCalculator 的计算方式）
+与 FactorEngine 在面板数组上一次性计算 calculate_all_technical_factors 的耗时。
+
+用法:
+    python -m apps.factorhub.core.benchmark --symbols 5000 --days 2500
+    python -m apps.factorhub.core.benchmark --per-factor   # 逐因子对比滚动窗口核
+    python -m apps.factorhub.core.benchmark --ic           # 逐日期 scipy 与向量化 IC
+
+逐股票方式在全量数据上耗时很长，默认只在 --baseline-symbols 只股票上计时，
+再按股票数线性外推（逐股票方式的耗时与股票数成正比）。
+"""
+
+import argparse
+import time
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .factor_analyzer import FactorAnalyzer
+from .factor_engine import FactorEngine
+from .factor_lib import FactorLibrary
+from .panel import MarketPanel
+
+# 逐因子计时的滚动窗口类因子
+ROLLING_FACTORS = [
+    "ma20",
+    "boll_upper",
+    "volatility_20",
+    "williams_r",
+    "atr",
+    "rsi",
+]
+
+TECHNICAL_FACTORS = [
+    "ma5",
+    "ma10",
+    "ma20",
+    "ma60",
+    "rsi",
+    "atr",
+    "volume_ratio",
+    "momentum_1m",
+    "momentum_3m",
+    "roc",
+    "williams_r",
+]
+
+
+def make_panel(n_symbols: int, n_days: int, seed: int = 0) -> MarketPanel:
+    """生成随机游走行情面板"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2010-01-04", periods=n_days)
+    symbols = [f"{i:06d}" for i in range(n_symbols)]
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, (n_days, n_symbols)), axis=0))
+    spread = np.abs(rng.normal(0, 0.01, (n_days, n_symbols)))
+    fields = {
+        "open": close * (1 + rng.normal(0, 0.005, (n_days, n_symbols))),
+        "high": close * (1 + spread),
+        "low": close * (1 - spread),
+        "close": close,
+        "volume": rng.integers(100000, 10000000, (n_days, n_symbols)).astype(float),
+    }
+    return MarketPanel(dates, symbols, fields)
+
+
+def run_per_symbol(data: pd.DataFrame, factor_names: List[str]) -> pd.DataFrame:
+    """逐股票、逐因子计算后按 (symbol, date) 合并"""
+    library = FactorLibrary()
+    result = data.copy()
+    for name in factor_names:
+        parts = []
+        for symbol, group in data.groupby("symbol"):
+            values = library.calculate_factor(name, group)
+            parts.append(pd.DataFrame({"symbol": symbol, "date": group["date"], name: values}))
+        result = result.merge(pd.concat(parts), on=["symbol", "date"], how="left")
+    return result
+
+
+def run_benchmark(
+    n_symbols: int = 5000,
+    n_days: int = 2500,
+    baseline_symbols: int = 200,
+    max_workers: int = 4,
+    executor: str = "thread",
+    processes: int = None,
+) -> Dict:
+    """
+    运行基准测试
+
+    Args:
+        n_symbols: 股票数
+        n_days: 交易日数
+        baseline_symbols: 逐股票方式实际计时的股票数，<=0 表示全量计时
+        max_workers: 引擎并行计算的因子数
+        executor: 引擎执行方式，thread 或 process
+        processes: process 模式的进程数
+    """
+    panel = make_panel(n_symbols, n_days)
+
+    engine = FactorEngine(
+        FactorLibrary(), max_workers=max_workers, executor=executor, processes=processes
+    )
+    started = time.perf_counter()
+    block = engine.compute(panel, TECHNICAL_FACTORS)
+    engine_seconds = time.perf_counter() - started
+
+    sample = n_symbols if baseline_symbols <= 0 else min(baseline_symbols, n_symbols)
+    sample_panel = MarketPanel(
+        panel.dates,
+        panel.symbols[:sample],
+        {name: values[:, :sample] for name, values in panel.fields.items()},
+    )
+    long_data = sample_panel.to_long()
+    started = time.perf_counter()
+    baseline = run_per_symbol(long_data, TECHNICAL_FACTORS)
+    baseline_seconds = (time.perf_counter() - started) * n_symbols / sample
+
+    # 校验两种方式结果一致
+    check = TECHNICAL_FACTORS[0]
+    expected = baseline[check].to_numpy().reshape(sample, n_days).T
+    max_diff = float(np.nanmax(np.abs(block[check][:, :sample] - expected)))
+
+    return {
+        "symbols": n_symbols,
+        "days": n_days,
+        "factors": len(TECHNICAL_FACTORS),
+        "engine_seconds": engine_seconds,
+        "per_symbol_seconds": baseline_seconds,
+        "per_symbol_extrapolated": sample < n_symbols,
+        "speedup": baseline_seconds / engine_seconds if engine_seconds > 0 else float("inf"),
+        "output_mb": block.values.nbytes / (1024 * 1024),
+        "max_abs_diff": max_diff,
+    }
+
+
+def run_factor_benchmark(
+    n_symbols: int = 5000,
+    n_days: int = 2500,
+    baseline_symbols: int = 200,
+    factor_names: List[str] = None,
+) -> List[Dict]:
+    """
+    逐因子计时：逐股票 pandas rolling 与面板滚动窗口核
+
+    Args:
+        n_symbols: 股票数
+        n_days: 交易日数
+        baseline_symbols: 逐股票方式实际计时的股票数，<=0 表示全量计时
+        factor_names: 参与计时的因子，默认 ROLLING_FACTORS
+    """
+    panel = make_panel(n_symbols, n_days)
+    sample = n_symbols if baseline_symbols <= 0 else min(baseline_symbols, n_symbols)
+    groups = [
+        group for _, group in panel.select(["high", "low", "close"]).to_long().groupby("symbol")
+    ]
+    groups = groups[:sample]
+    library = FactorLibrary()
+
+    rows = []
+    for name in factor_names or ROLLING_FACTORS:
+        factor = library.get_factor(name)
+
+        started = time.perf_counter()
+        factor.compute(panel.fields)
+        kernel_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for group in groups:
+            factor.calculate(group)
+        pandas_seconds = (time.perf_counter() - started) * n_symbols / sample
+
+        rows.append(
+            {
+                "factor": name,
+                "kernel_seconds": kernel_seconds,
+                "per_symbol_seconds": pandas_seconds,
+                "speedup": pandas_seconds / kernel_seconds if kernel_seconds > 0 else float("inf"),
+            }
+        )
+    return rows
+
+
+def run_per_date_ic(data: pd.DataFrame, factor_name: str, return_col: str, dates) -> List[float]:
+    """逐日期筛选长表后调用 stats.spearmanr（原 calculate_ic_analysis 的计算方式）"""
+    ics = []
+    for date in dates:
+        day = data[data["date"] == date].dropna(subset=[factor_name, return_col])
+        ic, _ = stats.spearmanr(day[factor_name], day[return_col])
+        ics.append(ic)
+    return ics
+
+
+def run_ic_benchmark(n_symbols: int = 5000, n_days: int = 2500, baseline_dates: int = 50) -> Dict:
+    """
+    IC 分析计时：逐日期 scipy 与面板上一次计算全部日期
+
+    Args:
+        n_symbols: 股票数
+        n_days: 交易日数
+        baseline_dates: 逐日期方式实际计时的日期数，按日期数线性外推
+    """
+    panel = make_panel(n_symbols, n_days)
+    rng = np.random.default_rng(1)
+    panel["factor"] = rng.normal(size=panel.shape)
+    panel["return_1d"] = np.full(panel.shape, np.nan)
+    panel["return_1d"][1:] = panel["close"][1:] / panel["close"][:-1] - 1
+
+    started = time.perf_counter()
+    result = FactorAnalyzer().calculate_ic_analysis(panel, "factor")
+    vectorized_seconds = time.perf_counter() - started
+
+    sample = min(baseline_dates, n_days - 1)
+    long_data = panel.select(["factor", "return_1d"]).to_long()
+    dates = panel.dates[1 : sample + 1]
+    started = time.perf_counter()
+    expected = run_per_date_ic(long_data, "factor", "return_1d", dates)
+    loop_seconds = (time.perf_counter() - started) * (n_days - 1) / sample
+
+    computed = [row["ic"] for row in result["ic_series"][:sample]]
+    return {
+        "symbols": n_symbols,
+        "days": n_days,
+        "vectorized_seconds": vectorized_seconds,
+        "per_date_seconds": loop_seconds,
+        "speedup": loop_seconds / vectorized_seconds if vectorized_seconds > 0 else float("inf"),
+        "max_abs_diff": float(np.max(np.abs(np.subtract(computed, expected)))),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="因子计算性能基准")
+    parser.add_argument("--symbols", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=2500)
+    parser.add_argument("--baseline-symbols", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--per-factor", action="store_true", help="逐因子对比滚动窗口核")
+    parser.add_argument("--ic", action="store_true", help="对比逐日期与向量化 IC 分析")
+    args = parser.parse_args(argv)
+
+    if args.ic:
+        result = run_ic_benchmark(args.symbols, args.days)
+        print(f"{result['symbols']} 只股票 × {result['days']} 天 IC 分析")
+        print(f"逐日期 scipy: {result['per_date_seconds']:.1f}s（外推）")
+        print(f"向量化: {result['vectorized_seconds']:.2f}s")
+        print(f"加速比: {result['speedup']:.1f}x，最大误差 {result['max_abs_diff']:.2e}")
+        return
+
+    if args.per_factor:
+        rows = run_factor_benchmark(args.symbols, args.days, args.baseline_symbols)
+        print(
+            f"{args.symbols} 只股票 × {args.days} 天，逐股票耗时按 {args.baseline_symbols} 只外推"
+        )
+        print(f"{'因子':<16}{'逐股票(s)':>12}{'面板核(s)':>12}{'加速比':>10}")
+        for row in rows:
+            print(
+                f"{row['factor']:<16}{row['per_symbol_seconds']:>12.2f}"
+                f"{row['kernel_seconds']:>12.3f}{row['speedup']:>9.1f}x"
+            )
+        return
+
+    result = run_benchmark(
+        args.symbols,
+        args.days,
+        args.baseline_symbols,
+        args.workers,
+        args.executor,
+        args.processes,
+    )
+    suffix = "（外推）" if result["per_symbol_extrapolated"] else ""
+    print(f"{result['symbols']} 只股票 × {result['days']} 天，{result['factors']} 个因子")
+    print(f"逐股票计算: {result['per_symbol_seconds']:.2f}s{suffix}")
+    print(f"FactorEngine({args.executor}): {result['engine_seconds']:.2f}s")
+    print(f"加速比: {result['speedup']:.1f}x")
+    print(f"输出块: {result['output_mb']:.0f} MB，最大误差 {result['max_abs_diff']:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,22 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 CACHE_DIR = DATA_DIR / "cache"
 CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
+# 列式行情存储目录
+BARS_DIR = CACHE_DIR / "bars"
+BARS_DIR.mkdir(parents=True, exist_ok=True)
+
+# 因子结果缓存目录
+FACTOR_CACHE_DIR = CACHE_DIR / "factors"
+FACTOR_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+# 未来收益面板缓存目录（与行情存储同级）
+FORWARD_RETURNS_DIR = CACHE_DIR / "forward_returns"
+FORWARD_RETURNS_DIR.mkdir(parents=True, exist_ok=True)
+
+# 增量因子分析状态目录
+ANALYSIS_STATE_DIR = CACHE_DIR / "analysis_state"
+ANALYSIS_STATE_DIR.mkdir(parents=True, exist_ok=True)
+
 # 因子目录
 FACTORS_DIR = DATA_DIR / "factors"
 FACTORS_DIR.mkdir(parents=True, exist_ok=True)
@@ -30,14 +46,29 @@ DEFAULT_CONFIG = {
         "default_pool": "hs300",
         "default_frequency": "daily",
         "default_adjust": "qfq",
+        "frame_cache_mb": 512,
+        "fetch_workers": 8,
+        "upstream_rate": 5.0,  # 每秒上游请求数
+        "upstream_burst": 5,
+        "fetch_lease": "redis",  # 跨进程拉取租约，设为 None 仅做进程内合并
     },
     "factor": {
         "default_window": 20,
         "max_workers": 4,
+        "executor": "thread",  # process: 面板放入共享内存，按股票分片交给进程池计算
+        "processes": None,  # 进程数，None 为 CPU 核数
+        "result_cache": True,  # API 计算因子时使用磁盘结果缓存
+        "result_cache_mb": 2048,
+        "store_chunk_rows": 200000,  # FactorStore 每个事务写入的行数
     },
     "analysis": {
         "ic_window": 252,
         "decile_n": 10,
+        "forward_horizons": [1, 5, 10, 20],  # 未来收益面板与 IC 矩阵的默认持有期（交易日）
+        "forward_cache": True,  # 未来收益面板使用磁盘缓存
+        "forward_cache_mb": 1024,
+        "ic_batch_mb": 256,  # IC 矩阵每批日期的中间数组内存上限
+        "rank_cache_mb": 256,  # 截面排名、分位数分组的进程内缓存
     },
     "backtest": {
         "initial_capital": 1000000,
@@ -2,63 +2,113 @@
 AKShare数据获取模块
 """
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from pathlib import Path
 from typing import Dict, List, Optional
 
 import akshare as ak
+import numpy as np
 import pandas as pd
 
-from .config import CACHE_DIR
-from .helpers import load_from_cache, normalize_stock_code, save_to_cache
+from .bar_store import VALUATION_ADJUST, VALUATION_SCHEMA, BarStore
+from .config import CACHE_DIR, DEFAULT_CONFIG
+from .frame_cache import FrameCache, get_frame_cache
+from .helpers import normalize_stock_code
 from .logger import logger
+from .panel import MarketPanel
+from .singleflight import SingleFlight, get_singleflight
+from .throttle import TokenBucket, get_upstream_limiter
+from .trading_calendar import TradingCalendar, get_trading_calendar
+
+# get_daily_data 返回的列（outstanding_share 仅落盘，不对外返回）
+DAILY_COLUMNS = [
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "amount",
+    "turnover",
+    "pct_change",
+    "change",
+    "return_1d",
+    "return_5d",
+]
+
+# 派生列（pct_change/change/return_1d/return_5d）所需的最长回看行数
+DERIVED_LOOKBACK = 5
+
+# ak.stock_value_em 的列 -> 估值存储列
+VALUATION_COLUMNS = {
+    "数据日期": "date",
+    "PE(TTM)": "pe",
+    "PE(静)": "pe_static",
+    "市净率": "pb",
+    "市销率": "ps",
+    "市现率": "pcf",
+    "总市值": "market_cap",
+    "流通市值": "float_market_cap",
+}
+
+# 面板可加入的估值字段
+VALUATION_FIELDS = [c for c in VALUATION_SCHEMA if c != "date"]
 
 
 class AKShareDataProvider:
     """AKShare数据提供者"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        cache_dir: Path = None,
+        frame_cache: FrameCache = None,
+        rate_limiter: TokenBucket = None,
+        singleflight: SingleFlight = None,
+        calendar: TradingCalendar = None,
+    ):
         self.logger = logger
         self.cache_enabled = True
         self.default_cache_max_age_days = 7
-        self.max_missing_days = 3  # 最大容忍缺失天数，超过则获取新数据
+        self.max_missing_days = 3  # 最大容忍缺失交易日数，超过则获取新数据
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else CACHE_DIR
+        self.store = BarStore(self.cache_dir / "bars")
+        self.valuation_store = BarStore(self.cache_dir / "valuation", schema=VALUATION_SCHEMA)
+        self.frame_cache = frame_cache if frame_cache is not None else get_frame_cache()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_upstream_limiter()
+        self.singleflight = singleflight if singleflight is not None else get_singleflight()
+        self.fetch_workers = DEFAULT_CONFIG["data"]["fetch_workers"]
+        self.calendar = calendar if calendar is not None else get_trading_calendar()
 
     def clear_cache(self, older_than_days: int = None):
-        """清理缓存文件"""
+        """清理缓存分区"""
         if older_than_days is None:
             older_than_days = self.default_cache_max_age_days
 
-        if not CACHE_DIR.exists():
-            return
-
-        cache_files = list(CACHE_DIR.glob("daily_*"))  # Files without .pkl extension
         cleaned_count = 0
-
-        for cache_file in cache_files:
+        for meta in list(self.store.partitions()):
+            symbol, adjust = meta["symbol"], meta["adjust"]
             try:
-                file_age_days = (
-                    datetime.now() - datetime.fromtimestamp(cache_file.stat().st_mtime)
-                ).days
-                if file_age_days > older_than_days:
-                    cache_file.unlink()
+                age_days = (datetime.now() - datetime.fromtimestamp(meta["updated_at"])).days
+                if age_days > older_than_days:
+                    self.store.delete(symbol, adjust)
                     cleaned_count += 1
             except Exception as e:
-                self.logger.warning(f"删除缓存文件失败 {cache_file.name}: {str(e)}")
+                self.logger.warning(f"删除缓存分区失败 {symbol}_{adjust}: {str(e)}")
 
         if cleaned_count > 0:
-            self.logger.info(f"清理了 {cleaned_count} 个过期缓存文件")
+            self.logger.info(f"清理了 {cleaned_count} 个过期缓存分区")
 
     def get_cache_info(self) -> Dict:
-        """获取缓存信息"""
-        if not CACHE_DIR.exists():
-            return {"total_files": 0, "total_size_mb": 0}
-
-        cache_files = list(CACHE_DIR.glob("daily_*"))  # Files without .pkl extension
-        total_size = sum(f.stat().st_size for f in cache_files if f.exists())
+        """获取缓存信息（仅读取缓存清单）"""
+        partitions = list(self.store.partitions())
+        total_size = sum(m["bytes"] for m in partitions)
 
         return {
-            "total_files": len(cache_files),
+            "total_files": len(partitions),
+            "total_rows": sum(m["rows"] for m in partitions),
             "total_size_mb": total_size / (1024 * 1024),
-            "cache_dir": str(CACHE_DIR),
+            "cache_dir": str(self.store.root),
+            "frame_cache": self.frame_cache.stats(),
         }
 
     def get_stock_list(self, market: str = "all") -> pd.DataFrame:
@@ -364,167 +414,313 @@ class AKShareDataProvider:
             start_dt = pd.to_datetime(start_date)
             end_dt = pd.to_datetime(end_date)
 
-            # 查找可用的缓存文件（优先使用完全匹配，否则选择重叠最多的）
-            if self.cache_enabled:
-                cache_files = list(CACHE_DIR.glob(f"daily_{symbol}_*_{adjust}"))
-                cached_df = None
-                best_cache_file = None
-                best_overlap = 0
-
-                for cache_file in cache_files:
-                    try:
-                        temp_df = load_from_cache(cache_file.name, str(CACHE_DIR))
-                        if temp_df is not None and not temp_df.empty:
-                            # 检查缓存日期范围
-                            cache_dates = pd.to_datetime(temp_df["date"])
-                            cache_start = cache_dates.min()
-                            cache_end = cache_dates.max()
-
-                            # 如果缓存完全覆盖请求范围，直接使用
-                            if cache_start <= start_dt and cache_end >= end_dt:
-                                self.logger.debug(f"使用完全匹配缓存 {symbol}: {cache_file.name}")
-                                return temp_df.copy()
-
-                            # 计算与请求范围的重叠
-                            overlap_start = max(cache_start, start_dt)
-                            overlap_end = min(cache_end, end_dt)
-                            overlap_days = (
-                                (overlap_end - overlap_start).days + 1
-                                if overlap_end >= overlap_start
-                                else 0
-                            )
-
-                            # 优先选择重叠最多的缓存
-                            if overlap_days > best_overlap:
-                                best_overlap = overlap_days
-                                cached_df = temp_df.copy()
-                                best_cache_file = cache_file
-                    except Exception as e:
-                        self.logger.warning(f"加载缓存文件失败 {cache_file.name}: {str(e)[:50]}")
-
-                # 如果有缓存数据，获取缺失的部分并合并
-                if cached_df is not None and not cached_df.empty:
-                    cached_dates = pd.to_datetime(cached_df["date"])
-                    cache_start = cached_dates.min()
-                    cache_end = cached_dates.max()
-
-                    # 计算缺失天数
-                    missing_before = (cache_start - start_dt).days if cache_start > start_dt else 0
-                    missing_after = (end_dt - cache_end).days if cache_end < end_dt else 0
-                    total_missing = missing_before + missing_after
-
-                    # 如果缺失天数在容忍范围内，直接返回缓存数据
-                    if total_missing <= self.max_missing_days:
-                        self.logger.debug(f"使用缓存 {symbol}: 缺失{total_missing}天，在容忍范围内")
-                        result = cached_df[
-                            (cached_df["date"] >= start_dt) & (cached_df["date"] <= end_dt)
-                        ]
-                        return result.copy()
-
-                    # 缺失天数超过容忍范围，需要获取新数据
-                    new_data_needed = False
-                    fetch_start = start_dt
-                    fetch_end = end_dt
-
-                    if cache_start > start_dt:
-                        fetch_start = cache_start
-                        new_data_needed = True
-                    if cache_end < end_dt:
-                        fetch_end = cache_end
-                        new_data_needed = True
-
-                    if new_data_needed:
-                        self.logger.debug(
-                            f"缓存部分命中 {symbol}: 缓存[{cache_start.date()}-{cache_end.date()}], 缺失{total_missing}天"
-                        )
-                        # 获取缺失的数据
-                        missing_df = self._fetch_and_process(
-                            symbol,
-                            fetch_start.strftime("%Y-%m-%d"),
-                            fetch_end.strftime("%Y-%m-%d"),
-                            adjust,
-                        )
-
-                        if not missing_df.empty:
-                            # 合并缓存和新数据
-                            merged_df = pd.concat([cached_df, missing_df], ignore_index=True)
-                            # 去重并按日期排序
-                            merged_df = merged_df.drop_duplicates(subset=["symbol", "date"])
-                            merged_df["date"] = pd.to_datetime(merged_df["date"])
-                            merged_df = merged_df.sort_values("date").reset_index(drop=True)
-
-                            # 更新缓存
-                            cache_key = f"daily_{symbol}_{merged_df['date'].min().strftime('%Y-%m-%d')}_{merged_df['date'].max().strftime('%Y-%m-%d')}_{adjust}"
-                            save_to_cache(merged_df, cache_key, str(CACHE_DIR))
-
-                            # 返回请求范围内的数据
-                            result = merged_df[
-                                (merged_df["date"] >= start_dt) & (merged_df["date"] <= end_dt)
-                            ]
-                            return result
-                    else:
-                        # 缓存已覆盖全部范围
-                        return cached_df.copy()
-
-            # 没有缓存或需要获取新数据
-            result = self._fetch_and_process(symbol, start_date, end_date, adjust)
-            # 标记进行了网络请求
-            if result is not None and not result.empty:
+            if not self.cache_enabled:
+                result = self._fetch_and_process(symbol, start_date, end_date, adjust)
+                return result.drop(columns=["outstanding_share"], errors="ignore")
+
+            sync = {"network": False, "error": None}
+            if self._missing_days(symbol, adjust, start_dt, end_dt) > self.max_missing_days:
+                # 相同 (symbol, adjust, 区间) 的并发请求只拉取一次
+                key = (symbol, adjust, start_dt.strftime("%Y-%m-%d"), end_dt.strftime("%Y-%m-%d"))
+                sync = self.singleflight.do(
+                    key, lambda: self._sync_cache(symbol, adjust, start_dt, end_dt)
+                )
+
+            result = self._read_cached(symbol, adjust, start_dt, end_dt)
+            if result.empty and sync["error"]:
+                result.attrs["error"] = sync["error"]
+            elif sync["network"] and not result.empty:
+                # 标记进行了网络请求
                 result.attrs["network_requested"] = True
             return result
 
         except Exception as e:
             self.logger.error(f"获取 {symbol} 数据失败: {str(e)}")
+            result = pd.DataFrame()
+            result.attrs["error"] = str(e)
+            return result
+
+    def _missing_days(self, symbol: str, adjust: str, start_dt, end_dt) -> float:
+        """根据缓存清单计算请求区间缺失的交易日数，无缓存返回inf"""
+        meta = self.store.info(symbol, adjust)
+        if meta is None:
+            return float("inf")
+        return sum(self._missing_ranges(meta, start_dt, end_dt))
+
+    def _missing_ranges(self, meta: Dict, start_dt, end_dt):
+        """缓存覆盖范围之前、之后缺失的交易日数"""
+        cache_start = pd.Timestamp(meta["start"])
+        cache_end = pd.Timestamp(meta["end"])
+        missing_before = 0
+        if cache_start > start_dt:
+            missing_before = self.calendar.count(start_dt, cache_start - pd.Timedelta(days=1))
+        missing_after = 0
+        if cache_end < end_dt:
+            missing_after = self.calendar.count(cache_end + pd.Timedelta(days=1), end_dt)
+        return missing_before, missing_after
+
+    def _sync_cache(
+        self, symbol: str, adjust: str, start_dt, end_dt, tolerance: int = None
+    ) -> Dict:
+        """
+        从上游补齐缓存中缺失的区间
+
+        只拉取缺失的前缀/后缀：后缀直接追加到分区，前缀与原数据合并后重写分区；
+        两种情况都只重算边界处受影响行的派生列。
+        执行前重新检查清单：等待期间其他线程或进程可能已经完成了拉取。
+
+        Args:
+            tolerance: 可容忍的缺失交易日数，默认 max_missing_days
+        """
+        if tolerance is None:
+            tolerance = self.max_missing_days
+        sync = {"network": False, "error": None, "rows": 0}
+        meta = self.store.info(symbol, adjust)
+        if meta is None:
+            meta = self._import_legacy_cache(symbol, adjust)
+
+        if meta is None:
+            # 没有缓存，获取新数据
+            df = self._fetch_and_process(
+                symbol, start_dt.strftime("%Y-%m-%d"), end_dt.strftime("%Y-%m-%d"), adjust
+            )
+            if df.empty:
+                sync["error"] = df.attrs.get("error")
+            else:
+                self.store.write(symbol, adjust, df)
+                sync["network"] = True
+                sync["rows"] = len(df)
+            return sync
+
+        missing_before, missing_after = self._missing_ranges(meta, start_dt, end_dt)
+        total_missing = missing_before + missing_after
+        if total_missing <= tolerance:
+            self.logger.debug(f"使用缓存 {symbol}: 缺失{total_missing}个交易日，在容忍范围内")
+            return sync
+
+        cache_start = pd.Timestamp(meta["start"])
+        cache_end = pd.Timestamp(meta["end"])
+        self.logger.debug(
+            f"缓存部分命中 {symbol}: 缓存[{cache_start.date()}-{cache_end.date()}], 缺失{total_missing}个交易日"
+        )
+        if missing_after:
+            # 向后补齐：以已缓存的最后几根收盘价为上下文，只追加缺失的尾部
+            fetch_start = cache_end + pd.Timedelta(days=1)
+            context = self.store.tail(symbol, adjust, DERIVED_LOOKBACK, columns=["close"])
+            tail_df = self._fetch_and_process(
+                symbol,
+                fetch_start.strftime("%Y-%m-%d"),
+                end_dt.strftime("%Y-%m-%d"),
+                adjust,
+                context_close=context["close"].to_numpy(),
+            )
+            if not tail_df.empty:
+                self.store.append(symbol, adjust, tail_df)
+                sync["network"] = True
+                sync["rows"] += len(tail_df)
+            elif tail_df.attrs.get("error"):
+                sync["error"] = tail_df.attrs["error"]
+        if missing_before:
+            # 向前补齐：列文件只能追加，分区需要重写；原数据只有开头几行的派生列需要重算
+            fetch_end = cache_start - pd.Timedelta(days=1)
+            head_df = self._fetch_and_process(
+                symbol, start_dt.strftime("%Y-%m-%d"), fetch_end.strftime("%Y-%m-%d"), adjust
+            )
+            if not head_df.empty:
+
+                def prepend(cached_df: pd.DataFrame) -> pd.DataFrame:
+                    # 在分区写锁内重新读取原数据，拉取期间追加的尾部不会被覆盖
+                    if cached_df.empty:
+                        return head_df
+                    head = head_df[pd.to_datetime(head_df["date"]) < cached_df["date"].iloc[0]]
+                    if head.empty:
+                        return None
+                    boundary = self._derive_columns(
+                        cached_df.iloc[:DERIVED_LOOKBACK].copy(),
+                        head["close"].to_numpy()[-DERIVED_LOOKBACK:],
+                    )
+                    return pd.concat([head, boundary, cached_df.iloc[DERIVED_LOOKBACK:]])
+
+                self.store.rewrite(symbol, adjust, prepend)
+                sync["network"] = True
+                sync["rows"] += len(head_df)
+            elif head_df.attrs.get("error") and sync["error"] is None:
+                sync["error"] = head_df.attrs["error"]
+        return sync
+
+    def update_daily_data(
+        self,
+        symbols: List[str] = None,
+        end_date: str = None,
+        adjust: str = "qfq",
+        max_workers: int = None,
+    ) -> Dict:
+        """
+        增量刷新已缓存股票的日线数据（如每日收盘后运行）
+
+        每只股票只拉取缓存最后日期之后的数据并追加到分区。
+
+        Args:
+            symbols: 股票代码列表，默认刷新该复权类型下所有已缓存的股票
+            end_date: 刷新截止日期，默认今天
+            adjust: 复权类型
+            max_workers: 并发数，默认取配置 fetch_workers
+        """
+        end_dt = pd.to_datetime(end_date) if end_date else pd.Timestamp.today().normalize()
+        if symbols is None:
+            symbols = [m["symbol"] for m in self.store.partitions() if m["adjust"] == adjust]
+        symbols = [normalize_stock_code(s) for s in symbols]
+
+        def refresh(symbol: str) -> Dict:
+            meta = self.store.info(symbol, adjust)
+            if meta is None:
+                return {"network": False, "error": "无缓存", "rows": 0}
+            start_dt = pd.Timestamp(meta["start"])
+            key = (symbol, adjust, meta["start"], end_dt.strftime("%Y-%m-%d"))
+            return self.singleflight.do(
+                key, lambda: self._sync_cache(symbol, adjust, start_dt, end_dt, tolerance=0)
+            )
+
+        summary = {"symbols": len(symbols), "updated": 0, "rows_appended": 0, "failed": []}
+        if not symbols:
+            return summary
+
+        workers = max(1, min(max_workers or self.fetch_workers, len(symbols)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for symbol, sync in zip(symbols, executor.map(refresh, symbols)):
+                if sync["rows"]:
+                    summary["updated"] += 1
+                    summary["rows_appended"] += sync["rows"]
+                if sync["error"]:
+                    summary["failed"].append({"symbol": symbol, "error": sync["error"]})
+
+        self.logger.info(
+            f"增量刷新 {summary['symbols']} 只股票，更新 {summary['updated']} 只，"
+            f"追加 {summary['rows_appended']} 行"
+        )
+        return summary
+
+    def _read_cached(self, symbol: str, adjust: str, start_dt, end_dt) -> pd.DataFrame:
+        """读取指定区间，优先命中内存数据帧缓存，未命中时从列式存储加载整个分区"""
+        meta = self.store.info(symbol, adjust)
+        if meta is None:
             return pd.DataFrame()
 
+        key = (self.store.root, symbol, adjust)
+        version = (meta["generation"], meta["rows"], meta["checksum"])
+        frame = self.frame_cache.get(key, version)
+        if frame is None:
+            frame = self.store.read(symbol, adjust, columns=DAILY_COLUMNS)
+            if frame.empty:
+                return frame
+            self.frame_cache.put(key, version, frame)
+
+        dates = frame["date"].values
+        lo = dates.searchsorted(pd.Timestamp(start_dt).to_datetime64(), side="left")
+        hi = dates.searchsorted(pd.Timestamp(end_dt).to_datetime64(), side="right")
+        # 返回副本，避免调用方修改缓存中的数据
+        result = frame.iloc[lo:hi].copy()
+        result.index = pd.RangeIndex(len(result))
+        return result
+
+    def _import_legacy_cache(self, symbol: str, adjust: str) -> Optional[Dict]:
+        """将旧版按区间保存的pickle缓存合并导入列式存储，导入后删除旧文件"""
+        legacy_files = list(self.cache_dir.glob(f"daily_{symbol}_*_{adjust}"))
+        if not legacy_files:
+            return None
+
+        frames = []
+        for legacy_file in legacy_files:
+            try:
+                frames.append(pd.read_pickle(legacy_file))
+            except Exception as e:
+                self.logger.warning(f"加载旧缓存文件失败 {legacy_file.name}: {str(e)[:50]}")
+        frames = [f for f in frames if f is not None and not f.empty]
+        if not frames:
+            return None
+
+        meta = self.store.write(symbol, adjust, pd.concat(frames, ignore_index=True))
+        for legacy_file in legacy_files:
+            legacy_file.unlink(missing_ok=True)
+        self.logger.info(f"导入旧缓存 {symbol}_{adjust}: {len(legacy_files)} 个文件")
+        return meta
+
     def _fetch_and_process(
-        self, symbol: str, start_date: str, end_date: str, adjust: str
+        self,
+        symbol: str,
+        start_date: str,
+        end_date: str,
+        adjust: str,
+        context_close=None,
     ) -> pd.DataFrame:
-        """获取并处理股票数据"""
+        """
+        获取并处理股票数据
+
+        Args:
+            context_close: 区间之前已缓存的收盘价（按日期升序），用于计算区间开头几行的派生列
+        """
         try:
             suffix = "SZ" if symbol.startswith(("0", "3")) else "SH"
             full_symbol = suffix.lower() + symbol
+            start_dt = pd.to_datetime(start_date)
+            end_dt = pd.to_datetime(end_date)
 
-            df = ak.stock_zh_a_daily(symbol=full_symbol)
+            # 只请求所需区间
+            self.rate_limiter.acquire()
+            df = ak.stock_zh_a_daily(
+                symbol=full_symbol,
+                start_date=start_dt.strftime("%Y%m%d"),
+                end_date=end_dt.strftime("%Y%m%d"),
+            )
 
             if df.empty:
                 return pd.DataFrame()
 
             # 过滤日期范围
             df["date"] = pd.to_datetime(df["date"])
-            start_dt = pd.to_datetime(start_date)
-            end_dt = pd.to_datetime(end_date)
-            df = df[(df["date"] >= start_dt) & (df["date"] <= end_dt)]
+            df = df[(df["date"] >= start_dt) & (df["date"] <= end_dt)].copy()
 
             if df.empty:
                 return pd.DataFrame()
 
-            # 计算涨跌幅
-            df["pct_change"] = df["close"].pct_change() * 100
-            df["change"] = df["close"].diff()
+            # 计算涨跌幅与收益率
+            df = self._derive_columns(df.reset_index(drop=True), context_close)
 
             # 添加symbol列
             df["symbol"] = symbol
 
-            # 移除无法JSON序列化的字段
-            if "outstanding_share" in df.columns:
-                df = df.drop(columns=["outstanding_share"])
-
-            # 计算收益率
-            df["return_1d"] = df["close"].pct_change()
-            df["return_5d"] = df["close"].pct_change(5)
-
-            # 保存缓存
-            if self.cache_enabled:
-                cache_key = f"daily_{symbol}_{df['date'].min().strftime('%Y-%m-%d')}_{df['date'].max().strftime('%Y-%m-%d')}_{adjust}"
-                save_to_cache(df, cache_key, str(CACHE_DIR))
-
             self.logger.debug(f"获取 {symbol} {len(df)} 条数据")
             return df
 
         except Exception as e:
             self.logger.error(f"获取 {symbol} 数据失败: {str(e)}")
-            return pd.DataFrame()
+            result = pd.DataFrame()
+            result.attrs["error"] = str(e)
+            return result
+
+    @staticmethod
+    def _derive_columns(df: pd.DataFrame, context_close=None) -> pd.DataFrame:
+        """
+        计算派生列 pct_change/change/return_1d/return_5d
+
+        Args:
+            context_close: df 之前的收盘价（按日期升序），提供时 df 开头几行按完整历史计算
+        """
+        close = df["close"].astype(float).reset_index(drop=True)
+        n_context = 0
+        if context_close is not None and len(context_close) > 0:
+            n_context = len(context_close)
+            close = pd.concat([pd.Series(context_close, dtype=float), close], ignore_index=True)
+
+        derived = {
+            "pct_change": close.pct_change() * 100,
+            "change": close.diff(),
+            "return_1d": close.pct_change(),
+            "return_5d": close.pct_change(5),
+        }
+        for column, values in derived.items():
+            df[column] = values.to_numpy()[n_context:]
+        return df
 
     def get_multiple_stocks_data(
         self,
@@ -533,28 +729,115 @@ class AKShareDataProvider:
         end_date: str,
         adjust: str = "qfq",
         progress_callback=None,
+        max_workers: int = None,
     ) -> pd.DataFrame:
-        """获取多只股票数据"""
-        all_data = []
+        """
+        获取多只股票数据
 
-        for i, symbol in enumerate(symbols):
-            try:
-                df = self.get_daily_data(symbol, start_date, end_date, adjust)
-                if not df.empty:
-                    all_data.append(df)
+        Args:
+            symbols: 股票代码列表
+            start_date: 开始日期 YYYY-MM-DD
+            end_date: 结束日期 YYYY-MM-DD
+            adjust: 复权类型
+            progress_callback: 进度回调 callback(progress, symbol)
+            max_workers: 并发数，默认取配置 fetch_workers，1 表示顺序获取
 
-                if progress_callback:
-                    progress = (i + 1) / len(symbols)
-                    progress_callback(progress, symbol)
+        结果按 symbols 顺序拼接；获取失败的股票记录在 attrs["failed_symbols"] 中，
+        不影响其他股票。上游请求速率由 rate_limiter 统一限制。
+        """
+        if max_workers is None:
+            max_workers = self.fetch_workers
+        max_workers = max(1, min(max_workers, len(symbols)))
 
-            except Exception as e:
-                self.logger.warning(f"获取 {symbol} 数据失败: {str(e)}")
-                if progress_callback:
-                    progress_callback((i + 1) / len(symbols), symbol)
+        results: List[Optional[pd.DataFrame]] = [None] * len(symbols)
+        failures: Dict[int, Dict] = {}
+        completed = 0
 
-        if all_data:
-            return pd.concat(all_data, ignore_index=True)
-        return pd.DataFrame()
+        def fetch(symbol: str) -> pd.DataFrame:
+            return self.get_daily_data(symbol, start_date, end_date, adjust)
+
+        def collect(i: int, symbol: str, df: Optional[pd.DataFrame], error: str = None):
+            if df is not None and not df.empty:
+                results[i] = df
+            else:
+                if error is None:
+                    error = df.attrs.get("error", "获取数据为空") if df is not None else "未知错误"
+                self.logger.warning(f"获取 {symbol} 数据失败: {error}")
+                failures[i] = {"symbol": symbol, "error": error}
+            if progress_callback:
+                progress_callback(completed / len(symbols), symbol)
+
+        if max_workers == 1:
+            for i, symbol in enumerate(symbols):
+                try:
+                    df, error = fetch(symbol), None
+                except Exception as e:
+                    df, error = None, str(e)
+                completed += 1
+                collect(i, symbol, df, error)
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(fetch, symbol): (i, symbol) for i, symbol in enumerate(symbols)
+                }
+                for future in as_completed(futures):
+                    i, symbol = futures[future]
+                    try:
+                        df, error = future.result(), None
+                    except Exception as e:
+                        df, error = None, str(e)
+                    completed += 1
+                    collect(i, symbol, df, error)
+
+        all_data = [df for df in results if df is not None]
+        result = pd.concat(all_data, ignore_index=True) if all_data else pd.DataFrame()
+        result.attrs["failed_symbols"] = [failures[i] for i in sorted(failures)]
+        return result
+
+    def get_panel(
+        self,
+        symbols: List[str],
+        start_date: str,
+        end_date: str,
+        adjust: str = "qfq",
+        fields: List[str] = None,
+        progress_callback=None,
+        max_workers: int = None,
+        valuation: bool = False,
+    ) -> MarketPanel:
+        """
+        获取多只股票数据并对齐为 日期 × 股票 面板
+
+        参数同 get_multiple_stocks_data；fields 为纳入面板的行情字段，默认全部。
+        valuation 为 True 时同时加入估值字段（见 add_valuation）。
+        获取失败的股票记录在 panel.attrs["failed_symbols"] 中；全部分区都在缓存中时，
+        各分区的存储版本记录在 panel.attrs["data_version"]，取自存储的字段记录在
+        panel.attrs["stored_fields"]。
+        """
+        data = self.get_multiple_stocks_data(
+            symbols,
+            start_date,
+            end_date,
+            adjust=adjust,
+            progress_callback=progress_callback,
+            max_workers=max_workers,
+        )
+        panel = MarketPanel.from_long(data, fields)
+        panel.attrs["failed_symbols"] = data.attrs.get("failed_symbols", [])
+        panel.attrs["adjust"] = adjust
+        # 各分区的存储版本，作为因子结果缓存的数据指纹；有分区不在缓存中时不设置
+        version = {}
+        for symbol in panel.symbols:
+            meta = self.store.info(symbol, adjust)
+            if meta is None:
+                break
+            version[symbol] = f"{meta['generation']}:{meta['rows']}:{meta['checksum']}"
+        else:
+            panel.attrs["data_version"] = version
+            panel.attrs["stored_fields"] = frozenset(panel.fields)
+        if valuation:
+            self.add_valuation(panel, max_workers=max_workers)
+        return panel
 
     def get_market_index(self, index_code: str = "000300") -> pd.DataFrame:
         """获取市场指数数据"""
@@ -586,14 +869,153 @@ class AKShareDataProvider:
             self.logger.error(f"获取指数 {index_code} 失败: {str(e)}")
             return pd.DataFrame()
 
-    def get_factor_data(self, symbol: str) -> Optional[pd.DataFrame]:
-        """获取技术指标数据"""
+    def _fetch_valuation(self, symbol: str) -> pd.DataFrame:
+        """从上游获取单只股票的全部历史估值指标"""
         try:
-            suffix = ".SZ" if symbol.startswith(("0", "3")) else ".SH"
-            full_symbol = symbol + suffix
-
-            df = ak.stock_zh_a_indicator(symbol=full_symbol)
+            self.rate_limiter.acquire()
+            df = ak.stock_value_em(symbol=symbol)
+            if df is None or df.empty:
+                return pd.DataFrame()
+            df = df.rename(columns=VALUATION_COLUMNS)[list(VALUATION_COLUMNS.values())]
+            df["date"] = pd.to_datetime(df["date"])
             return df
+        except Exception as e:
+            self.logger.error(f"获取 {symbol} 估值数据失败: {str(e)}")
+            result = pd.DataFrame()
+            result.attrs["error"] = str(e)
+            return result
+
+    def _sync_valuation(self, symbol: str, end_dt, tolerance: int = None) -> Dict:
+        """
+        补齐估值分区到 end_dt
+
+        上游每次返回全部历史，只追加晚于分区最后日期的快照：已入库日期的值不会被
+        上游之后的修订覆盖，保持入库时点可见的数据。
+        """
+        if tolerance is None:
+            tolerance = self.max_missing_days
+        sync = {"network": False, "error": None, "rows": 0}
+        meta = self.valuation_store.info(symbol, VALUATION_ADJUST)
+        if meta is not None:
+            cache_end = pd.Timestamp(meta["end"])
+            if self.calendar.count(cache_end + pd.Timedelta(days=1), end_dt) <= tolerance:
+                return sync
+
+        df = self._fetch_valuation(symbol)
+        if df.empty:
+            sync["error"] = df.attrs.get("error", "估值数据为空")
+            return sync
+        sync["network"] = True
+        new_meta = self.valuation_store.append(symbol, VALUATION_ADJUST, df)
+        sync["rows"] = new_meta["rows"] - (meta["rows"] if meta else 0)
+        return sync
+
+    def update_valuation_data(
+        self, symbols: List[str], end_date: str = None, max_workers: int = None
+    ) -> Dict:
+        """
+        批量补齐估值指标快照（pe、pb、ps、pcf、市值）到列式存储
+
+        Args:
+            symbols: 股票代码列表
+            end_date: 截止日期，默认今天；分区缺失不超过 max_missing_days 个交易日的不请求
+            max_workers: 并发数，默认取配置 fetch_workers
+        """
+        end_dt = pd.to_datetime(end_date) if end_date else pd.Timestamp.today().normalize()
+        symbols = [normalize_stock_code(s) for s in symbols]
+
+        def refresh(symbol: str) -> Dict:
+            key = ("valuation", symbol, end_dt.strftime("%Y-%m-%d"))
+            return self.singleflight.do(key, lambda: self._sync_valuation(symbol, end_dt))
+
+        summary = {"symbols": len(symbols), "updated": 0, "rows_appended": 0, "failed": []}
+        if not symbols:
+            return summary
+
+        workers = max(1, min(max_workers or self.fetch_workers, len(symbols)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for symbol, sync in zip(symbols, executor.map(refresh, symbols)):
+                if sync["rows"]:
+                    summary["updated"] += 1
+                    summary["rows_appended"] += sync["rows"]
+                if sync["error"]:
+                    summary["failed"].append({"symbol": symbol, "error": sync["error"]})
+
+        self.logger.info(
+            f"估值数据刷新 {summary['symbols']} 只股票，更新 {summary['updated']} 只，"
+            f"追加 {summary['rows_appended']} 行"
+        )
+        return summary
+
+    def add_valuation(
+        self,
+        panel: MarketPanel,
+        fields: List[str] = None,
+        sync: bool = True,
+        max_workers: int = None,
+    ) -> MarketPanel:
+        """
+        将估值字段对齐到面板的交易日后加入面板
+
+        每个交易日取当日及之前最近一次快照（向前填充），不使用之后的数据。
+
+        Args:
+            panel: 行情面板
+            fields: 估值字段，默认 VALUATION_FIELDS
+            sync: 是否先批量补齐估值分区
+            max_workers: 补齐时的并发数
+        """
+        fields = [f for f in (fields or VALUATION_FIELDS) if f in VALUATION_FIELDS]
+        if panel.empty or not fields:
+            return panel
+        if sync:
+            self.update_valuation_data(
+                list(panel.symbols), panel.dates[-1].strftime("%Y-%m-%d"), max_workers
+            )
+
+        arrays = {field: np.full(panel.shape, np.nan) for field in fields}
+        # 新建版本字典：原字典可能被调用方或帧缓存持有，不能原地追加
+        bar_version = panel.attrs.get("data_version")
+        version = None if bar_version is None else {}
+        for j, symbol in enumerate(panel.symbols):
+            meta = self.valuation_store.info(symbol, VALUATION_ADJUST)
+            if meta is None:
+                version = None
+                continue
+            if version is not None:
+                version[symbol] = (
+                    f"{bar_version[symbol].split('|')[0]}"
+                    f"|{meta['generation']}:{meta['rows']}:{meta['checksum']}"
+                )
+            df = self.valuation_store.read(
+                symbol, VALUATION_ADJUST, end_date=panel.dates[-1], columns=fields
+            )
+            if df.empty:
+                continue
+            rows = np.searchsorted(df["date"].values, panel.dates.values, side="right") - 1
+            known = rows >= 0
+            for field in fields:
+                arrays[field][known, j] = df[field].to_numpy()[rows[known]]
+
+        for field, values in arrays.items():
+            panel[field] = values
+        if version is None:
+            panel.attrs.pop("data_version", None)
+            panel.attrs.pop("stored_fields", None)
+        else:
+            panel.attrs["data_version"] = version
+            panel.attrs["stored_fields"] = panel.attrs.get("stored_fields", frozenset()) | set(
+                fields
+            )
+        return panel
+
+    def get_factor_data(self, symbol: str) -> Optional[pd.DataFrame]:
+        """获取估值指标数据（pe、pb、ps、pcf、市值），优先读取列式存储"""
+        try:
+            symbol = normalize_stock_code(symbol)
+            self._sync_valuation(symbol, pd.Timestamp.today().normalize())
+            df = self.valuation_store.read(symbol, VALUATION_ADJUST)
+            return df if not df.empty else None
 
         except Exception as e:
             self.logger.error(f"获取 {symbol} 指标数据失败: {str(e)}")
@@ -0,0 +1,308 @@
+"""
+因子表达式
+
+研究员用表达式描述候选因子，无需修改因子库，例如：
+    rank(ts_mean(close, 5) / ts_mean(close, 20))
+    -delta(close, 5) / ts_std(close, 20)
+    zscore(decay_linear(volume / ts_mean(volume, 20), 10))
+
+表达式解析为 factor_graph 的节点树：解析时折叠常量子表达式，可交换运算的输入按固定顺序
+排列，结构相同的子表达式是同一个节点（公共子表达式消除）。一批表达式合并为一张计算图，
+在面板数组上按拓扑序执行，每个中间结果只计算一次。
+
+时序函数（沿日期，窗口为正整数常量）:
+    ts_mean ts_std ts_sum ts_max ts_min ts_rank delay delta decay_linear
+截面函数（沿股票，每个日期独立）:
+    rank zscore demean
+其他函数:
+    abs log sign sqrt max min
+标识符为行情字段（close、volume 等）或因子库中的因子名（如 rsi、macd）。
+"""
+
+import re
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from . import factor_graph as fg
+from .factor_lib import FactorLibrary
+
+
+class ExpressionError(ValueError):
+    """表达式语法或参数错误"""
+
+
+_TOKEN = re.compile(r"\s*(?:(\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+)|([A-Za-z_]\w*)|(.))")
+
+# 可交换的二元运算，输入按表达式文本排序后两种写法得到同一个节点
+_COMMUTATIVE = {"add", "mul", "fmax", "fmin"}
+
+
+def _fold(op: str, inputs: Tuple[fg.Node, ...], params: Tuple = ()) -> fg.Node:
+    """创建节点：常量输入直接求值，可交换运算规范化输入顺序，去掉 +0、*1 等恒等运算"""
+    if op in _COMMUTATIVE:
+        inputs = tuple(sorted(inputs, key=repr))
+    if op in fg.OPS and inputs and all(n.op == "const" for n in inputs):
+        if op in ("add", "sub", "mul", "div", "fmax", "fmin", "neg", "abs", "sign", "log", "sqrt"):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                value = fg.OPS[op]([np.float64(n.params[0]) for n in inputs], params, None)
+            return fg.const(float(value))
+    if len(inputs) == 2:
+        left, right = inputs
+        if op == "add" and _is_const(left, 0.0):
+            return right
+        if op == "mul" and _is_const(left, 1.0):
+            return right
+        if op in ("sub", "add") and _is_const(right, 0.0):
+            return left
+        if op in ("mul", "div") and _is_const(right, 1.0):
+            return left
+    return fg.Node(op, inputs, params)
+
+
+def _is_const(node: fg.Node, value: float) -> bool:
+    return node.op == "const" and node.params[0] == value
+
+
+def _window_op(op: str, *extra) -> Callable:
+    def build(x: fg.Node, window: int) -> fg.Node:
+        return _fold(op, (x,), (window,) + extra)
+
+    return build
+
+
+def _ts_sum(x: fg.Node, window: int) -> fg.Node:
+    return _fold("mul", (_fold("rolling_mean", (x,), (window,)), fg.const(window)))
+
+
+def _delta(x: fg.Node, window: int) -> fg.Node:
+    return _fold("diff", (x,), (window,))
+
+
+# 函数名 -> (构建函数, 参数类型)，node 为子表达式，int 为窗口长度
+FUNCTIONS: Dict[str, Tuple[Callable, Tuple[str, ...]]] = {
+    "ts_mean": (_window_op("rolling_mean"), ("node", "int")),
+    "ts_std": (_window_op("rolling_std"), ("node", "int")),
+    "ts_sum": (_ts_sum, ("node", "int")),
+    "ts_max": (_window_op("rolling_max"), ("node", "int")),
+    "ts_min": (_window_op("rolling_min"), ("node", "int")),
+    "ts_rank": (_window_op("rolling_rank", True), ("node", "int")),
+    "decay_linear": (_window_op("decay_linear"), ("node", "int")),
+    "delay": (_window_op("shift"), ("node", "int")),
+    "delta": (_delta, ("node", "int")),
+    "rank": (lambda x: _fold("cs_rank", (x,)), ("node",)),
+    "zscore": (lambda x: _fold("cs_zscore", (x,)), ("node",)),
+    "demean": (lambda x: _fold("cs_demean", (x,)), ("node",)),
+    "abs": (lambda x: _fold("abs", (x,)), ("node",)),
+    "log": (lambda x: _fold("log", (x,)), ("node",)),
+    "sign": (lambda x: _fold("sign", (x,)), ("node",)),
+    "sqrt": (lambda x: _fold("sqrt", (x,)), ("node",)),
+    "max": (lambda a, b: _fold("fmax", (a, b)), ("node", "node")),
+    "min": (lambda a, b: _fold("fmin", (a, b)), ("node", "node")),
+}
+
+# 输入须为随日期、股票变化的序列（不能是常量）的函数
+_SERIES_FUNCTIONS = {name for name in FUNCTIONS if name.startswith("ts_")} | {
+    "decay_linear",
+    "delay",
+    "delta",
+    "rank",
+    "zscore",
+    "demean",
+}
+
+# 窗口长度上限，防止误写的超长窗口
+MAX_WINDOW = 2520
+# 括号、函数调用、负号的嵌套层数与运算链长度上限，超出时递归解析与节点遍历会耗尽调用栈
+MAX_DEPTH = 100
+
+
+class _Parser:
+    """递归下降解析器
+
+    expr  := term (('+' | '-') term)*
+    term  := unary (('*' | '/') unary)*
+    unary := '-' unary | atom
+    atom  := NUMBER | NAME | NAME '(' expr (',' expr)* ')' | '(' expr ')'
+    """
+
+    def __init__(self, text: str, library: FactorLibrary):
+        self.text = text
+        self.library = library
+        self.tokens = self._tokenize(text)
+        self.pos = 0
+        self.nesting = 0
+        self._depths: Dict[fg.Node, int] = {}
+
+    @staticmethod
+    def _tokenize(text: str) -> List[Tuple[str, str]]:
+        tokens = []
+        pos = 0
+        text = text.rstrip()
+        while pos < len(text):
+            match = _TOKEN.match(text, pos)
+            number, name, symbol = match.groups()
+            if number is not None:
+                tokens.append(("number", number))
+            elif name is not None:
+                tokens.append(("name", name))
+            elif symbol in "+-*/(),":
+                tokens.append(("symbol", symbol))
+            else:
+                raise ExpressionError(f"无法识别的字符 {symbol!r}（位置 {match.start(3)}）")
+            pos = match.end()
+        return tokens
+
+    def peek(self) -> Tuple[str, str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else ("end", "")
+
+    def take(self, value: str = None) -> Tuple[str, str]:
+        token = self.peek()
+        if value is not None and token[1] != value:
+            found = token[1] or "表达式结尾"
+            raise ExpressionError(f"期望 {value!r}，实际为 {found!r}")
+        self.pos += 1
+        return token
+
+    def parse(self) -> fg.Node:
+        if not self.tokens:
+            raise ExpressionError("表达式为空")
+        node = self.expr()
+        if self.peek()[0] != "end":
+            raise ExpressionError(f"多余的内容 {self.peek()[1]!r}")
+        return node
+
+    def nested(self, parse: Callable[[], fg.Node]) -> fg.Node:
+        """解析一层嵌套，超过 MAX_DEPTH 层时报错"""
+        if self.nesting >= MAX_DEPTH:
+            raise ExpressionError(f"表达式嵌套超过 {MAX_DEPTH} 层")
+        self.nesting += 1
+        try:
+            return parse()
+        finally:
+            self.nesting -= 1
+
+    def depth(self, node: fg.Node) -> fg.Node:
+        """检查节点树的深度（如很长的 a + b + … 运算链），超过 MAX_DEPTH 时报错"""
+        if node not in self._depths:
+            self._depths[node] = 1 + max((self._depth_of(n) for n in node.inputs), default=0)
+        if self._depths[node] > MAX_DEPTH:
+            raise ExpressionError(f"表达式嵌套超过 {MAX_DEPTH} 层")
+        return node
+
+    def _depth_of(self, node: fg.Node) -> int:
+        if node not in self._depths:
+            self.depth(node)
+        return self._depths[node]
+
+    def expr(self) -> fg.Node:
+        return self.nested(self._expr)
+
+    def _expr(self) -> fg.Node:
+        node = self.term()
+        while self.peek() in (("symbol", "+"), ("symbol", "-")):
+            op = "add" if self.take()[1] == "+" else "sub"
+            node = self.depth(_fold(op, (node, self.term())))
+        return node
+
+    def term(self) -> fg.Node:
+        node = self.unary()
+        while self.peek() in (("symbol", "*"), ("symbol", "/")):
+            op = "mul" if self.take()[1] == "*" else "div"
+            node = self.depth(_fold(op, (node, self.unary())))
+        return node
+
+    def unary(self) -> fg.Node:
+        if self.peek() == ("symbol", "-"):
+            self.take()
+            return self.depth(_fold("neg", (self.nested(self.unary),)))
+        return self.atom()
+
+    def atom(self) -> fg.Node:
+        kind, value = self.peek()
+        if kind == "number":
+            self.take()
+            return fg.const(float(value))
+        if (kind, value) == ("symbol", "("):
+            self.take()
+            node = self.expr()
+            self.take(")")
+            return node
+        if kind == "name":
+            self.take()
+            if self.peek() == ("symbol", "("):
+                return self.call(value)
+            return self.identifier(value)
+        raise ExpressionError(f"表达式不完整，位置 {self.pos} 处为 {value or '表达式结尾'!r}")
+
+    def call(self, name: str) -> fg.Node:
+        if name not in FUNCTIONS:
+            raise ExpressionError(f"未知函数 {name}")
+        builder, signature = FUNCTIONS[name]
+        self.take("(")
+        args = [self.expr()]
+        while self.peek() == ("symbol", ","):
+            self.take()
+            args.append(self.expr())
+        self.take(")")
+        if len(args) != len(signature):
+            raise ExpressionError(f"{name} 需要 {len(signature)} 个参数，实际 {len(args)} 个")
+        values = []
+        for arg, kind in zip(args, signature):
+            if kind == "int":
+                window = arg.params[0] if arg.op == "const" else None
+                if window is None or not 1 <= window <= MAX_WINDOW or window != int(window):
+                    raise ExpressionError(f"{name} 的窗口须为 1 到 {MAX_WINDOW} 之间的整数常量")
+                values.append(int(window))
+            elif arg.op == "const" and name in _SERIES_FUNCTIONS:
+                raise ExpressionError(f"{name} 的输入不能是常量")
+            else:
+                values.append(arg)
+        return self.depth(builder(*values))
+
+    def identifier(self, name: str) -> fg.Node:
+        if name in FUNCTIONS:
+            raise ExpressionError(f"{name} 是函数，缺少参数")
+        factor = self.library.get_factor(name)
+        node = factor.graph() if factor is not None else None
+        return node if node is not None else fg.field(name)
+
+
+def parse(text: str, library: FactorLibrary = None) -> fg.Node:
+    """
+    解析表达式为计算图节点
+
+    Args:
+        text: 表达式文本
+        library: 解析因子名所用的因子库
+
+    Raises:
+        ExpressionError: 语法错误、未知函数、窗口参数不合法或嵌套过深
+    """
+    return _Parser(text, library or FactorLibrary()).parse()
+
+
+def fields_of(node: fg.Node) -> List[str]:
+    """表达式引用的行情字段"""
+    graph = fg.FactorGraph({"expr": node})
+    return sorted({n.params[0] for n in graph.order if n.op == "field"})
+
+
+def compile_expressions(
+    expressions: List[str], library: FactorLibrary = None
+) -> Tuple[fg.FactorGraph, Dict[str, str]]:
+    """
+    编译一批表达式为一张共享子表达式的计算图
+
+    Returns:
+        (计算图, 解析失败的表达式 -> 错误信息)；计算图输出以表达式文本为名
+    """
+    library = library or FactorLibrary()
+    outputs = {}
+    errors = {}
+    for text in dict.fromkeys(expressions):
+        try:
+            outputs[text] = parse(text, library)
+        except ExpressionError as e:
+            errors[text] = str(e)
+    return fg.FactorGraph(outputs), errors
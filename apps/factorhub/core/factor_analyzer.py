@@ -2,8 +2,9 @@
 因子分析器
 """
 
+import hashlib
 import warnings
-from typing import Dict, List
+from typing import Dict, List, Union
 
 import numpy as np
 import pandas as pd
@@ -11,62 +12,341 @@ from scipy import stats
 
 warnings.filterwarnings("ignore")
 
+from . import kernels
+from .analysis_state import (
+    AnalysisState,
+    AnalysisStateStore,
+    get_analysis_state_store,
+    history_version,
+)
+from .config import DEFAULT_CONFIG
+from .forward_returns import (
+    ForwardReturns,
+    forward_return,
+    forward_return_name,
+    parse_forward_return_name,
+)
 from .helpers import calculate_ic_win_rate, calculate_ir
 from .logger import logger
+from .panel import MarketPanel, as_panel
+from .rank_cache import RankCache, get_rank_cache
+
+# 默认收益：次日收盘相对当日收盘的收益（当日的 return_1d 含前视偏差）
+DEFAULT_RETURN = forward_return_name(1)
+
+
+def _has_field(data: Union[pd.DataFrame, MarketPanel], name: str) -> bool:
+    if isinstance(data, MarketPanel):
+        return name in data
+    return name in data.columns
+
+
+def _has_returns(data: Union[pd.DataFrame, MarketPanel], return_col: str) -> bool:
+    """收益列存在，或是可由数据中的价格生成的未来收益字段"""
+    parsed = parse_forward_return_name(return_col)
+    return _has_field(data, return_col) or (parsed is not None and _has_field(data, parsed[0]))
+
+
+def _on_joint_sample(values: np.ndarray, own: np.ndarray, valid: np.ndarray, compute, fill):
+    """
+    共同有效样本上的截面排名或分组
+
+    own 是 values 在自身有效样本上的结果（来自 RankCache）；共同样本与自身样本一致的日期
+    直接取用，其余日期在共同样本上用 compute 重新计算。
+    """
+    result = np.where(valid, own, fill)
+    redo = (valid != ~np.isnan(values)).any(axis=-1)
+    if redo.any():
+        result[redo] = compute(np.where(valid, values, np.nan)[redo])
+    return result
+
+
+def _cross_sectional_ic(
+    factors: np.ndarray,
+    returns: np.ndarray,
+    method: str = "spearman",
+    factor_ranks: np.ndarray = None,
+    return_ranks: np.ndarray = None,
+) -> tuple:
+    """
+    一次计算多个因子每个日期的截面IC
+
+    Args:
+        factors: (因子, 日期, 股票) 数组
+        returns: (日期, 股票) 收益率数组
+        method: spearman 为平均秩（并列取平均）上的 Pearson 相关，与 stats.spearmanr 一致
+        factor_ranks: 因子在自身有效样本上的截面排名，提供时只对样本不一致的日期重新排名
+        return_ranks: 收益率在自身有效样本上的截面排名
+
+    Returns:
+        (ic, count)，形状均为 (因子, 日期)；有效样本不足 3 个的位置 ic 为 NaN
+    """
+    if method not in ("spearman", "pearson"):
+        raise ValueError("method must be 'spearman' or 'pearson'")
+    valid = ~(np.isnan(factors) | np.isnan(returns)[None])
+    invalid = ~valid
+    x = np.where(valid, factors, np.nan)
+    y = np.where(valid, returns[None], np.nan)
+    if method == "spearman":
+        for values, raw, own in ((x, factors, factor_ranks), (y, returns[None], return_ranks)):
+            if own is None:
+                kernels.cs_average_rank(values, out=values)
+            else:
+                own = own.astype(np.float64)
+                values[:] = _on_joint_sample(raw, own, valid, kernels.cs_average_rank, np.nan)
+
+    count = valid.sum(axis=2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for values in (x, y):
+            np.copyto(values, 0.0, where=invalid)
+            values -= (values.sum(axis=2) / count)[..., None]
+            np.copyto(values, 0.0, where=invalid)
+        cov = np.einsum("ktn,ktn->kt", x, y)
+        ic = cov / np.sqrt(np.einsum("ktn,ktn->kt", x, x) * np.einsum("ktn,ktn->kt", y, y))
+    ic[count < 3] = np.nan
+    return ic, count
+
+
+def _ic_p_values(ic: np.ndarray, count: np.ndarray) -> np.ndarray:
+    """相关系数为 0 的双侧 t 检验 p 值（自由度 n-2），与 stats.spearmanr/pearsonr 一致"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = ic * np.sqrt((count - 2) / np.maximum((1 - ic) * (1 + ic), 0))
+    return 2 * stats.t.sf(np.abs(t), count - 2)
+
+
+def _ic_cube(
+    factors: np.ndarray, returns: np.ndarray, method: str = "spearman", batch_mb: float = 256
+) -> tuple:
+    """
+    多因子 × 多持有期 的截面IC
+
+    按日期分批：每批内因子与收益各自排名一次（在各自的有效样本上），中心化后拼成
+    [x, x², 有效标记] 与 [y, y², 有效标记] 两个矩阵，一次批量矩阵乘法得到每对
+    (因子, 持有期) 在共同有效样本上的 n、Σx、Σy、Σxy、Σx²、Σy²，由此得到 Pearson 相关。
+    pearson 与 _cross_sectional_ic 完全一致；spearman 的排名须在共同样本上计算，
+    因子与收益有效样本不一致的日期（收益末尾、停牌等）按持有期交给 _cross_sectional_ic 重算。
+
+    Args:
+        factors: (因子, 日期, 股票) 数组
+        returns: (持有期, 日期, 股票) 数组
+        method: spearman 或 pearson
+        batch_mb: 每批中间数组的内存上限
+
+    Returns:
+        (ic, count)，形状均为 (因子, 持有期, 日期)；有效样本不足 3 个的位置 ic 为 NaN
+    """
+    if method not in ("spearman", "pearson"):
+        raise ValueError("method must be 'spearman' or 'pearson'")
+    K, T, N = factors.shape
+    H = returns.shape[0]
+    ic = np.full((K, H, T), np.nan)
+    count = np.zeros((K, H, T), dtype=np.int64)
+    batch = max(1, int(batch_mb * 1024 * 1024 // (4 * 3 * (K + H) * N * 8)))
+
+    def stack(values: np.ndarray) -> np.ndarray:
+        """(变量, 日期, 股票) -> (日期, 3 × 变量, 股票) 的 [x, x², 有效标记]"""
+        n_vars = values.shape[0]
+        out = np.empty((values.shape[1], 3 * n_vars, N))
+        x = out[:, :n_vars]
+        x[:] = values.transpose(1, 0, 2)
+        if method == "spearman":
+            kernels.cs_average_rank(x, out=x)
+        valid = ~np.isnan(x)
+        out[:, 2 * n_vars :] = valid
+        # 先按各自的有效样本中心化，减小平方和相减时的舍入误差
+        kernels.cs_demean(x, out=x)
+        np.copyto(x, 0.0, where=~valid)
+        np.multiply(x, x, out=out[:, n_vars : 2 * n_vars])
+        return out
+
+    for start in range(0, T, batch):
+        stop = min(start + batch, T)
+        gram = np.matmul(
+            stack(factors[:, start:stop]), stack(returns[:, start:stop]).transpose(0, 2, 1)
+        )
+        sxy = gram[:, :K, :H]
+        sx = gram[:, :K, 2 * H :]
+        sxx = gram[:, K : 2 * K, 2 * H :]
+        sy = gram[:, 2 * K :, :H]
+        syy = gram[:, 2 * K :, H : 2 * H]
+        n = gram[:, 2 * K :, 2 * H :]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = sxy - sx * sy / n
+            var = (sxx - sx * sx / n) * (syy - sy * sy / n)
+            ic[:, :, start:stop] = (cov / np.sqrt(var)).transpose(1, 2, 0)
+        count[:, :, start:stop] = np.rint(n).astype(np.int64).transpose(1, 2, 0)
+        if method == "spearman":
+            factor_valid = ~np.isnan(factors[:, start:stop])
+            for h in range(H):
+                return_valid = ~np.isnan(returns[h, start:stop])
+                redo = (factor_valid != return_valid[None]).any(axis=(0, 2))
+                if redo.any():
+                    dates = np.flatnonzero(redo) + start
+                    ic[:, h, dates], _ = _cross_sectional_ic(
+                        factors[:, dates], returns[h, dates], method
+                    )
+    ic[count < 3] = np.nan
+    return ic, count
+
+
+def _bucket_statistics(buckets: np.ndarray, returns: np.ndarray, n: int) -> Dict[str, np.ndarray]:
+    """
+    各日期各分组的平均收益、成员数与换手率
+
+    Args:
+        buckets: (日期, 股票) 分组 0 … n-1，不参与的位置为 -1
+        returns: (日期, 股票) 收益率
+        n: 分组数
+
+    Returns:
+        returns、counts、turnover 均为 (组, 日期)；无成员的组收益为 NaN，
+        换手率为本期成员中上一日期不在该组的比例，首个日期为 NaN
+    """
+    n_dates = buckets.shape[0]
+    member = buckets >= 0
+    index = np.arange(n_dates)[:, None] * n + buckets.astype(np.int64)
+    size = n_dates * n
+    counts = np.bincount(index[member], minlength=size).reshape(n_dates, n)
+    sums = np.bincount(index[member], weights=returns[member], minlength=size)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = sums.reshape(n_dates, n) / counts
+
+    # 与上一日期同组的成员数
+    stay = member[1:] & (buckets[1:] == buckets[:-1])
+    stayed = np.bincount(index[1:][stay] - n, minlength=size - n).reshape(n_dates - 1, n)
+    turnover = np.full((n_dates, n), np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        turnover[1:] = 1 - stayed / counts[1:]
+    return {"returns": mean.T, "counts": counts.T, "turnover": turnover.T}
+
+
+def _ic_summary(ic_series: pd.Series) -> Dict:
+    """IC序列的汇总统计"""
+    t_stat, t_p_value = stats.ttest_1samp(ic_series, 0)
+    return {
+        "ic_mean": ic_series.mean(),
+        "ic_std": ic_series.std(),
+        "ir": calculate_ir(ic_series),
+        "ic_win_rate": calculate_ic_win_rate(ic_series),
+        "t_statistic": t_stat,
+        "t_p_value": t_p_value,
+        "sample_count": len(ic_series),
+    }
+
+
+def _state_summary(state: AnalysisState, window: int) -> Dict:
+    """由累加状态得到与 calculate_ic_analysis、calculate_decile_analysis 相同口径的汇总"""
+    n = int(state.ic.n)
+    ic_mean, ic_std = float(state.ic.mean), float(state.ic.std())
+    t_stat = ic_mean / (ic_std / np.sqrt(n)) if n > 1 and ic_std > 0 else np.nan
+    ic = {
+        "ic_mean": ic_mean if n else np.nan,
+        "ic_std": ic_std,
+        "ir": ic_mean / ic_std if ic_std > 0 else 0,
+        "ic_win_rate": state.ic_wins / n if n else 0,
+        "ic_abs_mean": state.ic_abs_sum / n if n else np.nan,
+        "t_statistic": t_stat,
+        "t_p_value": float(2 * stats.t.sf(abs(t_stat), n - 1)) if n > 1 else np.nan,
+        "sample_count": n,
+    }
+    if window and len(state.recent_ic) >= window:
+        recent = np.asarray(state.recent_ic[-window:])
+        rolling_std = recent.std(ddof=1)
+        ic.update(
+            {
+                "rolling_mean_last": float(recent.mean()),
+                "rolling_std_last": float(rolling_std),
+                "rolling_ir_last": float(recent.mean() / rolling_std),
+            }
+        )
+
+    deciles = state.decile_returns
+    with np.errstate(divide="ignore", invalid="ignore"):
+        decile = {
+            "avg_returns": {
+                "decile": list(range(1, state.n_deciles + 1)),
+                "mean_return": np.where(deciles.n > 0, deciles.mean, np.nan).tolist(),
+                "std_return": deciles.std().tolist(),
+                "count": deciles.n.tolist(),
+                "avg_members": (state.members / deciles.n).tolist(),
+                "turnover": (state.turnover_sum / state.turnover_count).tolist(),
+            },
+            "long_short_return": float(state.long_short.mean) if state.long_short.n else np.nan,
+            "long_short_std": float(state.long_short.std()),
+            "turnover_rate": float(state.turnover_sum.sum() / state.turnover_count.sum()),
+            "decile_nav": state.decile_nav.tolist(),
+            "long_short_nav": float(state.long_short_nav),
+        }
+    return {"ic": ic, "decile": decile}
 
 
 class FactorAnalyzer:
     """因子分析器"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        forward_returns: ForwardReturns = None,
+        rank_cache: RankCache = None,
+        state_store: AnalysisStateStore = None,
+    ):
+        """
+        Args:
+            forward_returns: 未来收益服务，默认不缓存；收益列为 fwd_* 字段且数据中没有时
+                由其从价格生成并加入面板
+            rank_cache: 截面排名、分组缓存，默认为进程内共享的缓存（与回测引擎共用）
+            state_store: 增量统计的状态存储，默认为进程内共享的存储
+        """
         self.logger = logger
+        self.forward_returns = forward_returns if forward_returns is not None else ForwardReturns()
+        self.rank_cache = rank_cache if rank_cache is not None else get_rank_cache()
+        self.state_store = state_store
+
+    def _analysis_panel(
+        self, data: Union[pd.DataFrame, MarketPanel], fields: List[str], return_col: str
+    ) -> MarketPanel:
+        """转换为面板，收益列缺失时加入未来收益字段（数据为面板时直接加入该面板，供后续阶段复用）"""
+        if _has_field(data, return_col):
+            fields = fields + [return_col]
+        else:
+            fields = fields + [parse_forward_return_name(return_col)[0]]
+        panel = as_panel(data, list(dict.fromkeys(fields)))
+        return self.forward_returns.ensure(panel, [return_col])
 
     def calculate_ic_analysis(
         self,
-        factor_data: pd.DataFrame,
+        factor_data: Union[pd.DataFrame, MarketPanel],
         factor_name: str,
-        return_col: str = "return_1d",
+        return_col: str = DEFAULT_RETURN,
         method: str = "spearman",
         window: int = None,
     ) -> Dict:
         """计算IC分析"""
         try:
-            if factor_name not in factor_data.columns:
+            if not _has_field(factor_data, factor_name):
                 return {"error": f"因子{factor_name}不存在"}
 
-            if return_col not in factor_data.columns:
+            if not _has_returns(factor_data, return_col):
                 return {"error": f"收益率列{return_col}不存在"}
 
-            # 按日期分组计算IC
-            ic_results = []
-            dates = factor_data["date"].unique()
-
-            for date in dates:
-                date_data = factor_data[factor_data["date"] == date]
-                if len(date_data) < 5:
-                    continue
-
-                factor_values = date_data[factor_name]
-                return_values = date_data[return_col]
-
-                valid_mask = ~(pd.isna(factor_values) | pd.isna(return_values))
-                if valid_mask.sum() < 3:
-                    continue
-
-                factor_clean = factor_values[valid_mask]
-                return_clean = return_values[valid_mask]
-
-                if method == "spearman":
-                    ic, p_value = stats.spearmanr(factor_clean, return_clean)
-                elif method == "pearson":
-                    ic, p_value = stats.pearsonr(factor_clean, return_clean)
-                else:
-                    raise ValueError("method must be 'spearman' or 'pearson'")
-
-                if not np.isnan(ic):
-                    ic_results.append(
-                        {"date": str(date), "ic": ic, "p_value": p_value, "count": valid_mask.sum()}
-                    )
+            # 全部日期的截面IC一次计算
+            panel = self._analysis_panel(factor_data, [factor_name], return_col)
+            ranks = {}
+            if method == "spearman":
+                ranks = {
+                    "factor_ranks": self.rank_cache.ranks(panel[factor_name])[None],
+                    "return_ranks": self.rank_cache.ranks(panel[return_col])[None],
+                }
+            ic, count = _cross_sectional_ic(
+                panel[factor_name][None], panel[return_col], method, **ranks
+            )
+            ic, count = ic[0], count[0]
+            keep = (panel.mask.sum(axis=1) >= 5) & ~np.isnan(ic)
+            ic_results = [
+                {"date": str(date), "ic": float(v), "p_value": float(p), "count": int(n)}
+                for date, v, p, n in zip(
+                    panel.dates[keep], ic[keep], _ic_p_values(ic[keep], count[keep]), count[keep]
+                )
+            ]
 
             if not ic_results:
                 return {"error": "没有有效的IC计算结果"}
@@ -114,79 +394,355 @@ class FactorAnalyzer:
 
     def calculate_decile_analysis(
         self,
-        factor_data: pd.DataFrame,
+        factor_data: Union[pd.DataFrame, MarketPanel],
         factor_name: str,
-        return_col: str = "return_1d",
+        return_col: str = DEFAULT_RETURN,
         n_deciles: int = 10,
     ) -> Dict:
-        """计算分层回测分析"""
+        """
+        计算分层回测分析
+
+        每个日期在因子与收益共同有效的股票上按因子分位数分为 n_deciles 组，全部日期的
+        组内平均收益、成员数与换手率一次计算。结果为列式列表：decile_* 为 [组][日期]，
+        long_short 为最高组减最低组的逐日收益；*_nav 为逐日收益的累计净值（收益持有期
+        长于 1 日时各日期的收益区间重叠，净值仅作参考）。换手率为组内本期新进股票占比。
+        """
         try:
-            if factor_name not in factor_data.columns:
+            if not _has_field(factor_data, factor_name):
                 return {"error": f"因子{factor_name}不存在"}
 
+            if not _has_returns(factor_data, return_col):
+                return {"error": f"收益率列{return_col}不存在"}
+
             # 移除缺失值
-            valid_data = factor_data.dropna(subset=[factor_name, return_col])
-            if len(valid_data) < 100:
+            panel = self._analysis_panel(factor_data, [factor_name], return_col)
+            factor_values = panel[factor_name]
+            return_values = panel[return_col]
+            valid = ~(np.isnan(factor_values) | np.isnan(return_values))
+            if valid.sum() < 100:
                 return {"error": "数据量不足"}
 
-            # 按日期分层
-            decile_returns = []
-            decile_counts = []
+            # 各日期在共同有效样本上的分位数分组
+            buckets = _on_joint_sample(
+                factor_values,
+                self.rank_cache.buckets(factor_values, n_deciles),
+                valid,
+                lambda values: kernels.cs_quantile_buckets(values, n_deciles),
+                -1,
+            )
+
+            # 有效股票不足 n_deciles 只的日期不分层
+            keep = valid.sum(axis=1) >= n_deciles
+            if not keep.any():
+                return {"error": "没有有效的分层结果"}
+            groups = _bucket_statistics(buckets[keep], return_values[keep], n_deciles)
+            mean_returns = groups["returns"]
+            present = ~np.isnan(mean_returns)
+            if not present.any():
+                return {"error": "没有有效的分层结果"}
 
-            for date in valid_data["date"].unique():
-                date_data = valid_data[valid_data["date"] == date].copy()
-                if len(date_data) < n_deciles:
-                    continue
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                long_short = mean_returns[-1] - mean_returns[0]
+                avg_returns = {
+                    "decile": list(range(1, n_deciles + 1)),
+                    "mean_return": np.nanmean(mean_returns, axis=1).tolist(),
+                    "std_return": np.nanstd(mean_returns, axis=1, ddof=1).tolist(),
+                    "count": present.sum(axis=1).tolist(),
+                    "avg_members": np.nanmean(
+                        np.where(present, groups["counts"], np.nan), axis=1
+                    ).tolist(),
+                    "turnover": np.nanmean(groups["turnover"], axis=1).tolist(),
+                }
+                long_short_return = float(np.nanmean(long_short))
+                long_short_std = float(np.nanstd(long_short, ddof=1))
+                turnover_rate = float(np.nanmean(groups["turnover"]))
 
-                # 分层
-                date_data["decile"] = pd.qcut(
-                    date_data[factor_name], q=n_deciles, labels=False, duplicates="drop"
-                )
+            return {
+                "n_deciles": n_deciles,
+                "dates": [str(date.date()) for date in panel.dates[keep]],
+                "decile_returns": mean_returns.tolist(),
+                "decile_counts": groups["counts"].tolist(),
+                "decile_nav": np.cumprod(1 + np.nan_to_num(mean_returns), axis=1).tolist(),
+                "decile_turnover": groups["turnover"].tolist(),
+                "long_short": long_short.tolist(),
+                "long_short_nav": np.cumprod(1 + np.nan_to_num(long_short)).tolist(),
+                "avg_returns": avg_returns,
+                "long_short_return": long_short_return,
+                "long_short_std": long_short_std,
+                "turnover_rate": turnover_rate,
+            }
 
-                # 计算每层收益
-                for decile in range(n_deciles):
-                    decile_data = date_data[date_data["decile"] == decile]
-                    if len(decile_data) > 0:
-                        mean_return = decile_data[return_col].mean()
-                        decile_returns.append(
-                            {"date": str(date), "decile": decile + 1, "return": mean_return}
-                        )
-                        decile_counts.append({"decile": decile + 1, "count": len(decile_data)})
-
-            if not decile_returns:
-                return {"error": "没有有效的分层结果"}
+        except Exception as e:
+            self.logger.error(f"分层分析失败: {str(e)}")
+            return {"error": str(e)}
 
-            decile_df = pd.DataFrame(decile_returns)
-            counts_df = pd.DataFrame(decile_counts).drop_duplicates("decile")
+    def rank_factor_family(
+        self,
+        block,
+        data: MarketPanel,
+        return_col: str = DEFAULT_RETURN,
+        method: str = "spearman",
+    ) -> Dict:
+        """
+        按窗口比较因子族的IC，按 |IR| 从高到低排序
+
+        Args:
+            block: FactorFamily.compute 返回的 (窗口, 日期, 股票) 因子块
+            data: 与 block 日期、股票对齐的面板，包含收益率列
+            return_col: 收益率列，默认次日收益 fwd_close_1，面板中没有时由价格生成
+            method: spearman 或 pearson
+        """
+        try:
+            if not _has_returns(data, return_col):
+                return {"error": f"收益率列{return_col}不存在"}
+            if list(block.symbols) != list(data.symbols) or not block.dates.equals(data.dates):
+                return {"error": "因子块与面板的日期或股票不一致"}
+
+            self.forward_returns.ensure(data, [return_col])
+            ic, _ = _cross_sectional_ic(block.values, data[return_col], method)
+            # 与 calculate_ic_analysis 一致：当日股票数不足 5 只的日期不计
+            ic[:, data.mask.sum(axis=1) < 5] = np.nan
+
+            rows = []
+            for k, window in enumerate(block.windows):
+                ic_series = pd.Series(ic[k][~np.isnan(ic[k])])
+                if len(ic_series) < 2:
+                    continue
+                rows.append({"window": window, "factor": block.names[k], **_ic_summary(ic_series)})
+            if not rows:
+                return {"error": "没有有效的IC计算结果"}
 
-            # 计算每层平均收益
-            avg_returns = decile_df.groupby("decile")["return"].agg(["mean", "std", "count"])
-            avg_returns.columns = ["mean_return", "std_return", "count"]
+            rows.sort(key=lambda row: -abs(row["ir"]))
+            return {"family": block.family, "method": method, "best": rows[0], "windows": rows}
 
-            # 计算多空组合
-            long_short = avg_returns.loc[n_deciles] - avg_returns.loc[1]
+        except Exception as e:
+            self.logger.error(f"因子族分析失败: {str(e)}")
+            return {"error": str(e)}
 
-            # 计算换手率
-            turnover_rate = 1.0 / n_deciles
+    def calculate_ic_matrix(
+        self,
+        block,
+        data: MarketPanel,
+        horizons: List[int] = None,
+        method: str = "spearman",
+        price: str = "close",
+    ) -> Dict:
+        """
+        一次计算多个因子在多个持有期上的IC
+
+        Args:
+            block: FactorEngine 计算的 (因子, 日期, 股票) 因子块
+            data: 与 block 日期、股票对齐的面板，包含价格列；未来收益字段加入该面板
+            horizons: 持有期（交易日），默认取配置 analysis.forward_horizons
+            method: spearman 或 pearson
+            price: 未来收益口径，close 为收盘到收盘，open 为次日开盘到开盘
+
+        Returns:
+            ic/count 为 (因子, 持有期, 日期) 数组，summary 为每对 (因子, 持有期) 的汇总统计
+        """
+        try:
+            if price not in data:
+                return {"error": f"价格列{price}不存在"}
+            if list(block.symbols) != list(data.symbols) or not block.dates.equals(data.dates):
+                return {"error": "因子块与面板的日期或股票不一致"}
+            horizons = sorted(set(horizons or DEFAULT_CONFIG["analysis"]["forward_horizons"]))
+            names = [name for name in block.names if name in block.computed]
+            if not names:
+                return {"error": "没有计算成功的因子"}
+
+            factors = block.values[[block.names.index(name) for name in names]]
+            returns = self.forward_returns.stack(data, horizons, price)
+            ic, count = _ic_cube(
+                factors, returns, method, DEFAULT_CONFIG["analysis"]["ic_batch_mb"]
+            )
+            # 与 calculate_ic_analysis 一致：当日股票数不足 5 只的日期不计
+            ic[:, :, data.mask.sum(axis=1) < 5] = np.nan
+
+            summary = []
+            for k, name in enumerate(names):
+                for h, horizon in enumerate(horizons):
+                    ic_series = pd.Series(ic[k, h][~np.isnan(ic[k, h])])
+                    if len(ic_series) < 2:
+                        continue
+                    summary.append({"factor": name, "horizon": horizon, **_ic_summary(ic_series)})
+            if not summary:
+                return {"error": "没有有效的IC计算结果"}
 
             return {
-                "decile_returns": decile_df.to_dict("records"),
-                "avg_returns": avg_returns.reset_index().to_dict("records"),
-                "long_short_return": long_short["mean_return"],
-                "long_short_std": long_short["std_return"],
-                "counts": counts_df.to_dict("records"),
-                "turnover_rate": turnover_rate,
+                "method": method,
+                "factors": names,
+                "horizons": horizons,
+                "dates": [str(date.date()) for date in data.dates],
+                "ic": ic,
+                "count": count,
+                "summary": summary,
             }
 
         except Exception as e:
-            self.logger.error(f"分层分析失败: {str(e)}")
+            self.logger.error(f"IC矩阵分析失败: {str(e)}")
+            return {"error": str(e)}
+
+    def update_factor_statistics(
+        self,
+        data: MarketPanel,
+        factor_name: str,
+        definition: str,
+        horizon: int = 1,
+        price: str = "close",
+        method: str = "spearman",
+        n_deciles: int = None,
+        universe: str = None,
+        window: int = None,
+    ) -> Dict:
+        """
+        增量更新因子的 IC 与分层统计，只计算上次更新之后的新日期
+
+        状态按 (因子定义, 持有期, 收益口径, 方法, 分组数, 股票池, 复权方式) 持久化；
+        因子定义或历史数据版本变化、股票列表变化时从头重算。持有期未走完的日期
+        （未来收益未知）留到之后的更新处理。
+
+        Args:
+            data: 包含因子字段与价格字段的面板，通常由 get_panel 得到（带存储版本）
+            factor_name: 面板中的因子字段
+            definition: 因子定义（如 factor_cache.factor_definition 或表达式文本）
+            horizon: 持有期（交易日）
+            price: 未来收益口径 close / open
+            method: spearman 或 pearson
+            n_deciles: 分组数，默认取配置 analysis.decile_n
+            universe: 股票池名称，默认以股票列表区分
+            window: 滚动 IC 窗口，默认取配置 analysis.ic_window
+
+        Returns:
+            ic、decile 汇总（口径同 calculate_ic_analysis、calculate_decile_analysis），
+            以及本次新处理的日期数 new_dates 与是否从头重算 full_recompute
+        """
+        try:
+            if factor_name not in data:
+                return {"error": f"因子{factor_name}不存在"}
+            if price not in data:
+                return {"error": f"价格列{price}不存在"}
+            if method not in ("spearman", "pearson"):
+                return {"error": "method must be 'spearman' or 'pearson'"}
+            config = DEFAULT_CONFIG["analysis"]
+            n_deciles = n_deciles or config["decile_n"]
+            window = window or config["ic_window"]
+            store = self.state_store if self.state_store is not None else get_analysis_state_store()
+
+            symbols = [str(symbol) for symbol in data.symbols]
+            if universe is None:
+                universe = hashlib.sha1("\x1f".join(symbols).encode()).hexdigest()
+            key = store.key(
+                definition,
+                horizon,
+                price,
+                method,
+                n_deciles,
+                universe,
+                data.attrs.get("adjust", ""),
+            )
+            version = history_version(data)
+            dates = [str(date.date()) for date in data.dates]
+
+            state = store.load(key) if version is not None else None
+            full = (
+                state is None
+                or state.version != version
+                or state.symbols != symbols
+                or (state.last_date is not None and state.last_date not in dates)
+            )
+            if full:
+                state = AnalysisState(symbols, version, n_deciles)
+            start = dates.index(state.last_date) + 1 if state.last_date is not None else 0
+            # 只处理未来收益已知的日期
+            end = len(dates) - horizon - (1 if price == "open" else 0)
+
+            new_dates = max(0, end - start)
+            if new_dates:
+                self._update_state(
+                    state,
+                    data[factor_name][start:end],
+                    forward_return(data[price][start:], horizon, price)[:new_dates],
+                    data.mask[start:end],
+                    method,
+                    window,
+                )
+                state.first_date = state.first_date or dates[start]
+                state.last_date = dates[end - 1]
+                if version is not None:
+                    store.save(key, state)
+
+            self.logger.info(
+                f"因子 {factor_name} 增量统计：新增 {new_dates} 个日期"
+                + ("（从头重算）" if full else "")
+            )
+            return {
+                "factor": factor_name,
+                "horizon": horizon,
+                "first_date": state.first_date,
+                "last_date": state.last_date,
+                "new_dates": new_dates,
+                "full_recompute": full,
+                **_state_summary(state, window),
+            }
+
+        except Exception as e:
+            self.logger.error(f"增量因子统计失败: {str(e)}")
             return {"error": str(e)}
 
+    @staticmethod
+    def _update_state(
+        state: AnalysisState,
+        factor: np.ndarray,
+        returns: np.ndarray,
+        mask: np.ndarray,
+        method: str,
+        window: int,
+    ):
+        """用新日期的 (日期, 股票) 因子值与未来收益更新累加状态"""
+        ic, _ = _cross_sectional_ic(factor[None], returns, method)
+        ic = ic[0][(mask.sum(axis=1) >= 5) & ~np.isnan(ic[0])]
+        state.ic.update(ic)
+        state.ic_abs_sum += float(np.abs(ic).sum())
+        state.ic_wins += int((ic > 0).sum())
+        state.recent_ic = (state.recent_ic + ic.tolist())[-window:]
+
+        n = state.n_deciles
+        valid = ~(np.isnan(factor) | np.isnan(returns))
+        keep = valid.sum(axis=1) >= n
+        if not keep.any():
+            return
+        buckets = kernels.cs_quantile_buckets(np.where(valid, factor, np.nan)[keep], n)
+        returns = returns[keep]
+        # 接上一个分层日期的分组，计算新日期第一天的换手率
+        if state.last_buckets is not None:
+            buckets = np.vstack([state.last_buckets[None], buckets])
+            returns = np.vstack([np.full((1, returns.shape[1]), np.nan), returns])
+        groups = _bucket_statistics(buckets, returns, n)
+        if state.last_buckets is not None:
+            groups = {name: values[:, 1:] for name, values in groups.items()}
+        state.last_buckets = buckets[-1]
+
+        mean_returns = groups["returns"]
+        present = ~np.isnan(mean_returns)
+        state.decile_returns.update(mean_returns)
+        state.long_short.update(mean_returns[-1] - mean_returns[0])
+        state.members += np.where(present, groups["counts"], 0).sum(axis=1)
+        turnover = groups["turnover"]
+        state.turnover_sum += np.nansum(turnover, axis=1)
+        state.turnover_count += (~np.isnan(turnover)).sum(axis=1)
+        state.decile_nav = state.decile_nav * np.prod(1 + np.nan_to_num(mean_returns), axis=1)
+        long_short = np.nan_to_num(mean_returns[-1] - mean_returns[0])
+        state.long_short_nav = float(state.long_short_nav * np.prod(1 + long_short))
+
     def calculate_correlation_matrix(
-        self, factor_data: pd.DataFrame, factor_names: List[str]
+        self, factor_data: Union[pd.DataFrame, MarketPanel], factor_names: List[str]
     ) -> Dict:
         """计算因子相关性矩阵"""
         try:
+            if isinstance(factor_data, MarketPanel):
+                factor_data = factor_data.to_long([n for n in factor_names if n in factor_data])
+
             # 选择因子列
             cols = ["date", "symbol"] + factor_names
             available_cols = [c for c in cols if c in factor_data.columns]
@@ -0,0 +1,196 @@
+"""
+因子结果缓存
+
+因子结果按内容寻址：键为 输入面板指纹 与 因子定义 的哈希。
+    面板指纹  股票列表、日期、复权方式，以及数据版本——由 get_panel 得到的面板中
+              取自存储的字段（attrs["stored_fields"]）使用各分区在列式存储中的版本
+              （generation、行数、校验和），其他字段对数组内容求哈希
+    因子定义  计算图表达式（包含全部参数），未声明计算图的因子取类名与参数
+同一份行情上定义相同的因子（如 ma20 与表达式 ts_mean(close, 20)）命中同一条缓存；
+行情数据更新后分区版本变化，旧结果自然不再命中。
+
+每个结果为一个 (日期, 股票) 的 .npy 列块文件，按文件修改时间做 LRU：命中时刷新修改时间，
+写入后总大小超出预算时删除最久未使用的文件。文件先写临时文件再原子替换，多进程共享同一目录安全。
+"""
+
+import hashlib
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from .config import DEFAULT_CONFIG, FACTOR_CACHE_DIR
+from .logger import logger
+from .panel import MarketPanel
+
+# 缓存格式版本，计算语义变化时递增使旧结果失效
+CACHE_FORMAT = 1
+
+
+def factor_definition(factor) -> str:
+    """因子定义的规范文本"""
+    node = factor.graph()
+    if node is not None:
+        return repr(node)
+    params = {k: v for k, v in sorted(vars(factor).items()) if k not in ("name", "description")}
+    return f"{type(factor).__name__}({params})"
+
+
+class PanelFingerprint:
+    """面板指纹，按字段组合计算并缓存"""
+
+    def __init__(self, panel: MarketPanel):
+        self.panel = panel
+        self._fields: Dict[str, str] = {}
+        base = hashlib.sha1()
+        base.update(np.asarray(panel.dates.asi8).tobytes())
+        base.update("\x1f".join(map(str, panel.symbols)).encode())
+        base.update(str(panel.attrs.get("adjust", "")).encode())
+        self.version = panel.attrs.get("data_version")
+        self.stored = frozenset()
+        if self.version is not None:
+            base.update(str(sorted(self.version.items())).encode())
+            self.stored = frozenset(panel.attrs.get("stored_fields", ()))
+        self._base = base.hexdigest()
+
+    def field(self, name: str) -> str:
+        """单个字段的哈希；取自存储的字段由数据版本确定，以字段名代替内容"""
+        if name not in self._fields:
+            if name in self.stored or name not in self.panel:
+                self._fields[name] = name
+            else:
+                values = np.ascontiguousarray(self.panel[name])
+                self._fields[name] = hashlib.sha1(memoryview(values).cast("B")).hexdigest()
+        return self._fields[name]
+
+    def of(self, fields: Iterable[str]) -> str:
+        """字段组合的指纹"""
+        digest = hashlib.sha1(self._base.encode())
+        for name in sorted(set(fields)):
+            digest.update(f"|{name}:{self.field(name)}".encode())
+        return digest.hexdigest()
+
+
+class FactorResultCache:
+    """磁盘上按大小预算 LRU 淘汰的因子结果缓存"""
+
+    def __init__(self, root: Path = None, max_bytes: int = None):
+        """
+        Args:
+            root: 缓存目录
+            max_bytes: 总大小上限，默认取配置 factor.result_cache_mb
+        """
+        self.root = Path(root) if root is not None else FACTOR_CACHE_DIR
+        self.root.mkdir(parents=True, exist_ok=True)
+        if max_bytes is None:
+            max_bytes = DEFAULT_CONFIG["factor"]["result_cache_mb"] * 1024 * 1024
+        self.max_bytes = max_bytes
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._bytes = sum(size for _, size, _ in self._scan())
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(fingerprint: str, definition: str) -> str:
+        return hashlib.sha1(f"{CACHE_FORMAT}|{fingerprint}|{definition}".encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.npy"
+
+    def _scan(self):
+        """全部缓存文件的 (路径, 大小, 修改时间)"""
+        for path in self.root.glob("*/*.npy"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            yield path, st.st_size, st.st_mtime_ns
+
+    def get(self, key: str, shape=None) -> Optional[np.ndarray]:
+        """读取缓存结果，不存在、损坏或形状不符时返回 None"""
+        path = self._path(key)
+        try:
+            values = np.load(path, allow_pickle=False)
+            os.utime(path)
+        except FileNotFoundError:
+            values = None
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"因子缓存 {key[:12]} 读取失败，已忽略: {str(e)[:50]}")
+            values = None
+        if values is not None and shape is not None and values.shape != tuple(shape):
+            values = None
+        with self._lock:
+            if values is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return values
+
+    def put(self, key: str, values: np.ndarray):
+        """写入缓存结果，超出预算时淘汰最久未使用的文件"""
+        size = values.nbytes + 128
+        if size > self.max_bytes:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.stem}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(values, dtype=np.float64))
+            os.replace(tmp, path)
+        except OSError as e:
+            self.logger.warning(f"因子缓存写入失败: {str(e)[:50]}")
+            tmp.unlink(missing_ok=True)
+            return
+        with self._lock:
+            self._bytes += path.stat().st_size
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """按修改时间从旧到新删除，直到总大小回到预算的 90% 以内"""
+        entries = sorted(self._scan(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            self.evictions += 1
+        self._bytes = total
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": sum(1 for _ in self._scan()),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            for path, _, _ in list(self._scan()):
+                path.unlink(missing_ok=True)
+            self._bytes = 0
+
+
+_factor_cache = None
+_factor_cache_lock = threading.Lock()
+
+
+def get_factor_cache() -> FactorResultCache:
+    """进程内共享的因子结果缓存"""
+    global _factor_cache
+    with _factor_cache_lock:
+        if _factor_cache is None:
+            _factor_cache = FactorResultCache()
+        return _factor_cache
@@ -3,42 +3,75 @@
 """
 
 import warnings
-from concurrent.futures import ThreadPoolExecutor
-from typing import List
+from typing import List, Optional, Union
 
+import numpy as np
 import pandas as pd
 
 warnings.filterwarnings("ignore")
 
+from .config import DEFAULT_CONFIG
+from .factor_engine import FactorEngine
 from .factor_lib import FactorLibrary
 from .logger import logger
+from .panel import MarketPanel
+from .preprocess import Preprocessor
 
 
 class FactorCalculator:
     """因子计算引擎"""
 
-    def __init__(self, max_workers: int = 4):
+    def __init__(
+        self, max_workers: int = 4, executor: str = None, processes: int = None, cache=None
+    ):
+        """
+        Args:
+            max_workers: 并行执行的计算图节点数
+            executor: thread 或 process，默认取配置 factor.executor
+            processes: process 模式的进程数，默认取配置 factor.processes
+            cache: 因子结果缓存（FactorResultCache），默认不缓存
+        """
         self.logger = logger
         self.max_workers = max_workers
         self.factor_library = FactorLibrary()
+        factor_config = DEFAULT_CONFIG["factor"]
+        self.engine = FactorEngine(
+            self.factor_library,
+            max_workers=max_workers,
+            executor=executor or factor_config["executor"],
+            processes=processes or factor_config["processes"],
+            cache=cache,
+        )
+
+    def compute_panel_factor(self, panel: MarketPanel, factor_name: str) -> Optional[np.ndarray]:
+        """
+        在面板上计算单个因子，返回 (日期, 股票) 数组，因子不存在或计算失败返回None
+
+        因子按列（股票）做时序运算，停牌等缺失日期为 NaN，覆盖缺失日期的窗口结果为 NaN。
+        窗口按面板日历（全部股票交易日的并集）计数，不跳过停牌日：停牌前后的行情不会落入
+        同一个窗口，停牌结束后约 window 个交易日内的滚动结果为 NaN；流式计算与此一致。
+        """
+        block = self.engine.compute(panel, [factor_name])
+        return block[factor_name] if block.computed else None
 
     def calculate_single_factor(
-        self, data: pd.DataFrame, factor_name: str, groupby_col: str = "symbol"
+        self, data: Union[pd.DataFrame, MarketPanel], factor_name: str, groupby_col: str = "symbol"
     ) -> pd.DataFrame:
-        """计算单个因子"""
+        """计算单个因子，返回 [symbol, date, 因子] 长表"""
         try:
-            result = data.groupby(groupby_col).apply(
-                lambda x: self.factor_library.calculate_factor(factor_name, x)
+            panel = (
+                data
+                if isinstance(data, MarketPanel)
+                else MarketPanel.from_long(data, symbol_col=groupby_col)
             )
+            values = self.compute_panel_factor(panel, factor_name)
+            if values is None:
+                return pd.DataFrame()
 
-            if isinstance(result, pd.Series):
-                result = result.reset_index()
-                result.columns = [groupby_col, "date", factor_name]
-            else:
-                result = result.reset_index()
-                result.columns = [groupby_col, "date", factor_name]
-
-            return result
+            factor_panel = panel.select([])
+            factor_panel[factor_name] = values
+            result = factor_panel.to_long()
+            return result[["symbol", "date", factor_name]].rename(columns={"symbol": groupby_col})
 
         except Exception as e:
             self.logger.error(f"计算因子 {factor_name} 失败: {str(e)}")
@@ -46,56 +79,46 @@ class FactorCalculator:
 
     def calculate_factors(
         self,
-        data: pd.DataFrame,
+        data: Union[pd.DataFrame, MarketPanel],
         factor_names: List[str],
         groupby_col: str = "symbol",
         parallel: bool = True,
-    ) -> pd.DataFrame:
-        """批量计算因子"""
+        preprocessor: Preprocessor = None,
+    ) -> Union[pd.DataFrame, MarketPanel]:
+        """
+        批量计算因子
+
+        全部因子由 FactorEngine 写入同一个预分配的输出块。data 为 MarketPanel 时
+        返回添加了因子字段的新面板（行情数组共享），为长表时返回添加了因子列的长表。
+        提供 preprocessor 时因子值先经截面预处理（去极值、中性化、标准化）再返回。
+        """
         if not factor_names:
             return data
 
-        if parallel and len(factor_names) > 1:
-            with ThreadPoolExecutor(
-                max_workers=min(self.max_workers, len(factor_names))
-            ) as executor:
-                futures = []
-                for factor_name in factor_names:
-                    future = executor.submit(
-                        self.calculate_single_factor, data.copy(), factor_name, groupby_col
-                    )
-                    futures.append((factor_name, future))
-
-                results = []
-                for factor_name, future in futures:
-                    try:
-                        result = future.result()
-                        if not result.empty:
-                            results.append(result)
-                    except Exception as e:
-                        self.logger.error(f"计算 {factor_name} 失败: {str(e)}")
-
-            if results:
-                # 合并结果
-                final_result = data.copy()
-                for result in results:
-                    factor_name = result.columns[-1]
-                    final_result = final_result.merge(result, on=[groupby_col, "date"], how="left")
-                return final_result
-            return data
-
-        else:
-            # 顺序计算
-            result = data.copy()
-            for factor_name in factor_names:
-                factor_data = self.calculate_single_factor(data, factor_name, groupby_col)
-                if not factor_data.empty:
-                    factor_name_col = factor_data.columns[-1]
-                    result = result.merge(factor_data, on=[groupby_col, "date"], how="left")
-
-            return result
-
-    def calculate_all_technical_factors(self, data: pd.DataFrame) -> pd.DataFrame:
+        panel = (
+            data
+            if isinstance(data, MarketPanel)
+            else MarketPanel.from_long(data, symbol_col=groupby_col)
+        )
+        engine = self.engine if parallel else FactorEngine(self.factor_library, max_workers=1)
+        block = engine.compute(panel, factor_names)
+        if preprocessor is not None:
+            preprocessor.apply(block, panel)
+
+        if isinstance(data, MarketPanel):
+            return block.to_panel(panel)
+
+        # 按 (日期, 股票) 编码一次性取回全部因子值
+        result = data.copy()
+        if block.computed:
+            date_codes, symbol_codes = panel.locate(result, symbol_col=groupby_col)
+            for name in block.computed:
+                result[name] = block[name][date_codes, symbol_codes]
+        return result
+
+    def calculate_all_technical_factors(
+        self, data: Union[pd.DataFrame, MarketPanel]
+    ) -> Union[pd.DataFrame, MarketPanel]:
         """计算所有常用技术因子"""
         factors = [
             "ma5",
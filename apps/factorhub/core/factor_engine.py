@@ -0,0 +1,380 @@
+"""
+向量化因子引擎
+
+在 MarketPanel 的 (日期, 股票) 数组上一次性计算全部股票的因子：
+每个因子沿时间轴做数组运算，没有逐股票的 Python 循环，也没有按 (symbol, date) 的合并，
+结果直接写入一个预分配的 (因子, 日期, 股票) 输出块。
+一次请求的全部因子合并为一张计算图（见 factor_graph），相同的中间结果只计算一次。
+
+executor="process" 时行情面板只写入共享内存一次，各进程按股票区间挂载同一块内存计算，
+结果直接写回共享输出数组，任务之间不复制数据集。
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .expression import compile_expressions, fields_of
+from .factor_cache import PanelFingerprint, factor_definition
+from .factor_graph import FactorGraph
+from .factor_lib import FactorLibrary
+from .logger import logger
+from .panel import MarketPanel
+
+
+class FactorBlock:
+    """预分配的因子输出块，values 形状为 (因子, 日期, 股票)"""
+
+    def __init__(self, names: List[str], dates, symbols, values: np.ndarray = None):
+        self.names = list(dict.fromkeys(names))
+        self.dates = pd.DatetimeIndex(dates)
+        self.symbols = pd.Index(symbols, dtype=object)
+        shape = (len(self.names), len(self.dates), len(self.symbols))
+        if values is None:
+            values = np.full(shape, np.nan)
+        elif values.shape != shape:
+            raise ValueError(f"输出块形状 {values.shape} 与 {shape} 不一致")
+        self.values = values
+        self._index = {name: k for k, name in enumerate(self.names)}
+        self.computed: List[str] = []
+        self.graph_stats: Dict = {}
+        self.errors: Dict[str, str] = {}
+        self.cache_hits: List[str] = []
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._index
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.values[self._index[name]]
+
+    @classmethod
+    def for_panel(cls, panel: MarketPanel, names: List[str]) -> "FactorBlock":
+        return cls(names, panel.dates, panel.symbols)
+
+    def to_panel(self, panel: MarketPanel = None) -> MarketPanel:
+        """将计算成功的因子作为字段加入面板（共享数组），未提供面板时新建"""
+        if panel is None:
+            panel = MarketPanel(self.dates, self.symbols, {})
+        else:
+            panel = panel.select(list(panel.fields))
+        for name in self.computed:
+            panel[name] = self[name]
+        return panel
+
+
+class FactorEngine:
+    """向量化因子引擎"""
+
+    def __init__(
+        self,
+        library: FactorLibrary = None,
+        max_workers: int = 1,
+        executor: str = "thread",
+        processes: int = None,
+        cache=None,
+    ):
+        """
+        Args:
+            library: 因子库
+            max_workers: 并行执行的计算图节点数，数组运算释放 GIL，多线程可叠加
+            executor: thread 在当前进程内计算；process 将面板放入共享内存，
+                按股票分片交给进程池计算（进程内使用默认因子库）
+            processes: 进程数，默认 CPU 核数
+            cache: 因子结果缓存（FactorResultCache），命中的因子直接读取不再计算
+        """
+        self.logger = logger
+        self.library = library if library is not None else FactorLibrary()
+        self.max_workers = max_workers
+        self.executor = executor
+        self.processes = processes or os.cpu_count() or 1
+        self.cache = cache
+
+    def compute(
+        self,
+        panel: MarketPanel,
+        factor_names: List[str],
+        out: Optional[FactorBlock] = None,
+    ) -> FactorBlock:
+        """
+        计算因子并写入输出块
+
+        时序运算按面板日期计数窗口，缺失（停牌）日期为 NaN，见 FactorCalculator.compute_panel_factor。
+
+        Args:
+            panel: 行情面板
+            factor_names: 因子名称列表
+            out: 预分配的输出块，默认按面板形状新建；不存在或计算失败的因子保持 NaN
+        """
+        if out is None:
+            out = FactorBlock.for_panel(panel, factor_names)
+        names = [name for name in dict.fromkeys(factor_names) if name in out]
+
+        keys = {}
+        if self.cache is not None:
+            definitions = {}
+            for name in names:
+                factor = self.library.get_factor(name)
+                if factor is not None:
+                    node = factor.graph()
+                    fields = fields_of(node) if node is not None else list(panel.fields)
+                    definitions[name] = (factor_definition(factor), fields)
+            keys = self._cache_keys(panel, definitions)
+        hits = self._load_cached(panel, out, keys)
+        pending = [name for name in names if name not in hits]
+
+        shards = min(self.processes, len(panel.symbols))
+        if not pending:
+            computed, out.graph_stats = set(), {}
+        elif self.executor == "process" and shards > 1:
+            computed = self._compute_in_processes(panel, pending, out, shards)
+        else:
+            computed, out.graph_stats = self._compute_fields(
+                panel.fields, pending, {name: out[name] for name in pending}
+            )
+        self._store_cached(out, keys, computed)
+        computed = set(computed) | set(hits)
+
+        for name in names:
+            if name not in computed:
+                out[name][:] = np.nan
+        out.computed = [name for name in names if name in computed]
+        return out
+
+    def compute_expressions(
+        self,
+        panel: MarketPanel,
+        expressions: List[str],
+        out: Optional[FactorBlock] = None,
+        compiled: Optional[Tuple[FactorGraph, Dict[str, str]]] = None,
+    ) -> FactorBlock:
+        """
+        计算一批因子表达式（见 expression），输出块以表达式文本为因子名
+
+        全部表达式编译为一张计算图，公共子表达式只计算一次。解析失败或引用了面板中
+        不存在字段的表达式记录在 out.errors 中，结果保持 NaN。
+
+        Args:
+            compiled: 调用方已按 self.library 编译好的 compile_expressions 结果，避免重复编译
+        """
+        expressions = list(dict.fromkeys(expressions))
+        if out is None:
+            out = FactorBlock.for_panel(panel, expressions)
+        if compiled is None:
+            compiled = compile_expressions(expressions, self.library)
+        graph, errors = compiled[0], dict(compiled[1])
+
+        outputs = {}
+        for name, node in graph.outputs.items():
+            missing = sorted(set(fields_of(node)) - set(panel.fields))
+            if missing:
+                errors[name] = f"面板中缺少字段: {', '.join(missing)}"
+            else:
+                outputs[name] = node
+
+        keys = {}
+        if self.cache is not None:
+            keys = self._cache_keys(
+                panel, {name: (repr(node), fields_of(node)) for name, node in outputs.items()}
+            )
+        hits = self._load_cached(panel, out, keys)
+        outputs = {name: node for name, node in outputs.items() if name not in hits}
+
+        computed = set()
+        out.graph_stats = {}
+        if outputs:
+            graph = FactorGraph(outputs)
+            results = graph.run(
+                panel.fields, {name: out[name] for name in outputs}, self.max_workers
+            )
+            computed = {name for name, value in results.items() if value is not None}
+            out.graph_stats = graph.stats()
+            for name in outputs:
+                if name not in computed:
+                    errors[name] = "计算失败"
+            self._store_cached(out, keys, computed)
+        computed |= set(hits)
+
+        for name in expressions:
+            if name not in computed:
+                out[name][:] = np.nan
+        out.computed = [name for name in expressions if name in computed]
+        out.errors = errors
+        return out
+
+    def compute_family(self, panel: MarketPanel, family: str, windows: List[int]):
+        """
+        一次计算一族不同窗口的因子（见 factor_family），返回 (窗口, 日期, 股票) 的 FamilyBlock
+
+        Args:
+            panel: 行情面板
+            family: 因子族，如 ma、momentum、roc、rsi
+            windows: 窗口列表
+        """
+        from .factor_family import FactorFamily
+
+        return FactorFamily(family, windows).compute(panel)
+
+    def _cache_keys(self, panel: MarketPanel, definitions: Dict[str, tuple]) -> Dict[str, str]:
+        """因子名 -> 缓存键；definitions 为 因子名 -> (因子定义, 用到的字段)"""
+        fingerprint = PanelFingerprint(panel)
+        return {
+            name: self.cache.key(fingerprint.of(fields), definition)
+            for name, (definition, fields) in definitions.items()
+        }
+
+    def _load_cached(self, panel: MarketPanel, out: FactorBlock, keys: Dict[str, str]) -> List[str]:
+        """读取命中缓存的因子写入输出块，返回命中的因子名"""
+        hits = []
+        for name, key in keys.items():
+            values = self.cache.get(key, panel.shape)
+            if values is not None:
+                out[name][:] = values
+                hits.append(name)
+        out.cache_hits = hits
+        return hits
+
+    def _store_cached(self, out: FactorBlock, keys: Dict[str, str], computed):
+        for name in computed:
+            if name in keys:
+                self.cache.put(keys[name], out[name])
+
+    def _compute_fields(
+        self, fields: Dict[str, np.ndarray], names: List[str], out: Dict[str, np.ndarray]
+    ):
+        """在给定的字段数组上计算因子，返回 (计算成功的因子集合, 计算图统计)"""
+        # 声明了计算图的因子合并为一张图，共享中间结果；其余因子单独计算
+        graph_outputs = {}
+        standalone = []
+        for name in names:
+            factor = self.library.get_factor(name)
+            if factor is None:
+                self.logger.warning(f"因子 {name} 不存在")
+                continue
+            node = factor.graph()
+            if node is not None:
+                graph_outputs[name] = node
+            else:
+                standalone.append((name, factor))
+
+        computed = set()
+        stats = {}
+        if graph_outputs:
+            graph = FactorGraph(graph_outputs)
+            results = graph.run(
+                fields, {name: out[name] for name in graph_outputs}, self.max_workers
+            )
+            computed.update(name for name, value in results.items() if value is not None)
+            stats = graph.stats()
+
+        for name, factor in standalone:
+            try:
+                factor.compute(fields, out=out[name])
+                computed.add(name)
+            except Exception as e:
+                self.logger.error(f"计算因子 {name} 失败: {str(e)}")
+        return computed, stats
+
+    def _compute_in_processes(
+        self, panel: MarketPanel, names: List[str], out: FactorBlock, shards: int
+    ) -> set:
+        """
+        进程池计算
+
+        行情字段一次性写入共享内存，输出块也分配在共享内存中；每个进程按股票区间
+        直接在共享数组的视图上计算并写回，任务参数只包含共享内存名称和区间。
+        """
+        field_names = list(panel.fields)
+        T, N = panel.shape
+        in_shape = (len(field_names), T, N)
+        out_shape = (len(names), T, N)
+        bounds = np.linspace(0, N, shards + 1).astype(int)
+
+        in_shm = shared_memory.SharedMemory(create=True, size=max(_nbytes(in_shape), 1))
+        out_shm = shared_memory.SharedMemory(create=True, size=max(_nbytes(out_shape), 1))
+        try:
+            inputs = np.ndarray(in_shape, dtype=np.float64, buffer=in_shm.buf)
+            for i, name in enumerate(field_names):
+                inputs[i] = panel.fields[name]
+            del inputs
+
+            context = _mp_context()
+            # fork 的子进程与父进程共用 resource_tracker，不能注销父进程的登记
+            untrack = context.get_start_method() != "fork"
+            tasks = [
+                (
+                    in_shm.name,
+                    in_shape,
+                    field_names,
+                    out_shm.name,
+                    out_shape,
+                    names,
+                    lo,
+                    hi,
+                    untrack,
+                )
+                for lo, hi in zip(bounds[:-1], bounds[1:])
+                if hi > lo
+            ]
+            computed = set(names)
+            with ProcessPoolExecutor(max_workers=len(tasks), mp_context=context) as pool:
+                for shard_computed in pool.map(_compute_shard, tasks):
+                    computed &= set(shard_computed)
+
+            results = np.ndarray(out_shape, dtype=np.float64, buffer=out_shm.buf)
+            for k, name in enumerate(names):
+                out[name][:] = results[k]
+            del results
+            out.graph_stats = {"shards": len(tasks)}
+            return computed
+        finally:
+            for shm in (in_shm, out_shm):
+                shm.close()
+                shm.unlink()
+
+
+def _nbytes(shape) -> int:
+    return int(np.prod(shape)) * np.dtype(np.float64).itemsize
+
+
+def _mp_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+
+
+def _attach(name: str, shape, untrack: bool) -> tuple:
+    """
+    在子进程中挂载共享内存（不复制数据）
+
+    共享内存由父进程负责释放。spawn 的子进程有自己的 resource_tracker，挂载时会登记，
+    退出时会误删共享内存，因此 untrack 为 True 时注销登记；fork 的子进程与父进程共用
+    resource_tracker，注销会删掉父进程自己的登记，须保留。
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    if untrack:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm, np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+
+def _compute_shard(task) -> List[str]:
+    """进程池任务：计算 [lo, hi) 区间股票的全部因子，写入共享输出数组"""
+    in_name, in_shape, field_names, out_name, out_shape, names, lo, hi, untrack = task
+    in_shm, inputs = _attach(in_name, in_shape, untrack)
+    try:
+        out_shm, outputs = _attach(out_name, out_shape, untrack)
+        try:
+            fields = {name: inputs[i, :, lo:hi] for i, name in enumerate(field_names)}
+            targets = {name: outputs[k, :, lo:hi] for k, name in enumerate(names)}
+            computed, _ = FactorEngine()._compute_fields(fields, names, targets)
+            return [name for name in names if name in computed]
+        finally:
+            # 释放对共享缓冲区的引用后才能关闭
+            fields = targets = outputs = None
+            out_shm.close()
+    finally:
+        inputs = None
+        in_shm.close()
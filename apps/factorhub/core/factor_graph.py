@@ -0,0 +1,417 @@
+"""
+因子计算图
+
+因子由节点表达式声明，例如 BOLL 上轨为 rolling_mean(close, 20) + 2 * rolling_std(close, 20)。
+节点按 (运算, 输入, 参数) 判等，多个因子中相同的子表达式是同一个节点，
+一次请求中每个中间结果只计算一次：ma20、boll_upper、boll_lower 共享同一个 20 日均值，
+volume_ratio 与 volume_ma20 共享同一个 20 日均量。
+
+FactorGraph 按依赖关系调度节点，互不依赖的节点在线程池中并行执行
+（数组运算释放 GIL），中间结果在最后一个使用者完成后立即释放。
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import kernels
+from .logger import logger
+
+
+class Node:
+    """计算图节点，按 (op, inputs, params) 判等"""
+
+    __slots__ = ("op", "inputs", "params", "_hash")
+
+    def __init__(self, op: str, inputs: Tuple["Node", ...] = (), params: Tuple = ()):
+        self.op = op
+        self.inputs = tuple(inputs)
+        self.params = tuple(params)
+        self._hash = hash((op, self.inputs, self.params))
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, Node)
+            and self._hash == other._hash
+            and self.op == other.op
+            and self.params == other.params
+            and self.inputs == other.inputs
+        )
+
+    def __repr__(self) -> str:
+        if self.op == "field":
+            return self.params[0]
+        if self.op == "const":
+            return repr(self.params[0])
+        args = [repr(n) for n in self.inputs] + [repr(p) for p in self.params]
+        return f"{self.op}({', '.join(args)})"
+
+    # 算术运算符，便于在因子中直接书写表达式
+    def __add__(self, other):
+        return binary("add", self, other)
+
+    def __radd__(self, other):
+        return binary("add", other, self)
+
+    def __sub__(self, other):
+        return binary("sub", self, other)
+
+    def __rsub__(self, other):
+        return binary("sub", other, self)
+
+    def __mul__(self, other):
+        return binary("mul", self, other)
+
+    def __rmul__(self, other):
+        return binary("mul", other, self)
+
+    def __truediv__(self, other):
+        return binary("div", self, other)
+
+    def __rtruediv__(self, other):
+        return binary("div", other, self)
+
+    def __neg__(self):
+        return Node("neg", (self,))
+
+    def __abs__(self):
+        return Node("abs", (self,))
+
+
+def _as_node(value) -> Node:
+    return value if isinstance(value, Node) else const(value)
+
+
+def field(name: str) -> Node:
+    """行情字段"""
+    return Node("field", (), (name,))
+
+
+def const(value: float) -> Node:
+    """常数"""
+    return Node("const", (), (float(value),))
+
+
+def binary(op: str, left, right) -> Node:
+    return Node(op, (_as_node(left), _as_node(right)))
+
+
+def unary(op: str, x: Node) -> Node:
+    return Node(op, (x,))
+
+
+def shift(x: Node, periods: int = 1) -> Node:
+    return Node("shift", (x,), (periods,))
+
+
+def diff(x: Node, periods: int = 1) -> Node:
+    return Node("diff", (x,), (periods,))
+
+
+def ffill(x: Node) -> Node:
+    return Node("ffill", (x,))
+
+
+def pct_change(x: Node, periods: int = 1) -> Node:
+    """变化率；各周期共享同一个向前填充节点"""
+    filled = ffill(x)
+    return filled / shift(filled, periods) - 1
+
+
+def rolling_mean(x: Node, window: int) -> Node:
+    return Node("rolling_mean", (x,), (window,))
+
+
+def rolling_std(x: Node, window: int) -> Node:
+    return Node("rolling_std", (x,), (window,))
+
+
+def rolling_max(x: Node, window: int) -> Node:
+    return Node("rolling_max", (x,), (window,))
+
+
+def rolling_min(x: Node, window: int) -> Node:
+    return Node("rolling_min", (x,), (window,))
+
+
+def rolling_rank(x: Node, window: int, pct: bool = False) -> Node:
+    return Node("rolling_rank", (x,), (window, pct))
+
+
+def decay_linear(x: Node, window: int) -> Node:
+    return Node("decay_linear", (x,), (window,))
+
+
+def ewm_mean(x: Node, span: int) -> Node:
+    return Node("ewm_mean", (x,), (span,))
+
+
+def fmax(a, b) -> Node:
+    return binary("fmax", a, b)
+
+
+def _binary_op(func):
+    def run(inputs, params, out):
+        a, b = inputs
+        if np.ndim(a) == 0 and np.ndim(b) == 0:
+            return func(a, b)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return func(a, b, out=out)
+
+    return run
+
+
+def _unary_op(func):
+    def run(inputs, params, out):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return func(inputs[0], out=out)
+
+    return run
+
+
+def _kernel_op(func):
+    def run(inputs, params, out):
+        return func(inputs[0], *params, out=out)
+
+    return run
+
+
+def _pos_part(x, out=None):
+    out = kernels.alloc(x, out)
+    # NaN 记为 0，与 Series.where(delta > 0, 0) 一致
+    np.copyto(out, np.where(x > 0, x, 0.0))
+    return out
+
+
+def _neg_part(x, out=None):
+    out = kernels.alloc(x, out)
+    np.copyto(out, np.where(x < 0, -x, 0.0))
+    return out
+
+
+def _cumsum_nan0(x, out=None):
+    out = kernels.alloc(x, out)
+    np.cumsum(np.nan_to_num(x, nan=0.0), axis=0, out=out)
+    return out
+
+
+def _ffill(inputs, params, out):
+    result = kernels.ffill(inputs[0])
+    if out is None:
+        return result
+    out[:] = result
+    return out
+
+
+# 运算名 -> 执行函数 run(inputs, params, out)
+OPS: Dict[str, Callable] = {
+    "add": _binary_op(np.add),
+    "sub": _binary_op(np.subtract),
+    "mul": _binary_op(np.multiply),
+    "div": _binary_op(np.divide),
+    "fmax": _binary_op(np.fmax),
+    "fmin": _binary_op(np.fmin),
+    "neg": _unary_op(np.negative),
+    "abs": _unary_op(np.abs),
+    "sign": _unary_op(np.sign),
+    "log": _unary_op(np.log),
+    "sqrt": _unary_op(np.sqrt),
+    "pos_part": _unary_op(_pos_part),
+    "neg_part": _unary_op(_neg_part),
+    "cumsum_nan0": _unary_op(_cumsum_nan0),
+    "ffill": _ffill,
+    "shift": _kernel_op(kernels.shift),
+    "diff": _kernel_op(kernels.diff),
+    "rolling_mean": _kernel_op(kernels.rolling_mean),
+    "rolling_std": _kernel_op(kernels.rolling_std),
+    "rolling_max": _kernel_op(kernels.rolling_max),
+    "rolling_min": _kernel_op(kernels.rolling_min),
+    "rolling_rank": _kernel_op(kernels.rolling_rank),
+    "decay_linear": _kernel_op(kernels.decay_linear),
+    "ewm_mean": _kernel_op(kernels.ewm_mean),
+    # 截面运算：作用于每个日期的全部股票
+    "cs_rank": _unary_op(kernels.cs_rank),
+    "cs_zscore": _unary_op(kernels.cs_zscore),
+    "cs_demean": _unary_op(kernels.cs_demean),
+}
+
+
+class FactorGraph:
+    """由多个因子输出节点组成的共享子表达式计算图"""
+
+    def __init__(self, outputs: Dict[str, Node]):
+        """
+        Args:
+            outputs: 因子名 -> 输出节点
+        """
+        self.logger = logger
+        self.outputs = dict(outputs)
+        self.order: List[Node] = []
+        self.consumers: Dict[Node, List[Node]] = {}
+        seen = set()
+
+        # 后序遍历得到拓扑序，相同节点只出现一次
+        def visit(root: Node):
+            stack = [(root, False)]
+            while stack:
+                node, expanded = stack.pop()
+                if expanded:
+                    self.order.append(node)
+                    continue
+                if node in seen:
+                    continue
+                seen.add(node)
+                stack.append((node, True))
+                for child in node.inputs:
+                    self.consumers.setdefault(child, [])
+                    if node not in self.consumers[child]:
+                        self.consumers[child].append(node)
+                    if child not in seen:
+                        stack.append((child, False))
+
+        for node in self.outputs.values():
+            visit(node)
+        self.executed = 0
+        self.peak_live = 0
+
+    def stats(self) -> Dict:
+        """去重后的计算节点数、不共享时需要计算的节点数，以及最近一次执行的统计"""
+
+        def tree_size(node: Node) -> int:
+            if node.op in ("field", "const"):
+                return 0
+            return 1 + sum(tree_size(child) for child in node.inputs)
+
+        computed = [n for n in self.order if n.op not in ("field", "const")]
+        return {
+            "nodes": len(computed),
+            "unshared_nodes": sum(tree_size(n) for n in self.outputs.values()),
+            "executed": self.executed,
+            "peak_live": self.peak_live,
+        }
+
+    def run(
+        self,
+        fields: Dict[str, np.ndarray],
+        out: Dict[str, np.ndarray] = None,
+        max_workers: int = 1,
+    ) -> Dict[str, Optional[np.ndarray]]:
+        """
+        执行计算图
+
+        Args:
+            fields: 字段名 -> (日期, 股票) 数组
+            out: 因子名 -> 预分配的输出数组，输出节点直接写入其中
+            max_workers: 并行执行的节点数
+
+        Returns:
+            因子名 -> 结果数组，计算失败的因子为 None
+        """
+        out = out or {}
+        # 输出节点写入第一个请求它的因子的输出数组
+        targets: Dict[Node, np.ndarray] = {}
+        for name, node in self.outputs.items():
+            if name in out and node not in targets and node.op not in ("field", "const"):
+                targets[node] = out[name]
+
+        pending = {n: len(set(n.inputs)) for n in self.order}
+        remaining_uses = {n: len(self.consumers.get(n, [])) for n in self.order}
+        output_nodes = set(self.outputs.values())
+        results: Dict[Node, object] = {}
+        failed = set()
+        self.executed = 0
+        self.peak_live = 0
+
+        def execute(node: Node):
+            if node.op == "field":
+                return fields[node.params[0]]
+            if node.op == "const":
+                return node.params[0]
+            inputs = [results[child] for child in node.inputs]
+            return OPS[node.op](inputs, node.params, targets.get(node))
+
+        def release_inputs(node: Node):
+            # 最后一个使用者完成后释放中间结果（行情字段与因子输出保留）
+            for child in set(node.inputs):
+                remaining_uses[child] -= 1
+                if remaining_uses[child] == 0 and child not in output_nodes and child.op != "field":
+                    results.pop(child, None)
+
+        ready = [n for n in self.order if pending[n] == 0]
+        done_count = 0
+
+        def complete(node: Node, value=None, error: Exception = None):
+            nonlocal done_count
+            done_count += 1
+            if error is not None or any(child in failed for child in node.inputs):
+                failed.add(node)
+                if error is not None:
+                    self.logger.error(f"计算节点 {node!r} 失败: {str(error)}")
+            else:
+                results[node] = value
+                if node.op not in ("field", "const"):
+                    self.executed += 1
+            release_inputs(node)
+            live = sum(1 for n, v in results.items() if isinstance(v, np.ndarray))
+            self.peak_live = max(self.peak_live, live)
+            for consumer in self.consumers.get(node, []):
+                pending[consumer] -= 1
+                if pending[consumer] == 0:
+                    ready.append(consumer)
+
+        if max_workers <= 1:
+            while ready:
+                node = ready.pop()
+                if any(child in failed for child in node.inputs):
+                    complete(node)
+                    continue
+                try:
+                    complete(node, execute(node))
+                except Exception as e:
+                    complete(node, error=e)
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                running = {}
+                while ready or running:
+                    while ready:
+                        node = ready.pop()
+                        if any(child in failed for child in node.inputs):
+                            complete(node)
+                            continue
+                        running[executor.submit(execute, node)] = node
+                    if not running:
+                        continue
+                    finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        node = running.pop(future)
+                        try:
+                            complete(node, future.result())
+                        except Exception as e:
+                            complete(node, error=e)
+
+        outcome: Dict[str, Optional[np.ndarray]] = {}
+        for name, node in self.outputs.items():
+            if node in failed:
+                outcome[name] = None
+                continue
+            value = results[node]
+            target = out.get(name)
+            if target is not None and value is not target:
+                # 与其他因子共享输出节点、或直接引用字段/常数时复制到自己的输出数组
+                target[:] = value
+                value = target
+            outcome[name] = value
+        return outcome
+
+
+def evaluate(node: Node, fields: Dict[str, np.ndarray], out: np.ndarray = None) -> np.ndarray:
+    """计算单个节点表达式"""
+    result = FactorGraph({"value": node}).run(fields, {"value": out} if out is not None else None)
+    value = result["value"]
+    if value is None:
+        raise ValueError(f"计算 {node!r} 失败")
+    return value
@@ -5,8 +5,10 @@
 from abc import ABC, abstractmethod
 from typing import Dict, List, Optional
 
+import numpy as np
 import pandas as pd
 
+from . import factor_graph as fg
 from .config import PRESET_FACTORS
 from .logger import logger
 
@@ -20,9 +22,57 @@ class BaseFactor(ABC):
 
     @abstractmethod
     def calculate(self, data: pd.DataFrame) -> pd.Series:
-        """计算因子值"""
+        """
+        计算因子值
+
+        Args:
+            data: 单只股票的行情 DataFrame，或 字段 -> 日期×股票 宽表 的映射（MarketPanel.frames()），
+                后者按列做时序运算，返回同形状的宽表
+        """
         pass
 
+    def graph(self) -> Optional[fg.Node]:
+        """
+        因子的计算图输出节点
+
+        子类用 factor_graph 中的节点声明计算过程，多个因子的相同中间结果在同一请求中只计算一次；
+        返回 None 时 compute 退化为在宽表上调用 calculate。
+        """
+        return None
+
+    def streaming(self, symbols):
+        """
+        因子的在线状态（StreamingFactors），逐日追加行情即可更新因子值
+
+        Args:
+            symbols: 股票代码
+        """
+        from .streaming import StreamingFactors
+
+        node = self.graph()
+        if node is None:
+            raise ValueError(f"因子 {self.name} 未声明计算图，不支持流式计算")
+        return StreamingFactors({self.name: node}, symbols)
+
+    def compute(self, fields: Dict[str, np.ndarray], out: np.ndarray = None) -> np.ndarray:
+        """
+        在 (日期, 股票) 数组上计算因子，结果写入 out
+
+        Args:
+            fields: 字段名 -> (日期, 股票) 数组
+            out: 预分配的输出数组，默认新建
+        """
+        node = self.graph()
+        if node is not None:
+            return fg.evaluate(node, fields, out)
+
+        frames = {name: pd.DataFrame(values, copy=False) for name, values in fields.items()}
+        result = np.asarray(self.calculate(frames), dtype=float)
+        if out is None:
+            return result
+        out[:] = result
+        return out
+
 
 class TrendFactor(BaseFactor):
     """趋势类因子"""
@@ -35,6 +85,24 @@ class TrendFactor(BaseFactor):
         """计算移动平均因子"""
         return data["close"].rolling(self.ma_period).mean()
 
+    def graph(self):
+        return fg.rolling_mean(fg.field("close"), self.ma_period)
+
+
+class EMAFactor(BaseFactor):
+    """指数移动平均因子"""
+
+    def __init__(self, name: str, description: str, span: int):
+        super().__init__(name, description)
+        self.span = span
+
+    def calculate(self, data: pd.DataFrame) -> pd.Series:
+        """计算指数移动平均"""
+        return data["close"].ewm(span=self.span, adjust=False).mean()
+
+    def graph(self):
+        return fg.ewm_mean(fg.field("close"), self.span)
+
 
 class MomentumFactor(BaseFactor):
     """动量类因子"""
@@ -47,6 +115,24 @@ class MomentumFactor(BaseFactor):
         """计算动量因子"""
         return data["close"].pct_change(self.period)
 
+    def graph(self):
+        return fg.pct_change(fg.field("close"), self.period)
+
+
+class VolatilityFactor(BaseFactor):
+    """波动率因子（日收益率滚动标准差）"""
+
+    def __init__(self, name: str, description: str, period: int = 20):
+        super().__init__(name, description)
+        self.period = period
+
+    def calculate(self, data: pd.DataFrame) -> pd.Series:
+        """计算波动率"""
+        return data["close"].pct_change().rolling(self.period).std()
+
+    def graph(self):
+        return fg.rolling_std(fg.pct_change(fg.field("close"), 1), self.period)
+
 
 class RSI(BaseFactor):
     """相对强弱指标"""
@@ -64,6 +150,12 @@ class RSI(BaseFactor):
         rsi = 100 - (100 / (1 + rs))
         return rsi
 
+    def graph(self):
+        delta = fg.diff(fg.field("close"))
+        gain = fg.rolling_mean(fg.unary("pos_part", delta), self.period)
+        loss = fg.rolling_mean(fg.unary("neg_part", delta), self.period)
+        return 100 - 100 / (1 + gain / loss)
+
 
 class MACD(BaseFactor):
     """MACD指标"""
@@ -90,19 +182,32 @@ class MACD(BaseFactor):
         macd = 2 * (dif - dea)
         return macd
 
+    def graph(self):
+        close = fg.field("close")
+        dif = fg.ewm_mean(close, self.fast) - fg.ewm_mean(close, self.slow)
+        dea = fg.ewm_mean(dif, self.signal)
+        return 2 * (dif - dea)
+
 
 class BollingerBand(BaseFactor):
     """布林带"""
 
     def __init__(
-        self, name: str = "BOLL", description: str = "布林带", period: int = 20, std_dev: int = 2
+        self,
+        name: str = "BOLL",
+        description: str = "布林带",
+        period: int = 20,
+        std_dev: int = 2,
+        band: str = "mid",
     ):
         super().__init__(name, description)
         self.period = period
         self.std_dev = std_dev
+        self.band = band
 
-    def calculate(self, data: pd.DataFrame, band: str = "mid") -> pd.Series:
+    def calculate(self, data: pd.DataFrame, band: str = None) -> pd.Series:
         """计算布林带"""
+        band = band or self.band
         ma = data["close"].rolling(self.period).mean()
         std = data["close"].rolling(self.period).std()
 
@@ -113,6 +218,15 @@ class BollingerBand(BaseFactor):
         else:
             return ma
 
+    def graph(self):
+        close = fg.field("close")
+        ma = fg.rolling_mean(close, self.period)
+        if self.band == "upper":
+            return ma + self.std_dev * fg.rolling_std(close, self.period)
+        if self.band == "lower":
+            return ma - self.std_dev * fg.rolling_std(close, self.period)
+        return ma
+
 
 class ATR(BaseFactor):
     """真实波动幅度均值"""
@@ -127,22 +241,65 @@ class ATR(BaseFactor):
         high_close = abs(data["high"] - data["close"].shift())
         low_close = abs(data["low"] - data["close"].shift())
 
-        tr = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
+        # 逐元素取最大值，data 为单只股票或 日期×股票 宽表时均适用
+        tr = np.fmax(np.fmax(high_low, high_close), low_close)
         atr = tr.rolling(window=self.period).mean()
         return atr
 
+    def graph(self):
+        high, low = fg.field("high"), fg.field("low")
+        prev_close = fg.shift(fg.field("close"))
+        tr = fg.fmax(fg.fmax(high - low, abs(high - prev_close)), abs(low - prev_close))
+        return fg.rolling_mean(tr, self.period)
+
 
 class VolumeFactor(BaseFactor):
     """成交量因子"""
 
-    def __init__(self, name: str = "VOL", description: str = "成交量因子"):
+    def __init__(self, name: str = "VOL", description: str = "成交量因子", period: int = 20):
         super().__init__(name, description)
+        self.period = period
 
     def calculate(self, data: pd.DataFrame) -> pd.Series:
         """计算成交量因子"""
-        volume_ma = data["volume"].rolling(20).mean()
+        volume_ma = data["volume"].rolling(self.period).mean()
         return (data["volume"] - volume_ma) / volume_ma
 
+    def graph(self):
+        volume = fg.field("volume")
+        volume_ma = fg.rolling_mean(volume, self.period)
+        return (volume - volume_ma) / volume_ma
+
+
+class VolumeMAFactor(BaseFactor):
+    """均量因子"""
+
+    def __init__(self, name: str, description: str, period: int = 20):
+        super().__init__(name, description)
+        self.period = period
+
+    def calculate(self, data: pd.DataFrame) -> pd.Series:
+        """计算成交量移动平均"""
+        return data["volume"].rolling(self.period).mean()
+
+    def graph(self):
+        return fg.rolling_mean(fg.field("volume"), self.period)
+
+
+class OBV(BaseFactor):
+    """能量潮"""
+
+    def __init__(self, name: str = "OBV", description: str = "能量潮"):
+        super().__init__(name, description)
+
+    def calculate(self, data: pd.DataFrame) -> pd.Series:
+        """计算OBV：按收盘价涨跌方向累计成交量"""
+        return (np.sign(data["close"].diff()) * data["volume"]).fillna(0).cumsum()
+
+    def graph(self):
+        direction = fg.unary("sign", fg.diff(fg.field("close")))
+        return fg.unary("cumsum_nan0", direction * fg.field("volume"))
+
 
 class ROC(BaseFactor):
     """变动率指标"""
@@ -159,6 +316,11 @@ class ROC(BaseFactor):
             * 100
         )
 
+    def graph(self):
+        close = fg.field("close")
+        previous = fg.shift(close, self.period)
+        return (close - previous) / previous * 100
+
 
 class WilliamsR(BaseFactor):
     """威廉指标"""
@@ -174,6 +336,26 @@ class WilliamsR(BaseFactor):
         williams_r = -100 * (highest_high - data["close"]) / (highest_high - lowest_low)
         return williams_r
 
+    def graph(self):
+        highest_high = fg.rolling_max(fg.field("high"), self.period)
+        lowest_low = fg.rolling_min(fg.field("low"), self.period)
+        return -100 * (highest_high - fg.field("close")) / (highest_high - lowest_low)
+
+
+class ValuationFactor(BaseFactor):
+    """估值因子，直接取面板中的估值字段（由 AKShareDataProvider.add_valuation 加入）"""
+
+    def __init__(self, name: str, description: str, field: str):
+        super().__init__(name, description)
+        self.field = field
+
+    def calculate(self, data: pd.DataFrame) -> pd.Series:
+        """取估值字段"""
+        return data[self.field]
+
+    def graph(self):
+        return fg.field(self.field)
+
 
 class FactorLibrary:
     """因子库"""
@@ -202,22 +384,30 @@ class FactorLibrary:
             "ma10": lambda: TrendFactor("MA10", "10日移动平均", 10),
             "ma20": lambda: TrendFactor("MA20", "20日移动平均", 20),
             "ma60": lambda: TrendFactor("MA60", "60日移动平均", 60),
+            "ema5": lambda: EMAFactor("EMA5", "5日指数移动平均", 5),
+            "ema10": lambda: EMAFactor("EMA10", "10日指数移动平均", 10),
+            "ema20": lambda: EMAFactor("EMA20", "20日指数移动平均", 20),
             "rsi": lambda: RSI("RSI", "相对强弱指标", 14),
             "macd": lambda: MACD("MACD", "MACD指标"),
-            "boll_upper": lambda: BollingerBand("BOLL_UPPER", "布林线上轨").calculate(
-                data, "upper"
-            ),
-            "boll_lower": lambda: BollingerBand("BOLL_LOWER", "布林线下轨").calculate(
-                data, "lower"
-            ),
+            "boll_upper": lambda: BollingerBand("BOLL_UPPER", "布林线上轨", band="upper"),
+            "boll_lower": lambda: BollingerBand("BOLL_LOWER", "布林线下轨", band="lower"),
             "atr": lambda: ATR("ATR", "真实波动幅度均值", 14),
+            "obv": lambda: OBV("OBV", "能量潮"),
             "volume_ratio": lambda: VolumeFactor("VR", "量比"),
+            "volume_ma5": lambda: VolumeMAFactor("VOL_MA5", "5日均量", 5),
+            "volume_ma20": lambda: VolumeMAFactor("VOL_MA20", "20日均量", 20),
+            "volatility_20": lambda: VolatilityFactor("VOL_20", "20日波动率", 20),
+            "volatility_60": lambda: VolatilityFactor("VOL_60", "60日波动率", 60),
             "momentum_1m": lambda: MomentumFactor("MOM_1M", "1个月动量", 20),
             "momentum_3m": lambda: MomentumFactor("MOM_3M", "3个月动量", 60),
             "momentum_6m": lambda: MomentumFactor("MOM_6M", "6个月动量", 120),
             "momentum_12m": lambda: MomentumFactor("MOM_12M", "12个月动量", 240),
             "roc": lambda: ROC("ROC", "变动率指标", 12),
             "williams_r": lambda: WilliamsR("Williams%R", "威廉指标", 14),
+            "pe": lambda: ValuationFactor("PE", "市盈率(TTM)", "pe"),
+            "pb": lambda: ValuationFactor("PB", "市净率", "pb"),
+            "ps": lambda: ValuationFactor("PS", "市销率", "ps"),
+            "pcf": lambda: ValuationFactor("PCF", "现金流倍率", "pcf"),
         }
 
         if factor_name in factor_map:
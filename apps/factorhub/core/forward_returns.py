@@ -0,0 +1,151 @@
+"""
+未来收益面板
+
+IC、分层分析和回测使用的收益必须是因子观测日之后的收益；行情中的 return_1d 是
+当日相对前一日的收益，与当日因子相关即为前视偏差。这里按持有期一次生成移位后的
+收益面板，加入行情面板供各分析阶段直接引用，不再各自由价格推导：
+
+    close  收盘价买入、持有 h 日后收盘价卖出   close[t+h] / close[t] - 1
+    open   次日开盘价买入、持有 h 日后开盘价卖出 open[t+1+h] / open[t+1] - 1
+
+字段名为 fwd_{价格}_{持有期}，如 fwd_close_5。起止价格任一缺失（停牌、未上市）时为 NaN，
+末尾不足持有期的日期为 NaN。
+
+结果按面板指纹（股票、日期、复权方式与各分区的存储版本，见 factor_cache）缓存在
+行情存储旁的 forward_returns 目录，同一份数据只计算一次，行情更新后自动失效。
+"""
+
+import threading
+from typing import List
+
+import numpy as np
+
+from .config import DEFAULT_CONFIG, FORWARD_RETURNS_DIR
+from .factor_cache import FactorResultCache, PanelFingerprint
+from .logger import logger
+from .panel import MarketPanel
+
+FORWARD_PRICES = ["close", "open"]
+
+
+def forward_return_name(horizon: int, price: str = "close") -> str:
+    """未来收益字段名"""
+    return f"fwd_{price}_{int(horizon)}"
+
+
+def parse_forward_return_name(name: str):
+    """字段名 -> (价格, 持有期)，不是未来收益字段返回 None"""
+    parts = name.split("_")
+    if len(parts) != 3 or parts[0] != "fwd" or parts[1] not in FORWARD_PRICES:
+        return None
+    if not parts[2].isdigit() or int(parts[2]) < 1:
+        return None
+    return parts[1], int(parts[2])
+
+
+def forward_return(prices: np.ndarray, horizon: int, price: str = "close") -> np.ndarray:
+    """
+    单个持有期的 (日期, 股票) 未来收益
+
+    Args:
+        prices: (日期, 股票) 价格数组
+        horizon: 持有期（交易日）
+        price: close 为当日收盘买入，open 为次日开盘买入
+    """
+    lag = 1 if price == "open" else 0
+    out = np.full(prices.shape, np.nan)
+    n = len(prices) - lag - horizon
+    if n > 0:
+        buy = prices[lag : lag + n]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            np.divide(prices[lag + horizon : lag + horizon + n], buy, out=out[:n])
+        out[:n] -= 1
+    return out
+
+
+class ForwardReturns:
+    """按持有期生成并缓存未来收益面板"""
+
+    def __init__(self, horizons: List[int] = None, cache: FactorResultCache = None):
+        """
+        Args:
+            horizons: 默认持有期，默认取配置 analysis.forward_horizons
+            cache: 结果缓存，None 不缓存
+        """
+        self.logger = logger
+        self.horizons = list(horizons or DEFAULT_CONFIG["analysis"]["forward_horizons"])
+        self.cache = cache
+
+    def attach(
+        self, panel: MarketPanel, horizons: List[int] = None, prices: List[str] = None
+    ) -> MarketPanel:
+        """
+        将未来收益字段加入面板，面板中已有的字段不重复计算
+
+        Args:
+            panel: 行情面板，须包含所用的价格字段
+            horizons: 持有期，默认 self.horizons
+            prices: 价格口径 close / open，默认两者中面板包含的
+        """
+        horizons = sorted(set(horizons or self.horizons))
+        if prices is None:
+            prices = [price for price in FORWARD_PRICES if price in panel]
+        fingerprint = None
+        for price in prices:
+            if price not in FORWARD_PRICES:
+                raise ValueError(f"未知价格口径 {price}，可选: {', '.join(FORWARD_PRICES)}")
+            if price not in panel:
+                raise KeyError(f"面板缺少价格字段 {price}")
+            for horizon in horizons:
+                name = forward_return_name(horizon, price)
+                if name in panel:
+                    continue
+                if self.cache is not None and fingerprint is None:
+                    fingerprint = PanelFingerprint(panel)
+                panel[name] = self._compute(panel, fingerprint, horizon, price)
+        return panel
+
+    def _compute(self, panel: MarketPanel, fingerprint, horizon: int, price: str) -> np.ndarray:
+        if self.cache is None:
+            return forward_return(panel[price], horizon, price)
+        key = self.cache.key(fingerprint.of([price]), f"forward_return({price}, {horizon})")
+        values = self.cache.get(key, panel.shape)
+        if values is None:
+            values = forward_return(panel[price], horizon, price)
+            self.cache.put(key, values)
+        return values
+
+    def stack(
+        self, panel: MarketPanel, horizons: List[int] = None, price: str = "close"
+    ) -> np.ndarray:
+        """(持有期, 日期, 股票) 的未来收益数组，按需先加入面板"""
+        horizons = list(horizons or self.horizons)
+        self.attach(panel, horizons, [price])
+        return np.stack([panel[forward_return_name(h, price)] for h in horizons])
+
+    def ensure(self, panel: MarketPanel, names: List[str]) -> MarketPanel:
+        """面板中缺少的未来收益字段（按字段名解析口径与持有期）加入面板"""
+        for name in names:
+            parsed = parse_forward_return_name(name)
+            if parsed is not None and name not in panel and parsed[0] in panel:
+                self.attach(panel, [parsed[1]], [parsed[0]])
+        return panel
+
+
+_forward_returns = None
+_forward_returns_lock = threading.Lock()
+
+
+def get_forward_returns() -> ForwardReturns:
+    """进程内共享的未来收益服务，结果缓存在行情存储旁"""
+    global _forward_returns
+    with _forward_returns_lock:
+        if _forward_returns is None:
+            config = DEFAULT_CONFIG["analysis"]
+            cache = None
+            if config["forward_cache"]:
+                cache = FactorResultCache(
+                    FORWARD_RETURNS_DIR, config["forward_cache_mb"] * 1024 * 1024
+                )
+            _forward_returns = ForwardReturns(cache=cache)
+        return _forward_returns
@@ -0,0 +1,106 @@
+"""
+进程内行情数据帧缓存
+
+按 (symbol, adjust) 缓存完整分区的 DataFrame，受字节预算约束并按LRU淘汰。
+每个条目记录读取时的分区版本，磁盘数据变化后自动失效。
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+import pandas as pd
+
+from .config import DEFAULT_CONFIG
+from .logger import logger
+
+
+class FrameCache:
+    """字节预算受限的LRU数据帧缓存"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.logger = logger
+        self._entries: "OrderedDict[Hashable, Tuple[Hashable, pd.DataFrame, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[pd.DataFrame]:
+        """获取缓存数据帧，版本不一致视为失效"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] != version:
+                self._drop(key)
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, version: Hashable, df: pd.DataFrame):
+        """写入缓存，超出预算时淘汰最久未使用的条目"""
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (version, df, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        """删除指定条目"""
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+                self.invalidations += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _drop(self, key: Hashable):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict:
+        """命中、未命中与淘汰统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_mb": self._bytes / (1024 * 1024),
+                "max_size_mb": self.max_bytes / (1024 * 1024),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0,
+            }
+
+
+_frame_cache = None
+_frame_cache_lock = threading.Lock()
+
+
+def get_frame_cache() -> FrameCache:
+    """获取进程级共享的数据帧缓存"""
+    global _frame_cache
+    with _frame_cache_lock:
+        if _frame_cache is None:
+            max_mb = DEFAULT_CONFIG["data"]["frame_cache_mb"]
+            _frame_cache = FrameCache(max_mb * 1024 * 1024)
+        return _frame_cache
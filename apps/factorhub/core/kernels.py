@@ -0,0 +1,365 @@
+"""
+面板数组运算核
+
+所有函数作用于 (日期, 股票) 二维 float64 数组，沿时间轴（axis=0）计算，
+一次调用覆盖全部股票。NaN 语义与 pandas 对应的 rolling/ewm/shift 一致：
+窗口内任一值缺失则结果为 NaN。支持 out 参数时结果直接写入调用方预分配的数组。
+"""
+
+from typing import Optional
+
+import numpy as np
+
+
+def alloc(values: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """返回 out，未提供时按 values 的形状新建"""
+    if out is None:
+        return np.empty(values.shape, dtype=float)
+    return out
+
+
+def shift(values: np.ndarray, periods: int = 1, out: np.ndarray = None) -> np.ndarray:
+    """沿时间轴平移，空出的位置为 NaN"""
+    out = alloc(values, out)
+    if periods == 0:
+        out[:] = values
+    elif periods > 0:
+        out[:periods] = np.nan
+        out[periods:] = values[:-periods]
+    else:
+        out[periods:] = np.nan
+        out[:periods] = values[-periods:]
+    return out
+
+
+def ffill(values: np.ndarray) -> np.ndarray:
+    """沿时间轴向前填充 NaN"""
+    rows = np.where(~np.isnan(values), np.arange(values.shape[0])[:, None], -1)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    filled = values[np.maximum(rows, 0), np.arange(values.shape[1])]
+    filled[rows < 0] = np.nan
+    return filled
+
+
+def pct_change(values: np.ndarray, periods: int = 1, out: np.ndarray = None) -> np.ndarray:
+    """变化率，缺失值先向前填充（同 pandas pct_change 默认行为）"""
+    filled = ffill(values)
+    out = shift(filled, periods, out)
+    np.divide(filled, out, out=out)
+    out -= 1
+    return out
+
+
+def diff(values: np.ndarray, periods: int = 1, out: np.ndarray = None) -> np.ndarray:
+    """差分"""
+    out = shift(values, periods, out)
+    np.subtract(values, out, out=out)
+    return out
+
+
+def _window_moments(values: np.ndarray, window: int, second: bool = True):
+    """
+    以分块前缀和计算窗口一阶、二阶矩，O(n)
+
+    全局前缀和的量级随长度增长，相减时丢失精度；减去固定参考值后再平方求和，
+    参考值与窗口均值相差越远抵消误差越大。这里按 window 行分块，每块减去块首的观测值
+    并在块内重新累加。窗口要么恰为一块，要么跨相邻两块，跨块时前一块的块尾部分
+    按两块参考值之差 δ 平移到后一块的参考值：
+        Σ(x - r) = Σ(x - r') + kδ,  Σ(x - r)² = Σ(x - r')² + 2δΣ(x - r') + kδ²
+
+    Returns:
+        (ref, s1, s2, nan_counts)，对应以第 window-1 行起每一行结尾的窗口；
+        s1、s2 为相对 ref 的一阶、二阶和，second 为 False 时 s2 为 None
+    """
+    n = values.shape[0]
+    rest = values.shape[1:]
+    n_blocks = -(-n // window)
+    pad = n_blocks * window - n
+    padded = values
+    if pad:
+        padded = np.concatenate([values, np.full((pad,) + rest, np.nan)])
+    blocks = padded.reshape((n_blocks, window) + rest)
+
+    # 块参考值：块首观测值，缺失时取之前最近的块参考值，上市前的块取之后的首个
+    refs = ffill(blocks[:, 0])
+    refs = np.where(np.isnan(refs), ffill(blocks[::-1, 0])[::-1], refs)
+    np.nan_to_num(refs, copy=False)
+
+    missing = np.isnan(blocks)
+    centered = blocks - refs[:, None]
+    centered[missing] = 0.0
+    g1 = np.cumsum(centered, axis=1).reshape(padded.shape)
+    g2 = None
+    if second:
+        np.square(centered, out=centered)
+        g2 = np.cumsum(centered, axis=1, out=centered).reshape(padded.shape)
+    ccount = np.zeros((n + 1,) + rest, dtype=np.int32)
+    np.cumsum(missing.reshape(padded.shape)[:n], axis=0, out=ccount[1:])
+    nan_counts = ccount[window:] - ccount[:-window]
+
+    # 第 j 个窗口为 [j, j + window - 1]；j 为块首时恰为一块，否则跨第 j//window 与下一块
+    m = n - window + 1
+    ref = np.empty((m,) + rest)
+    s1 = g1[window - 1 : n].copy()
+    s2 = g2[window - 1 : n].copy() if second else None
+    ref[0::window] = refs[: len(ref[0::window])]
+    totals1 = g1[window - 1 :: window]
+    totals2 = g2[window - 1 :: window] if second else None
+    for r in range(1, min(window, m)):
+        rows = slice(r, m, window)
+        count = len(range(r, m, window))
+        delta = refs[:count] - refs[1 : count + 1]
+        tail1 = totals1[:count] - g1[r - 1 :: window][:count]
+        k = window - r
+        ref[rows] = refs[1 : count + 1]
+        if second:
+            tail2 = totals2[:count] - g2[r - 1 :: window][:count]
+            s2[rows] += tail2 + 2 * delta * tail1 + k * delta * delta
+        s1[rows] += tail1 + k * delta
+    return ref, s1, s2, nan_counts
+
+
+def rolling_mean(values: np.ndarray, window: int, out: np.ndarray = None) -> np.ndarray:
+    """滚动均值，O(n)（分块前缀和差分）"""
+    out = alloc(values, out)
+    out[: window - 1] = np.nan
+    if values.shape[0] < window:
+        out[:] = np.nan
+        return out
+    ref, s1, _, nan_counts = _window_moments(values, window, second=False)
+    np.add(ref, s1 / window, out=out[window - 1 :])
+    out[window - 1 :][nan_counts > 0] = np.nan
+    return out
+
+
+def rolling_std(
+    values: np.ndarray, window: int, ddof: int = 1, out: np.ndarray = None
+) -> np.ndarray:
+    """滚动标准差，O(n)，各窗口的平方和相对局部参考值累加（见 _window_moments）"""
+    out = alloc(values, out)
+    out[: window - 1] = np.nan
+    if values.shape[0] < window:
+        out[:] = np.nan
+        return out
+    _, s1, s2, nan_counts = _window_moments(values, window)
+    var = (s2 - s1 * s1 / window) / (window - ddof)
+    np.maximum(var, 0, out=var)
+    np.sqrt(var, out=out[window - 1 :])
+    out[window - 1 :][nan_counts > 0] = np.nan
+    return out
+
+
+def rolling_max(values: np.ndarray, window: int, out: np.ndarray = None) -> np.ndarray:
+    """滚动最大值，O(n)"""
+    return _rolling_extreme(values, window, np.maximum, out)
+
+
+def rolling_min(values: np.ndarray, window: int, out: np.ndarray = None) -> np.ndarray:
+    """滚动最小值，O(n)"""
+    return _rolling_extreme(values, window, np.minimum, out)
+
+
+def _rolling_extreme(values, window, ufunc, out):
+    """
+    van Herk/Gil-Werman 滚动极值
+
+    按 window 行分块，块内分别做正向、反向累积极值；以 t 结尾的窗口至多跨两块，
+    结果为 反向累积[t-window+1] 与 正向累积[t] 中的极值，每个元素三次比较，与窗口长度无关。
+    单调队列需要逐股票维护，无法在全部股票上一次向量化，这里用等价的分块方法。
+    np.maximum/np.minimum 传播 NaN，窗口内有缺失时结果为 NaN，与 pandas 一致。
+    """
+    out = alloc(values, out)
+    out[: window - 1] = np.nan
+    n = values.shape[0]
+    if n < window:
+        out[:] = np.nan
+        return out
+    n_blocks = -(-n // window)
+    pad = n_blocks * window - n
+    padded = values
+    if pad:
+        padded = np.concatenate([values, np.full((pad,) + values.shape[1:], np.nan)])
+    blocks = padded.reshape((n_blocks, window) + values.shape[1:])
+    forward = ufunc.accumulate(blocks, axis=1).reshape(padded.shape)
+    backward = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(padded.shape)
+    ufunc(backward[: n - window + 1], forward[window - 1 : n], out=out[window - 1 :])
+    return out
+
+
+def rolling_rank(
+    values: np.ndarray, window: int, pct: bool = False, out: np.ndarray = None
+) -> np.ndarray:
+    """
+    滚动排名：当期值在最近 window 期中的名次（并列取平均），同 pandas rolling(window).rank()
+
+    每个窗口做 window 次比较，按行分段处理以限制临时数组大小；窗口内有缺失时结果为 NaN。
+
+    Args:
+        pct: 为 True 时返回名次 / window
+    """
+    out = alloc(values, out)
+    out[: window - 1] = np.nan
+    n = values.shape[0]
+    if n < window:
+        out[:] = np.nan
+        return out
+    windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=0)
+    chunk = max(1, (1 << 24) // max(1, window * int(np.prod(values.shape[1:]))))
+    for lo in range(0, n - window + 1, chunk):
+        part = windows[lo : lo + chunk]
+        current = part[..., -1:]
+        less = (part < current).sum(axis=-1)
+        equal = (part == current).sum(axis=-1)
+        rank = less + (equal + 1) / 2.0
+        rank[np.isnan(part).any(axis=-1)] = np.nan
+        out[window - 1 + lo : window - 1 + lo + len(part)] = rank / window if pct else rank
+    return out
+
+
+def decay_linear(values: np.ndarray, window: int, out: np.ndarray = None) -> np.ndarray:
+    """线性衰减加权均值，最近一期权重为 window，最早一期为 1；窗口内有缺失时为 NaN"""
+    out = alloc(values, out)
+    out[: window - 1] = np.nan
+    n = values.shape[0]
+    if n < window:
+        out[:] = np.nan
+        return out
+    weights = np.arange(1, window + 1) / (window * (window + 1) / 2.0)
+    target = out[window - 1 :]
+    np.multiply(values[: n - window + 1], weights[0], out=target)
+    for k in range(1, window):
+        target += weights[k] * values[k : n - window + 1 + k]
+    return out
+
+
+def cs_average_rank(values: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """截面排名（沿最后一维，从 1 开始，并列取平均，NaN 保持 NaN），同 DataFrame.rank(axis=1)"""
+    out = alloc(values, out)
+    rows = values.reshape(-1, values.shape[-1])
+    missing = np.isnan(rows)
+    order = np.argsort(np.where(missing, np.inf, rows), axis=1)
+    ordered = np.take_along_axis(rows, order, axis=1)
+    # 并列值组的首、末位置，平均排名为两者中点
+    columns = np.broadcast_to(np.arange(rows.shape[1]), rows.shape)
+    starts = np.ones(rows.shape, dtype=bool)
+    starts[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    first = np.maximum.accumulate(np.where(starts, columns, 0), axis=1)
+    ends = np.ones(rows.shape, dtype=bool)
+    ends[:, :-1] = starts[:, 1:]
+    last = np.where(ends, columns, rows.shape[1])[:, ::-1]
+    last = np.minimum.accumulate(last, axis=1)[:, ::-1]
+    # out 不连续时 reshape 得到的是副本，排名写入临时数组后再复制回 out
+    ranks = out.reshape(rows.shape) if out.flags.c_contiguous else np.empty(rows.shape)
+    np.put_along_axis(ranks, order, (first + last) / 2 + 1, axis=1)
+    ranks[missing] = np.nan
+    if not out.flags.c_contiguous:
+        out[...] = ranks.reshape(out.shape)
+    return out
+
+
+def cs_rank(values: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """截面百分位排名（沿最后一维，并列取平均，忽略 NaN），同 DataFrame.rank(axis=1, pct=True)"""
+    out = cs_average_rank(values, out)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out /= (~np.isnan(values)).sum(axis=-1, keepdims=True)
+    return out
+
+
+def cs_quantiles(values: np.ndarray, qs) -> np.ndarray:
+    """
+    每行（截面）的分位数，线性插值同 np.nanquantile，返回 (len(qs), 日期)，无有效值的行为 NaN
+
+    按有效值个数把行分组，每组用一次 np.partition 取出插值所需的顺序统计量，
+    不做完整排序。
+    """
+    filled = np.where(np.isnan(values), np.inf, values)
+    counts = (~np.isnan(values)).sum(axis=1)
+    result = np.full((len(qs), values.shape[0]), np.nan)
+    for count in np.unique(counts[counts > 0]):
+        rows = np.flatnonzero(counts == count)
+        position = np.asarray(qs) * (count - 1)
+        lower = np.floor(position).astype(int)
+        upper = np.minimum(lower + 1, count - 1)
+        part = np.partition(filled[rows], np.union1d(lower, upper), axis=1)
+        low, high = part[:, lower], part[:, upper]
+        # 与 numpy 的插值一致：t >= 0.5 时从上端回退，保证结果逐位相同
+        t = position - lower
+        result[:, rows] = np.where(
+            t >= 0.5, high - (high - low) * (1 - t), low + (high - low) * t
+        ).T
+    return result
+
+
+def cs_quantile_buckets(values: np.ndarray, n: int) -> np.ndarray:
+    """
+    截面分位数分组（0 … n-1），同逐行 pd.qcut(x, n, labels=False, duplicates="drop")
+
+    分位点重复时合并相应的组；NaN 以及全部取值相同的行为 -1。返回 int8 数组。
+    """
+    edges = cs_quantiles(values, np.linspace(0, 1, n + 1))
+    buckets = np.zeros(values.shape, dtype=np.int8)
+    # 去重后第 k 个分位点小于 x 则 x 至少在第 k 组
+    for k in range(1, n):
+        distinct = (edges[k] > edges[k - 1])[:, None]
+        buckets += distinct & (values > edges[k][:, None])
+    buckets[np.isnan(values) | ~(edges[n] > edges[0])[:, None]] = -1
+    return buckets
+
+
+def cs_demean(values: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """减去截面均值（沿最后一维，忽略 NaN）"""
+    out = alloc(values, out)
+    with np.errstate(invalid="ignore"):
+        mean = _nanmean_last(values)
+    np.subtract(values, mean, out=out)
+    return out
+
+
+def cs_zscore(values: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """截面标准化 (x - 均值) / 标准差（沿最后一维，忽略 NaN，ddof=1）"""
+    out = cs_demean(values, out)
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=-1, keepdims=True)
+    squares = np.where(valid, out * out, 0.0).sum(axis=-1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        std = np.sqrt(squares / (count - 1))
+        np.divide(out, std, out=out)
+    return out
+
+
+def _nanmean_last(values: np.ndarray) -> np.ndarray:
+    valid = ~np.isnan(values)
+    total = np.where(valid, values, 0.0).sum(axis=-1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return total / valid.sum(axis=-1, keepdims=True)
+
+
+def ewm_mean(values: np.ndarray, span: int, out: np.ndarray = None) -> np.ndarray:
+    """
+    指数加权均值，同 pandas ewm(span=span, adjust=False).mean()
+
+    沿时间轴递推，每一步对所有股票做一次向量运算；缺失值处沿用上一个结果，
+    之后的观测按缺失期数衰减旧权重（ignore_na=False 语义）。
+    """
+    out = alloc(values, out)
+    alpha = 2.0 / (span + 1.0)
+    decay = 1.0 - alpha
+    n_cols = values.shape[1]
+    weighted = np.full(n_cols, np.nan)
+    old_wt = np.ones(n_cols)
+    for i in range(values.shape[0]):
+        cur = values[i]
+        observed = ~np.isnan(cur)
+        started = ~np.isnan(weighted)
+
+        old_wt = np.where(started, old_wt * decay, old_wt)
+        update = started & observed
+        blended = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+        weighted = np.where(update, blended, weighted)
+        old_wt = np.where(update, 1.0, old_wt)
+
+        first = ~started & observed
+        weighted = np.where(first, cur, weighted)
+        old_wt = np.where(first, 1.0, old_wt)
+        out[i] = weighted
+    return out
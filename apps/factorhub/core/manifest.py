@@ -0,0 +1,173 @@
+"""
+缓存清单
+
+记录每个缓存分区的 symbol、adjust、日期覆盖范围、行数、字节数和校验和。
+缓存命中、缺失和重叠判断只查询清单，无需打开任何数据文件。
+
+清单由快照 manifest.json 与追加写入的日志 manifest.journal 组成：每次更新只向日志
+追加一行，日志行数超过快照条目数（至少 JOURNAL_COMPACT_MIN 行）时才合并为新快照并
+清空日志，一轮刷新的写入量与分区数成线性关系。读取方只增量读取日志的新增部分。
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - 非POSIX平台退化为进程内锁
+    fcntl = None
+
+from .logger import logger
+
+MANIFEST_FILE = "manifest.json"
+JOURNAL_FILE = "manifest.journal"
+# 日志合并为快照的最少行数
+JOURNAL_COMPACT_MIN = 256
+
+
+class CacheManifest:
+    """持久化的缓存分区清单"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.path = self.root / MANIFEST_FILE
+        self.journal_path = self.root / JOURNAL_FILE
+        self.logger = logger
+        self._entries: Dict[str, Dict] = {}
+        self._stamp = None
+        self._journal_offset = 0
+        self._journal_lines = 0
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def key(symbol: str, adjust: str) -> str:
+        return f"{symbol}_{adjust}"
+
+    def _file_stamp(self):
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _journal_size(self) -> int:
+        try:
+            return self.journal_path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def _changed(self) -> bool:
+        return self._file_stamp() != self._stamp or self._journal_size() != self._journal_offset
+
+    def _reload(self):
+        """快照被替换时整体重新加载，否则只读取日志新增的行；调用方须持有文件锁"""
+        stamp = self._file_stamp()
+        journal_size = self._journal_size()
+        if stamp != self._stamp or journal_size < self._journal_offset:
+            entries = {}
+            if stamp is not None:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        entries = json.load(f).get("entries", {})
+                except ValueError as e:
+                    self.logger.warning(f"缓存清单损坏，已忽略: {str(e)[:50]}")
+            self._entries = entries
+            self._stamp = stamp
+            self._journal_offset = 0
+            self._journal_lines = 0
+        if journal_size == self._journal_offset:
+            return
+
+        with open(self.journal_path, "rb") as f:
+            f.seek(self._journal_offset)
+            data = f.read(journal_size - self._journal_offset)
+        for line in data.splitlines():
+            try:
+                record = json.loads(line)
+                key, entry = record["key"], record["entry"]
+            except (ValueError, KeyError, TypeError):
+                # 写入中断留下的残行
+                self.logger.warning("缓存清单日志存在损坏的行，已跳过")
+                continue
+            if entry is None:
+                self._entries.pop(key, None)
+            else:
+                self._entries[key] = entry
+            self._journal_lines += 1
+        self._journal_offset = journal_size
+
+    @contextmanager
+    def _file_lock(self, shared: bool = False):
+        """跨进程锁，读取用共享锁，写入用排他锁"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.root / (MANIFEST_FILE + ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """清单被其他进程修改时在共享锁下重新加载"""
+        if self._changed():
+            with self._file_lock(shared=True):
+                self._reload()
+
+    def _append(self, key: str, entry: Optional[Dict]):
+        """向日志追加一条记录，日志过长时合并为快照；调用方须持有排他锁并已 _reload"""
+        with open(self.journal_path, "ab") as f:
+            f.write(json.dumps({"key": key, "entry": entry}).encode("utf-8") + b"\n")
+            self._journal_offset = f.tell()
+        self._journal_lines += 1
+        if self._journal_lines >= max(JOURNAL_COMPACT_MIN, len(self._entries)):
+            self._compact()
+
+    def _compact(self):
+        tmp_path = self.root / (MANIFEST_FILE + f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"entries": self._entries}, f)
+        os.replace(tmp_path, self.path)
+        # 快照已包含日志中的全部记录；读取方看到新快照后会从头读取（已清空的）日志
+        with open(self.journal_path, "wb"):
+            pass
+        self._stamp = self._file_stamp()
+        self._journal_offset = 0
+        self._journal_lines = 0
+
+    def get(self, symbol: str, adjust: str) -> Optional[Dict]:
+        """查询分区条目"""
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(self.key(symbol, adjust))
+            return dict(entry) if entry else None
+
+    def entries(self) -> List[Dict]:
+        """全部分区条目"""
+        with self._lock:
+            self._refresh()
+            return [dict(e) for e in self._entries.values()]
+
+    def put(self, entry: Dict):
+        """写入或更新分区条目"""
+        entry = dict(entry, updated_at=time.time())
+        key = self.key(entry["symbol"], entry["adjust"])
+        with self._lock, self._file_lock():
+            self._reload()
+            self._entries[key] = entry
+            self._append(key, entry)
+
+    def remove(self, symbol: str, adjust: str):
+        """删除分区条目"""
+        key = self.key(symbol, adjust)
+        with self._lock, self._file_lock():
+            self._reload()
+            if self._entries.pop(key, None) is not None:
+                self._append(key, None)
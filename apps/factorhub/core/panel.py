@@ -0,0 +1,212 @@
+"""
+行情面板
+
+MarketPanel 将长表行情（每行一个 symbol-date）对齐为 日期 × 股票 的二维数组：
+行号即日期编码，列号即股票编码。截面运算是对一行的操作，时序运算是对一列的操作，
+都无需再按 symbol/date 过滤长表。缺失的 symbol-date 为 NaN，mask 记录原始数据中存在的位置。
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from . import kernels
+
+# 默认纳入面板的行情字段
+PANEL_FIELDS = [
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "amount",
+    "turnover",
+    "pct_change",
+    "change",
+    "return_1d",
+    "return_5d",
+]
+
+
+class MarketPanel:
+    """日期 × 股票对齐的行情面板"""
+
+    def __init__(
+        self,
+        dates,
+        symbols,
+        fields: Dict[str, np.ndarray],
+        mask: Optional[np.ndarray] = None,
+    ):
+        """
+        Args:
+            dates: 有序日期，长度为 T
+            symbols: 股票代码，长度为 N
+            fields: 字段名 -> (T, N) float64 数组
+            mask: (T, N) 布尔数组，标记原始数据中存在的 symbol-date，默认全部存在
+        """
+        self.dates = pd.DatetimeIndex(dates)
+        self.symbols = pd.Index(symbols, dtype=object)
+        self.fields: Dict[str, np.ndarray] = {}
+        if mask is None:
+            mask = np.ones(self.shape, dtype=bool)
+        self.mask = mask
+        self.attrs: Dict = {}
+        for name, values in fields.items():
+            self[name] = values
+
+    @property
+    def shape(self):
+        return (len(self.dates), len(self.symbols))
+
+    @property
+    def empty(self) -> bool:
+        return len(self.dates) == 0 or len(self.symbols) == 0
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.fields
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.fields[name]
+
+    def __setitem__(self, name: str, values):
+        values = np.asarray(values, dtype=float)
+        if values.shape != self.shape:
+            raise ValueError(f"字段 {name} 形状 {values.shape} 与面板 {self.shape} 不一致")
+        self.fields[name] = values
+        # 被替换的字段不再等同于存储中的数据
+        stored = self.attrs.get("stored_fields")
+        if stored and name in stored:
+            self.attrs["stored_fields"] = stored - {name}
+
+    def __repr__(self) -> str:
+        return f"MarketPanel(dates={len(self.dates)}, symbols={len(self.symbols)}, fields={list(self.fields)})"
+
+    @classmethod
+    def from_long(
+        cls,
+        df: pd.DataFrame,
+        fields: Iterable[str] = None,
+        date_col: str = "date",
+        symbol_col: str = "symbol",
+    ) -> "MarketPanel":
+        """
+        由长表构建面板
+
+        Args:
+            df: 包含 date、symbol 列的长表
+            fields: 纳入面板的数值列，默认取 PANEL_FIELDS 中存在的列
+            date_col: 日期列名
+            symbol_col: 股票代码列名
+        """
+        if df.empty:
+            return cls([], [], {})
+        if fields is None:
+            fields = [c for c in PANEL_FIELDS if c in df.columns]
+
+        date_codes, dates = pd.factorize(pd.to_datetime(df[date_col]), sort=True)
+        symbol_codes, symbols = pd.factorize(df[symbol_col], sort=True)
+        shape = (len(dates), len(symbols))
+
+        mask = np.zeros(shape, dtype=bool)
+        mask[date_codes, symbol_codes] = True
+        arrays = {}
+        for name in fields:
+            values = np.full(shape, np.nan)
+            values[date_codes, symbol_codes] = pd.to_numeric(df[name], errors="coerce").to_numpy(
+                dtype=float, na_value=np.nan
+            )
+            arrays[name] = values
+        return cls(dates, symbols, arrays, mask)
+
+    def to_long(self, fields: Iterable[str] = None) -> pd.DataFrame:
+        """
+        转回长表（按 symbol、date 排序，只包含 mask 中存在的行）
+
+        Args:
+            fields: 输出的字段，默认全部字段
+        """
+        if fields is None:
+            fields = list(self.fields)
+        symbol_codes, date_codes = np.nonzero(self.mask.T)
+        data = {
+            "date": self.dates.values[date_codes],
+            "symbol": self.symbols.values[symbol_codes],
+        }
+        for name in fields:
+            data[name] = self.fields[name][date_codes, symbol_codes]
+        return pd.DataFrame(data)
+
+    def locate(self, df: pd.DataFrame, date_col: str = "date", symbol_col: str = "symbol"):
+        """长表每一行在面板中的 (日期编码, 股票编码)，不在面板中的为 -1"""
+        date_codes = self.dates.get_indexer(pd.to_datetime(df[date_col]))
+        symbol_codes = self.symbols.get_indexer(df[symbol_col])
+        return date_codes, symbol_codes
+
+    def gather(self, name: str, date_codes: np.ndarray, symbol_codes: np.ndarray) -> np.ndarray:
+        """按编码取出字段值，编码为 -1 的位置返回 NaN"""
+        valid = (date_codes >= 0) & (symbol_codes >= 0)
+        values = np.full(len(date_codes), np.nan)
+        values[valid] = self.fields[name][date_codes[valid], symbol_codes[valid]]
+        return values
+
+    def frame(self, name: str) -> pd.DataFrame:
+        """字段的 DataFrame 视图（index 为日期，columns 为股票，不复制数据）"""
+        return pd.DataFrame(self.fields[name], index=self.dates, columns=self.symbols, copy=False)
+
+    def frames(self, fields: Iterable[str] = None) -> Dict[str, pd.DataFrame]:
+        """多个字段的 DataFrame 视图"""
+        if fields is None:
+            fields = list(self.fields)
+        return {name: self.frame(name) for name in fields if name in self.fields}
+
+    def cross_section(self, date) -> pd.DataFrame:
+        """某一日期的截面，index 为股票"""
+        i = self.dates.get_loc(pd.Timestamp(date))
+        return pd.DataFrame(
+            {name: values[i] for name, values in self.fields.items()}, index=self.symbols
+        )
+
+    def series(self, symbol: str) -> pd.DataFrame:
+        """某只股票的时间序列，index 为日期"""
+        j = self.symbols.get_loc(symbol)
+        return pd.DataFrame(
+            {name: values[:, j] for name, values in self.fields.items()}, index=self.dates
+        )
+
+    def select(self, fields: List[str]) -> "MarketPanel":
+        """只保留指定字段（共享数组）"""
+        panel = MarketPanel(
+            self.dates, self.symbols, {n: self.fields[n] for n in fields}, self.mask
+        )
+        panel.attrs = dict(self.attrs)
+        return panel
+
+    def slice_dates(self, start_date=None, end_date=None) -> "MarketPanel":
+        """按日期闭区间截取（共享数组）"""
+        lo = 0 if start_date is None else self.dates.searchsorted(pd.Timestamp(start_date))
+        hi = (
+            len(self.dates)
+            if end_date is None
+            else self.dates.searchsorted(pd.Timestamp(end_date), side="right")
+        )
+        panel = MarketPanel(
+            self.dates[lo:hi],
+            self.symbols,
+            {n: v[lo:hi] for n, v in self.fields.items()},
+            self.mask[lo:hi],
+        )
+        panel.attrs = dict(self.attrs)
+        return panel
+
+    def ffill(self, name: str) -> np.ndarray:
+        """字段按时间向前填充后的数组"""
+        return kernels.ffill(self.fields[name])
+
+
+def as_panel(data, fields: Iterable[str] = None) -> MarketPanel:
+    """长表转换为面板，已是面板则直接返回"""
+    if isinstance(data, MarketPanel):
+        return data
+    return MarketPanel.from_long(data, fields)
@@ -0,0 +1,135 @@
+"""
+截面排名与分位数分组缓存
+
+同一个因子数组在一次分析中会被排名多次：Spearman IC 计算截面排名，分层分析和回测的
+再平衡都按日期做分位数分组。这里对每个 (日期, 股票) 数组一次性向量化计算：
+
+    排名  平均秩（并列取平均），float32 存储
+    分组  同 pd.qcut(labels=False, duplicates="drop") 的 0 … n-1，int8 存储，缺失为 -1
+
+按数组内容的哈希在进程内缓存，受字节预算约束并按 LRU 淘汰；分析器与回测引擎共享同一个
+缓存，同一份因子值只排名、分组一次。
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+from . import kernels
+from .config import DEFAULT_CONFIG
+
+
+class _Entry:
+    """一个数组的排名与各分组数下的分组结果"""
+
+    def __init__(self):
+        self.ranks: Optional[np.ndarray] = None
+        self.buckets: Dict[int, np.ndarray] = {}
+
+    @property
+    def nbytes(self) -> int:
+        size = self.ranks.nbytes if self.ranks is not None else 0
+        return size + sum(b.nbytes for b in self.buckets.values())
+
+
+class RankCache:
+    """字节预算受限的截面排名、分组缓存"""
+
+    def __init__(self, max_bytes: int = None):
+        """
+        Args:
+            max_bytes: 总大小上限，默认取配置 analysis.rank_cache_mb
+        """
+        if max_bytes is None:
+            max_bytes = DEFAULT_CONFIG["analysis"]["rank_cache_mb"] * 1024 * 1024
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(values: np.ndarray) -> str:
+        """数组内容的哈希"""
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        digest = hashlib.sha1(str(values.shape).encode())
+        digest.update(memoryview(values).cast("B"))
+        return digest.hexdigest()
+
+    def ranks(self, values: np.ndarray, key: str = None) -> np.ndarray:
+        """(日期, 股票) 截面平均秩，NaN 保持 NaN（float32，只读）"""
+        key = key or self.key(values)
+        with self._lock:
+            entry = self._lookup(key, lambda e: e.ranks is not None)
+        if entry is not None:
+            return entry.ranks
+        ranks = kernels.cs_average_rank(values).astype(np.float32)
+        ranks.flags.writeable = False
+        self._store(key, lambda e: setattr(e, "ranks", ranks))
+        return ranks
+
+    def buckets(self, values: np.ndarray, n: int, key: str = None) -> np.ndarray:
+        """(日期, 股票) 截面分位数分组 0 … n-1，缺失为 -1（int8，只读）"""
+        key = key or self.key(values)
+        with self._lock:
+            entry = self._lookup(key, lambda e: n in e.buckets)
+        if entry is not None:
+            return entry.buckets[n]
+        buckets = kernels.cs_quantile_buckets(values, n)
+        buckets.flags.writeable = False
+        self._store(key, lambda e: e.buckets.__setitem__(n, buckets))
+        return buckets
+
+    def _lookup(self, key: str, has) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None or not has(entry):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def _store(self, key: str, update):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+            self._bytes -= entry.nbytes
+            update(entry)
+            self._bytes += entry.nbytes
+            self._entries.move_to_end(key)
+            while self._bytes > self.max_bytes and self._entries:
+                _, oldest = self._entries.popitem(last=False)
+                self._bytes -= oldest.nbytes
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+_rank_cache = None
+_rank_cache_lock = threading.Lock()
+
+
+def get_rank_cache() -> RankCache:
+    """进程内共享的截面排名、分组缓存"""
+    global _rank_cache
+    with _rank_cache_lock:
+        if _rank_cache is None:
+            _rank_cache = RankCache()
+        return _rank_cache
@@ -0,0 +1,160 @@
+"""
+上游请求合并（single-flight）
+
+同一进程内，相同 key 的并发调用只有一个真正执行，其余等待并共享结果；
+配置了 Redis 时，执行者还需先取得 Redis 租约，保证多个 worker 进程之间同一时刻只有一个在拉取。
+"""
+
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable
+
+from .config import DEFAULT_CONFIG
+from .logger import logger
+
+# 仅当租约仍属于自己时才删除
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RedisLease:
+    """基于 Redis SET NX PX 的跨进程租约"""
+
+    def __init__(
+        self,
+        client,
+        ttl: float = 60,
+        wait_timeout: float = 120,
+        poll_interval: float = 0.1,
+        prefix: str = "factorhub:fetch:",
+    ):
+        self.client = client
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self.logger = logger
+
+    @contextmanager
+    def hold(self, key: Hashable):
+        """持有租约期间执行；Redis 不可用或等待超时时不加租约直接执行"""
+        name = self.prefix + ":".join(str(k) for k in key)
+        token = uuid.uuid4().hex
+        acquired = False
+        try:
+            deadline = time.monotonic() + self.wait_timeout
+            while True:
+                if self.client.set(name, token, nx=True, px=int(self.ttl * 1000)):
+                    acquired = True
+                    break
+                if time.monotonic() >= deadline:
+                    self.logger.warning(f"等待租约超时 {name}，不加租约继续执行")
+                    break
+                time.sleep(self.poll_interval)
+        except Exception as e:
+            self.logger.warning(f"Redis 租约不可用 {name}: {str(e)[:50]}")
+
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    self.client.eval(_RELEASE_SCRIPT, 1, name, token)
+                except Exception as e:
+                    self.logger.warning(f"释放租约失败 {name}: {str(e)[:50]}")
+
+
+class SingleFlight:
+    """按 key 合并并发调用"""
+
+    def __init__(self, lease: RedisLease = None):
+        self.lease = lease
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        执行 fn 并返回结果；相同 key 已有调用在执行时等待其结果
+
+        fn 应当幂等：跨进程等待租约的调用在取得租约后仍会执行 fn，
+        此时 fn 需要自行检查其他进程是否已经完成了工作。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if self.lease is not None:
+                with self.lease.hold(key):
+                    call.result = fn()
+            else:
+                call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> Dict:
+        """执行与合并次数统计"""
+        return {"executed": self.executed, "shared": self.shared}
+
+
+def _redis_lease():
+    """使用 Django 缓存配置中的 Redis 创建租约，不可用时返回None"""
+    if DEFAULT_CONFIG["data"]["fetch_lease"] != "redis":
+        return None
+    try:
+        from django.conf import settings
+
+        if "django_redis" not in settings.CACHES.get("default", {}).get("BACKEND", ""):
+            return None
+        from django_redis import get_redis_connection
+
+        return RedisLease(get_redis_connection("default"))
+    except Exception as e:
+        logger.warning(f"Redis 租约初始化失败，仅使用进程内合并: {str(e)[:50]}")
+        return None
+
+
+_singleflight = None
+_singleflight_lock = threading.Lock()
+
+
+def get_singleflight() -> SingleFlight:
+    """获取进程级共享的请求合并器"""
+    global _singleflight
+    with _singleflight_lock:
+        if _singleflight is None:
+            _singleflight = SingleFlight(_redis_lease())
+        return _singleflight
@@ -0,0 +1,469 @@
+"""
+流式因子计算
+
+每个交易日收盘后只需把当天的行情追加进来，不必在全部历史上重算滚动因子。
+因子的计算图（见 factor_graph）中每个有状态的节点对应一份在线状态：
+滚动均值/标准差为环形缓冲区加窗口和，shift/diff 为环形缓冲区，EMA 为上一期结果及权重，
+OBV 为累计和。追加一天时按拓扑序逐节点更新，每只股票每个节点 O(1)
+（滚动最大/最小值与滚动排名为 O(窗口)，仍是对全部股票的一次向量运算），结果与批量计算一致。
+
+状态全部是 numpy 数组，可通过 state_dict/save 持久化，次日 load 后继续追加。
+"""
+
+import json
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from . import factor_graph as fg
+from .factor_lib import FactorLibrary
+from .logger import logger
+from .panel import MarketPanel
+
+
+class NodeState(ABC):
+    """计算图节点的在线状态，state_keys 中的属性即全部可序列化状态"""
+
+    state_keys = ()
+
+    def __init__(self, n_symbols: int):
+        self.n_symbols = n_symbols
+
+    @abstractmethod
+    def update(self, inputs: List) -> np.ndarray:
+        """输入当期各子节点的值，返回当期结果"""
+        pass
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {key: np.asarray(getattr(self, key)) for key in self.state_keys}
+
+    def load(self, state: Dict[str, np.ndarray]):
+        for key in self.state_keys:
+            value = np.array(state[key])
+            current = getattr(self, key)
+            if np.shape(value) != np.shape(current):
+                raise ValueError(f"状态 {key} 形状 {np.shape(value)} 与 {np.shape(current)} 不一致")
+            setattr(self, key, value)
+
+
+class ElementwiseState(NodeState):
+    """逐元素运算，无状态"""
+
+    def __init__(self, n_symbols: int, node: fg.Node):
+        super().__init__(n_symbols)
+        self.run = fg.OPS[node.op]
+        self.params = node.params
+
+    def update(self, inputs):
+        return self.run(inputs, self.params, None)
+
+
+class RingState(NodeState):
+    """最近 size 期输入的环形缓冲区，空位为 NaN"""
+
+    state_keys = ("buffer", "pos")
+
+    def __init__(self, n_symbols: int, size: int):
+        super().__init__(n_symbols)
+        if size < 1:
+            raise ValueError(f"窗口长度 {size} 不支持流式计算")
+        self.size = size
+        self.buffer = np.full((size, n_symbols), np.nan)
+        self.pos = np.array(0)
+
+    def push(self, x: np.ndarray) -> np.ndarray:
+        """写入当期值，返回被挤出的 size 期前的值"""
+        pos = int(self.pos)
+        evicted = self.buffer[pos].copy()
+        self.buffer[pos] = x
+        self.pos = np.array((pos + 1) % self.size)
+        return evicted
+
+
+class ShiftState(RingState):
+    def update(self, inputs):
+        return self.push(inputs[0])
+
+
+class DiffState(RingState):
+    def update(self, inputs):
+        x = inputs[0]
+        return x - self.push(x)
+
+
+class FfillState(NodeState):
+    state_keys = ("last",)
+
+    def __init__(self, n_symbols: int):
+        super().__init__(n_symbols)
+        self.last = np.full(n_symbols, np.nan)
+
+    def update(self, inputs):
+        x = inputs[0]
+        self.last = np.where(np.isnan(x), self.last, x)
+        return self.last.copy()
+
+
+class RollingMeanState(RingState):
+    """
+    滚动均值：窗口和与窗口内缺失数随进出窗口增减
+
+    缓冲区初始为 NaN，缺失数从 window 开始递减，未满窗口时结果自然为 NaN。
+    每绕缓冲区一圈由缓冲区重新求和一次，避免长期增减累积舍入误差。
+    """
+
+    state_keys = RingState.state_keys + ("total", "nans")
+
+    def __init__(self, n_symbols: int, window: int):
+        super().__init__(n_symbols, window)
+        self.total = np.zeros(n_symbols)
+        self.nans = np.full(n_symbols, window)
+
+    def _enter(self, x: np.ndarray) -> np.ndarray:
+        """写入新值并更新窗口和，返回进入缓冲区的值"""
+        old = self.push(x)
+        if int(self.pos) == 0:
+            self.total = np.where(np.isnan(self.buffer), 0.0, self.buffer).sum(axis=0)
+            self.nans = np.isnan(self.buffer).sum(axis=0)
+        else:
+            self.total += np.nan_to_num(x) - np.nan_to_num(old)
+            self.nans += np.isnan(x).astype(int) - np.isnan(old)
+        return x
+
+    def update(self, inputs):
+        self._enter(inputs[0])
+        result = self.total / self.size
+        result[self.nans > 0] = np.nan
+        return result
+
+
+class RollingStdState(RollingMeanState):
+    """滚动标准差：先减去每只股票首个有效值再累加平方和，每绕缓冲区一圈重新求和"""
+
+    state_keys = RollingMeanState.state_keys + ("squares", "offset", "seen")
+
+    def __init__(self, n_symbols: int, window: int, ddof: int = 1):
+        super().__init__(n_symbols, window)
+        self.ddof = ddof
+        self.squares = np.zeros(n_symbols)
+        self.offset = np.zeros(n_symbols)
+        self.seen = np.zeros(n_symbols, dtype=bool)
+
+    def update(self, inputs):
+        x = inputs[0]
+        first = ~self.seen & ~np.isnan(x)
+        self.offset = np.where(first, x, self.offset)
+        self.seen = self.seen | first
+        centered = x - self.offset
+
+        old = self.buffer[int(self.pos)].copy()
+        self._enter(centered)
+        if int(self.pos) == 0:
+            self.squares = np.where(np.isnan(self.buffer), 0.0, self.buffer**2).sum(axis=0)
+        else:
+            self.squares += np.nan_to_num(centered) ** 2 - np.nan_to_num(old) ** 2
+
+        var = (self.squares - self.total * self.total / self.size) / (self.size - self.ddof)
+        result = np.sqrt(np.maximum(var, 0))
+        result[self.nans > 0] = np.nan
+        return result
+
+
+class RollingExtremeState(RingState):
+    """滚动最大/最小值，窗口内有 NaN 时为 NaN"""
+
+    def __init__(self, n_symbols: int, window: int, reducer):
+        super().__init__(n_symbols, window)
+        self.reducer = reducer
+
+    def update(self, inputs):
+        self.push(inputs[0])
+        return self.reducer(self.buffer, axis=0)
+
+
+class RollingRankState(RingState):
+    """滚动排名：当期值在缓冲区中的名次（并列取平均），O(窗口)"""
+
+    def __init__(self, n_symbols: int, window: int, pct: bool = False):
+        super().__init__(n_symbols, window)
+        self.pct = pct
+
+    def update(self, inputs):
+        x = inputs[0]
+        self.push(x)
+        rank = (self.buffer < x).sum(axis=0) + ((self.buffer == x).sum(axis=0) + 1) / 2.0
+        rank[np.isnan(self.buffer).any(axis=0)] = np.nan
+        return rank / self.size if self.pct else rank
+
+
+class DecayLinearState(RingState):
+    """线性衰减加权均值，O(窗口)"""
+
+    def __init__(self, n_symbols: int, window: int):
+        super().__init__(n_symbols, window)
+        self.weights = np.arange(1, window + 1) / (window * (window + 1) / 2.0)
+
+    def update(self, inputs):
+        self.push(inputs[0])
+        # 缓冲区按写入位置循环，pos 处为最早一期
+        order = (int(self.pos) + np.arange(self.size)) % self.size
+        return self.weights @ self.buffer[order]
+
+
+class EwmState(NodeState):
+    """指数加权均值，递推公式与 kernels.ewm_mean 相同"""
+
+    state_keys = ("weighted", "old_wt")
+
+    def __init__(self, n_symbols: int, span: int):
+        super().__init__(n_symbols)
+        self.alpha = 2.0 / (span + 1.0)
+        self.weighted = np.full(n_symbols, np.nan)
+        self.old_wt = np.ones(n_symbols)
+
+    def update(self, inputs):
+        cur = inputs[0]
+        alpha, decay = self.alpha, 1.0 - self.alpha
+        observed = ~np.isnan(cur)
+        started = ~np.isnan(self.weighted)
+
+        old_wt = np.where(started, self.old_wt * decay, self.old_wt)
+        update = started & observed
+        blended = (old_wt * self.weighted + alpha * cur) / (old_wt + alpha)
+        weighted = np.where(update, blended, self.weighted)
+        old_wt = np.where(update, 1.0, old_wt)
+
+        first = ~started & observed
+        self.weighted = np.where(first, cur, weighted)
+        self.old_wt = np.where(first, 1.0, old_wt)
+        return self.weighted.copy()
+
+
+class CumsumState(NodeState):
+    """累计和，缺失值记为 0"""
+
+    state_keys = ("total",)
+
+    def __init__(self, n_symbols: int):
+        super().__init__(n_symbols)
+        self.total = np.zeros(n_symbols)
+
+    def update(self, inputs):
+        self.total = self.total + np.nan_to_num(inputs[0])
+        return self.total.copy()
+
+
+def make_state(node: fg.Node, n_symbols: int) -> NodeState:
+    """为计算图节点创建在线状态"""
+    op, params = node.op, node.params
+    if op in ("shift", "diff"):
+        cls = ShiftState if op == "shift" else DiffState
+        return cls(n_symbols, params[0])
+    if op == "ffill":
+        return FfillState(n_symbols)
+    if op == "rolling_mean":
+        return RollingMeanState(n_symbols, params[0])
+    if op == "rolling_std":
+        return RollingStdState(n_symbols, *params)
+    if op in ("rolling_max", "rolling_min"):
+        reducer = np.max if op == "rolling_max" else np.min
+        return RollingExtremeState(n_symbols, params[0], reducer)
+    if op == "rolling_rank":
+        return RollingRankState(n_symbols, *params)
+    if op == "decay_linear":
+        return DecayLinearState(n_symbols, params[0])
+    if op == "ewm_mean":
+        return EwmState(n_symbols, params[0])
+    if op == "cumsum_nan0":
+        return CumsumState(n_symbols)
+    if op in fg.OPS:
+        return ElementwiseState(n_symbols, node)
+    raise ValueError(f"运算 {op} 不支持流式计算")
+
+
+class StreamingFactors:
+    """
+    一组因子在全部股票上的在线状态
+
+    因子合并为一张计算图，共享的中间节点只保留一份状态。
+    """
+
+    def __init__(self, outputs: Dict[str, fg.Node], symbols):
+        """
+        Args:
+            outputs: 因子名 -> 计算图输出节点
+            symbols: 股票代码，update 输入按此顺序对齐
+        """
+        self.logger = logger
+        self.outputs = dict(outputs)
+        self.symbols = pd.Index(symbols, dtype=object)
+        self.graph = fg.FactorGraph(self.outputs)
+        n = len(self.symbols)
+        self.states: Dict[fg.Node, NodeState] = {
+            node: make_state(node, n)
+            for node in self.graph.order
+            if node.op not in ("field", "const")
+        }
+        self.field_names = sorted({n.params[0] for n in self.graph.order if n.op == "field"})
+        self.last_date: Optional[pd.Timestamp] = None
+        self.values: Dict[str, np.ndarray] = {name: np.full(n, np.nan) for name in self.outputs}
+
+    @classmethod
+    def from_library(
+        cls, factor_names: List[str], symbols, library: FactorLibrary = None
+    ) -> "StreamingFactors":
+        """由因子库中的因子构建，不存在或未声明计算图的因子跳过"""
+        library = library or FactorLibrary()
+        outputs = {}
+        for name in dict.fromkeys(factor_names):
+            factor = library.get_factor(name)
+            node = factor.graph() if factor is not None else None
+            if node is None:
+                logger.warning(f"因子 {name} 不支持流式计算")
+                continue
+            outputs[name] = node
+        return cls(outputs, symbols)
+
+    def update(
+        self, bars: Union[pd.DataFrame, Dict[str, np.ndarray]], date=None
+    ) -> Dict[str, np.ndarray]:
+        """
+        追加一个交易日的行情并更新全部因子
+
+        Args:
+            bars: 当日行情；DataFrame 需包含 symbol 列，字典为 字段 -> 按 symbols 对齐的数组。
+                缺失的股票（停牌）按 NaN 处理，与批量计算的面板语义一致
+            date: 交易日，不晚于上次追加日期时忽略本次输入
+
+        Returns:
+            因子名 -> 当日各股票因子值
+        """
+        if date is not None:
+            date = pd.Timestamp(date)
+            if self.last_date is not None and date <= self.last_date:
+                self.logger.warning(f"{date.date()} 不晚于已追加的 {self.last_date.date()}，忽略")
+                return self.values
+
+        fields = self._align(bars)
+        results: Dict[fg.Node, object] = {}
+        for node in self.graph.order:
+            if node.op == "field":
+                results[node] = fields[node.params[0]]
+            elif node.op == "const":
+                results[node] = node.params[0]
+            else:
+                inputs = [results[child] for child in node.inputs]
+                results[node] = self.states[node].update(inputs)
+
+        self.values = {
+            name: np.array(results[node], dtype=float) * np.ones(len(self.symbols))
+            for name, node in self.outputs.items()
+        }
+        if date is not None:
+            self.last_date = date
+        return self.values
+
+    def warm_up(self, panel: MarketPanel) -> "StreamingFactors":
+        """按日期顺序回放历史面板，得到最后一个交易日之后的状态"""
+        panel = panel.select([f for f in self.field_names if f in panel])
+        columns = self.symbols.get_indexer(panel.symbols)
+        for i, date in enumerate(panel.dates):
+            bars = {}
+            for name in self.field_names:
+                row = np.full(len(self.symbols), np.nan)
+                if name in panel:
+                    row[columns[columns >= 0]] = panel[name][i][columns >= 0]
+                bars[name] = row
+            self.update(bars, date)
+        return self
+
+    def to_frame(self) -> pd.DataFrame:
+        """最新因子值，index 为股票，columns 为因子"""
+        return pd.DataFrame(self.values, index=self.symbols)
+
+    def _align(self, bars) -> Dict[str, np.ndarray]:
+        n = len(self.symbols)
+        if isinstance(bars, pd.DataFrame):
+            frame = bars.set_index("symbol") if "symbol" in bars.columns else bars
+            frame = frame[~frame.index.duplicated(keep="last")].reindex(self.symbols)
+            bars = {
+                name: pd.to_numeric(frame[name], errors="coerce").to_numpy(dtype=float)
+                for name in self.field_names
+                if name in frame.columns
+            }
+        aligned = {}
+        for name in self.field_names:
+            values = bars.get(name)
+            if values is None:
+                aligned[name] = np.full(n, np.nan)
+            else:
+                values = np.asarray(values, dtype=float)
+                if values.shape != (n,):
+                    raise ValueError(f"字段 {name} 长度 {values.shape} 与股票数 {n} 不一致")
+                aligned[name] = values
+        return aligned
+
+    def state_dict(self) -> Dict:
+        """全部在线状态，节点按拓扑序编号，附带节点表达式用于载入时校验"""
+        states = {}
+        for i, node in enumerate(self.graph.order):
+            if node in self.states:
+                states[str(i)] = {"node": repr(node), **self.states[node].state()}
+        return {
+            "factors": {name: repr(node) for name, node in self.outputs.items()},
+            "symbols": list(self.symbols),
+            "last_date": None if self.last_date is None else str(self.last_date.date()),
+            "values": self.values,
+            "states": states,
+        }
+
+    def load_state_dict(self, state: Dict) -> "StreamingFactors":
+        """载入 state_dict，因子定义或股票列表不一致时抛出 ValueError"""
+        expected = {name: repr(node) for name, node in self.outputs.items()}
+        if state["factors"] != expected:
+            raise ValueError("状态中的因子定义与当前因子不一致")
+        if list(state["symbols"]) != list(self.symbols):
+            raise ValueError("状态中的股票列表与当前股票列表不一致")
+        for i, node in enumerate(self.graph.order):
+            if node not in self.states:
+                continue
+            node_state = state["states"][str(i)]
+            if node_state["node"] != repr(node):
+                raise ValueError(f"节点 {node!r} 与状态不一致")
+            self.states[node].load(node_state)
+        self.values = {name: np.array(values) for name, values in state["values"].items()}
+        self.last_date = pd.Timestamp(state["last_date"]) if state["last_date"] else None
+        return self
+
+    def save(self, path: Union[str, Path]):
+        """保存为 npz：数组按 节点/属性 存储，其余元数据存为 JSON"""
+        state = self.state_dict()
+        arrays = {f"values/{name}": values for name, values in state.pop("values").items()}
+        meta_states = {}
+        for key, node_state in state.pop("states").items():
+            meta_states[key] = node_state.pop("node")
+            for attr, value in node_state.items():
+                arrays[f"states/{key}/{attr}"] = value
+        state["nodes"] = meta_states
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(f, __meta__=np.array(json.dumps(state, ensure_ascii=False)), **arrays)
+
+    def load(self, path: Union[str, Path]) -> "StreamingFactors":
+        """从 save 保存的文件载入状态"""
+        with np.load(path, allow_pickle=False) as data:
+            state = json.loads(str(data["__meta__"]))
+            state["values"] = {
+                key.split("/", 1)[1]: data[key] for key in data.files if key.startswith("values/")
+            }
+            states = {key: {"node": node} for key, node in state.pop("nodes").items()}
+            for key in data.files:
+                if key.startswith("states/"):
+                    _, index, attr = key.split("/", 2)
+                    states[index][attr] = data[key]
+            state["states"] = states
+        return self.load_state_dict(state)
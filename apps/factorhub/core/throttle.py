@@ -0,0 +1,53 @@
+"""
+上游请求限流
+"""
+
+import threading
+import time
+
+from .config import DEFAULT_CONFIG
+
+
+class TokenBucket:
+    """令牌桶限流器（线程安全）"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        Args:
+            rate: 每秒补充的令牌数，<=0 表示不限流
+            capacity: 桶容量（允许的突发请求数），默认等于 rate
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        """获取令牌，不足时阻塞等待"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_upstream_limiter = None
+_upstream_limiter_lock = threading.Lock()
+
+
+def get_upstream_limiter() -> TokenBucket:
+    """获取进程级共享的上游请求限流器"""
+    global _upstream_limiter
+    with _upstream_limiter_lock:
+        if _upstream_limiter is None:
+            config = DEFAULT_CONFIG["data"]
+            _upstream_limiter = TokenBucket(config["upstream_rate"], config["upstream_burst"])
+        return _upstream_limiter
@@ -0,0 +1,133 @@
+"""
+A股交易日历
+
+交易日 = 周一至周五中除法定节假日以外的日期（调休补班的周末交易所不开市）。
+节假日数据来自 chinesecalendar，超出其覆盖年份的部分退化为仅排除周末。
+交易日预先计算为有序的 datetime64 数组，所有查询均为二分查找。
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .logger import logger
+
+try:
+    import chinese_calendar
+except ImportError:  # pragma: no cover - 缺少依赖时仅排除周末
+    chinese_calendar = None
+
+# 日历覆盖范围
+CALENDAR_START = "2004-01-01"
+
+REBALANCE_FREQS = ("daily", "weekly", "monthly")
+
+
+def _to_datetime64(date) -> np.datetime64:
+    return np.datetime64(pd.Timestamp(date).normalize().value, "ns")
+
+
+class TradingCalendar:
+    """上交所/深交所交易日历"""
+
+    def __init__(self, start: str = CALENDAR_START, end: str = None):
+        """
+        Args:
+            start: 日历开始日期
+            end: 日历结束日期，默认次年年末
+        """
+        self.logger = logger
+        if end is None:
+            end = f"{pd.Timestamp.today().year + 1}-12-31"
+        days = pd.bdate_range(start, end).values.astype("datetime64[ns]")
+
+        if chinese_calendar is not None:
+            holidays = np.array(
+                sorted(pd.Timestamp(d).value for d in chinese_calendar.holidays), dtype="int64"
+            ).view("datetime64[ns]")
+            days = days[~np.isin(days, holidays)]
+            covered_until = max(chinese_calendar.holidays)
+            if pd.Timestamp(end) > pd.Timestamp(covered_until):
+                self.logger.debug(f"{covered_until.year} 年之后的节假日数据缺失，仅排除周末")
+
+        self.days = days
+        self.start = pd.Timestamp(days[0]) if len(days) else None
+        self.end = pd.Timestamp(days[-1]) if len(days) else None
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def is_trading_day(self, date) -> bool:
+        """是否为交易日"""
+        value = _to_datetime64(date)
+        i = np.searchsorted(self.days, value)
+        return bool(i < len(self.days) and self.days[i] == value)
+
+    def count(self, start_date, end_date) -> int:
+        """闭区间 [start_date, end_date] 内的交易日数量"""
+        lo = np.searchsorted(self.days, _to_datetime64(start_date), side="left")
+        hi = np.searchsorted(self.days, _to_datetime64(end_date), side="right")
+        return int(max(hi - lo, 0))
+
+    def trading_days(self, start_date, end_date) -> pd.DatetimeIndex:
+        """闭区间 [start_date, end_date] 内的交易日"""
+        lo = np.searchsorted(self.days, _to_datetime64(start_date), side="left")
+        hi = np.searchsorted(self.days, _to_datetime64(end_date), side="right")
+        return pd.DatetimeIndex(self.days[lo:hi])
+
+    def next_trading_day(self, date, n: int = 1) -> pd.Timestamp:
+        """date 之后的第 n 个交易日"""
+        i = np.searchsorted(self.days, _to_datetime64(date), side="right") + n - 1
+        return pd.Timestamp(self.days[min(i, len(self.days) - 1)])
+
+    def previous_trading_day(self, date, n: int = 1) -> pd.Timestamp:
+        """date 之前的第 n 个交易日"""
+        i = np.searchsorted(self.days, _to_datetime64(date), side="left") - n
+        return pd.Timestamp(self.days[max(i, 0)])
+
+    def rebalance_dates(self, start_date, end_date, freq: str = "weekly") -> pd.DatetimeIndex:
+        """
+        生成再平衡日期
+
+        Args:
+            start_date: 开始日期
+            end_date: 结束日期
+            freq: daily 每个交易日；weekly 每周首个交易日；monthly 每月首个交易日
+        """
+        if freq not in REBALANCE_FREQS:
+            raise ValueError(f"不支持的再平衡频率: {freq}")
+        days = self.trading_days(start_date, end_date)
+        if freq == "daily" or len(days) == 0:
+            return days
+
+        period = days.to_period("W" if freq == "weekly" else "M").asi8
+        first = np.ones(len(days), dtype=bool)
+        first[1:] = period[1:] != period[:-1]
+        return days[first]
+
+    def align(self, dates, targets) -> pd.DatetimeIndex:
+        """
+        将目标日期映射到 dates 中当天或之后最近的日期（如停牌时顺延）
+
+        Args:
+            dates: 有序的可用日期
+            targets: 目标日期
+        """
+        dates = pd.DatetimeIndex(dates)
+        positions = dates.searchsorted(pd.DatetimeIndex(targets), side="left")
+        positions = np.unique(positions[positions < len(dates)])
+        return dates[positions]
+
+
+_trading_calendar = None
+_trading_calendar_lock = threading.Lock()
+
+
+def get_trading_calendar() -> TradingCalendar:
+    """获取进程级共享的交易日历"""
+    global _trading_calendar
+    with _trading_calendar_lock:
+        if _trading_calendar is None:
+            _trading_calendar = TradingCalendar()
+        return _trading_calendar
@@ -36,9 +36,32 @@ class FactorComputeSerializer(serializers.Serializer):
     """因子计算序列化器"""
 
     factor_names = serializers.ListField(
-        child=serializers.CharField(), min_length=1, help_text="因子名称列表"
+        child=serializers.CharField(), required=False, min_length=1, help_text="因子名称列表"
     )
     symbol = serializers.CharField(required=False, help_text="股票代码")
+    expressions = serializers.ListField(
+        child=serializers.CharField(max_length=1000),
+        required=False,
+        min_length=1,
+        max_length=500,
+        help_text="因子表达式列表，如 rank(ts_mean(close,5)/ts_mean(close,20))",
+    )
+    symbols = serializers.ListField(
+        child=serializers.CharField(), required=False, help_text="表达式模式的股票代码列表"
+    )
+    stock_pool = serializers.ChoiceField(
+        choices=["hs300", "zz500", "cyb", "custom"], default="hs300", help_text="股票池"
+    )
+    start_date = serializers.DateField(default="2020-01-01")
+    end_date = serializers.DateField(default="2023-12-31")
+    adjust = serializers.ChoiceField(
+        choices=["qfq", "hfq", "none"], default="qfq", help_text="复权类型"
+    )
+
+    def validate(self, attrs):
+        if not attrs.get("factor_names") and not attrs.get("expressions"):
+            raise serializers.ValidationError("factor_names 与 expressions 至少提供一个")
+        return attrs
 
 
 class ICAnalysisSerializer(serializers.Serializer):
@@ -51,6 +74,41 @@ class ICAnalysisSerializer(serializers.Serializer):
     window = serializers.IntegerField(required=False, min_value=1, help_text="滚动窗口")
 
 
+class ICMatrixSerializer(serializers.Serializer):
+    """多因子多持有期IC矩阵序列化器"""
+
+    factor_names = serializers.ListField(
+        child=serializers.CharField(), min_length=1, max_length=200, help_text="因子名称列表"
+    )
+    horizons = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=250),
+        default=[1, 5, 10, 20],
+        min_length=1,
+        max_length=20,
+        help_text="持有期（交易日）",
+    )
+    method = serializers.ChoiceField(
+        choices=["spearman", "pearson"], default="spearman", help_text="IC计算方法"
+    )
+    price = serializers.ChoiceField(
+        choices=["close", "open"],
+        default="close",
+        help_text="未来收益口径：收盘到收盘/次日开盘到开盘",
+    )
+    symbols = serializers.ListField(
+        child=serializers.CharField(), required=False, help_text="股票代码列表，不传则使用股票池"
+    )
+    stock_pool = serializers.ChoiceField(
+        choices=["hs300", "zz500", "cyb", "custom"], default="hs300", help_text="股票池"
+    )
+    start_date = serializers.DateField(default="2020-01-01")
+    end_date = serializers.DateField(default="2023-12-31")
+    adjust = serializers.ChoiceField(
+        choices=["qfq", "hfq", "none"], default="qfq", help_text="复权类型"
+    )
+    include_series = serializers.BooleanField(default=False, help_text="是否返回逐日IC")
+
+
 class DecileAnalysisSerializer(serializers.Serializer):
     """分层回测序列化器"""
 
@@ -9,6 +9,7 @@ from .views import (
     FactorComputeView,
     FactorListView,
     ICAnalysisView,
+    ICMatrixView,
     StatsView,
     StockListView,
     StockPoolView,
@@ -31,6 +32,7 @@ urlpatterns = [
     path("factors/compute/", FactorComputeView.as_view(), name="factor-compute"),
     # 因子分析
     path("analysis/ic/", ICAnalysisView.as_view(), name="ic-analysis"),
+    path("analysis/ic-matrix/", ICMatrixView.as_view(), name="ic-matrix"),
     path("analysis/decile/", DecileAnalysisView.as_view(), name="decile-analysis"),
     # 回测
     path("backtest/", BacktestView.as_view(), name="backtest"),
@@ -97,6 +97,7 @@ class DataFetchView(APIView):
 
             if market_data.empty:
                 raise Exception("获取数据为空")
+            failed_symbols = market_data.attrs.get("failed_symbols", [])
 
             # 处理NaN值用于JSON序列化
             market_data = market_data.copy()
@@ -118,6 +119,7 @@ class DataFetchView(APIView):
                         "start": str(market_data["date"].min()),
                         "end": str(market_data["date"].max()),
                     },
+                    "failed_symbols": failed_symbols,
                     "data": market_data.to_dict("records"),
                 }
             )
@@ -221,6 +223,8 @@ class FactorComputeView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         data = serializer.validated_data
+        if data.get("expressions"):
+            return self._compute_expressions(data)
         factor_names = data["factor_names"]
 
         from apps.factorhub.core import get_factor_library
@@ -240,6 +244,73 @@ class FactorComputeView(APIView):
             }
         )
 
+    def _compute_expressions(self, data):
+        """表达式模式：在股票池面板上批量计算因子表达式，返回各表达式的覆盖率与最新截面"""
+        import numpy as np
+
+        from apps.factorhub.core import get_data_provider, get_factor_calculator
+        from apps.factorhub.core.data_provider import VALUATION_FIELDS
+        from apps.factorhub.core.expression import compile_expressions
+
+        provider = get_data_provider()
+        symbols = data.get("symbols") or provider.get_stock_pool(data["stock_pool"])
+        if not symbols:
+            return Response({"error": "股票列表为空"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 表达式只编译一次：先据此判断是否引用了估值字段（面板同时加入估值数据），再交给引擎计算
+        engine = get_factor_calculator().engine
+        compiled = compile_expressions(data["expressions"], engine.library)
+        graph = compiled[0]
+        valuation = any(n.op == "field" and n.params[0] in VALUATION_FIELDS for n in graph.order)
+        panel = provider.get_panel(
+            symbols,
+            str(data["start_date"]),
+            str(data["end_date"]),
+            adjust=data["adjust"],
+            valuation=valuation,
+        )
+        if panel.empty:
+            return Response({"error": "获取数据为空"}, status=status.HTTP_400_BAD_REQUEST)
+
+        block = engine.compute_expressions(panel, data["expressions"], compiled=compiled)
+
+        observed = max(int(panel.mask.sum()), 1)
+        latest_date = str(panel.dates[-1].date())
+        results = []
+        for expression in block.names:
+            if expression not in block.computed:
+                results.append({"expression": expression, "error": block.errors.get(expression)})
+                continue
+            values = block[expression]
+            latest = values[-1]
+            results.append(
+                {
+                    "expression": expression,
+                    "coverage": float((~np.isnan(values) & panel.mask).sum() / observed),
+                    "latest": {
+                        symbol: (None if np.isnan(v) else float(v))
+                        for symbol, v in zip(panel.symbols, latest)
+                    },
+                }
+            )
+
+        return Response(
+            {
+                "count": len(block.names),
+                "computed": len(block.computed),
+                "symbols": len(panel.symbols),
+                "date_range": {"start": str(panel.dates[0].date()), "end": latest_date},
+                "latest_date": latest_date,
+                "plan": block.graph_stats,
+                "cache": {
+                    "hits": len(block.cache_hits),
+                    "misses": len(block.computed) - len(block.cache_hits),
+                },
+                "failed_symbols": panel.attrs.get("failed_symbols", []),
+                "results": results,
+            }
+        )
+
 
 @method_decorator(csrf_exempt, name="dispatch")
 class ICAnalysisView(APIView):
@@ -269,6 +340,84 @@ class ICAnalysisView(APIView):
         )
 
 
+def _json_float(value):
+    """NaN/inf 转为 None，其余转为 float"""
+    value = float(value)
+    return value if value == value and abs(value) != float("inf") else None
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class ICMatrixView(APIView):
+    """多因子多持有期IC矩阵API"""
+
+    def post(self, request):
+        """在股票池面板上一次计算多个因子在多个持有期上的IC"""
+        from apps.factorhub.serializers import ICMatrixSerializer
+
+        serializer = ICMatrixSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        from apps.factorhub.core import (
+            get_data_provider,
+            get_factor_analyzer,
+            get_factor_calculator,
+        )
+        from apps.factorhub.core.data_provider import VALUATION_FIELDS
+
+        data = serializer.validated_data
+        provider = get_data_provider()
+        symbols = data.get("symbols") or provider.get_stock_pool(data["stock_pool"])
+        if not symbols:
+            return Response({"error": "股票列表为空"}, status=status.HTTP_400_BAD_REQUEST)
+
+        panel = provider.get_panel(
+            symbols,
+            str(data["start_date"]),
+            str(data["end_date"]),
+            adjust=data["adjust"],
+            valuation=any(name in VALUATION_FIELDS for name in data["factor_names"]),
+        )
+        if panel.empty:
+            return Response({"error": "获取数据为空"}, status=status.HTTP_400_BAD_REQUEST)
+
+        block = get_factor_calculator().engine.compute(panel, data["factor_names"])
+        result = get_factor_analyzer().calculate_ic_matrix(
+            block, panel, data["horizons"], data["method"], data["price"]
+        )
+        if "error" in result:
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+
+        summary = [
+            {
+                key: value if key in ("factor", "horizon", "sample_count") else _json_float(value)
+                for key, value in row.items()
+            }
+            for row in result["summary"]
+        ]
+        response = {
+            "method": result["method"],
+            "price": data["price"],
+            "factors": result["factors"],
+            "horizons": result["horizons"],
+            "missing_factors": [n for n in data["factor_names"] if n not in block.computed],
+            "symbols": len(panel.symbols),
+            "date_range": {"start": result["dates"][0], "end": result["dates"][-1]},
+            "cache": {"hits": len(block.cache_hits)},
+            "failed_symbols": panel.attrs.get("failed_symbols", []),
+            "summary": summary,
+        }
+        if data["include_series"]:
+            response["series"] = {
+                "dates": result["dates"],
+                "ic": [
+                    [[_json_float(v) for v in row] for row in per_factor]
+                    for per_factor in result["ic"]
+                ],
+            }
+        return Response(response)
+
+
 @method_decorator(csrf_exempt, name="dispatch")
 class DecileAnalysisView(APIView):
     """分层回测API"""
@@ -0,0 +1,465 @@
+"""
+Tests for the factorhub market data layer.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def make_bars(start="2020-01-01", end="2020-12-31", seed=0):
+    """Build a daily bar frame shaped like ak.stock_zh_a_daily output."""
+    dates = pd.bdate_range(start, end)
+    rng = np.random.default_rng(seed)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, len(dates))))
+    return pd.DataFrame(
+        {
+            "date": dates,
+            "open": close * 0.99,
+            "high": close * 1.01,
+            "low": close * 0.98,
+            "close": close,
+            "volume": rng.integers(100000, 1000000, len(dates)).astype(float),
+            "amount": close * 1e6,
+            "outstanding_share": 1e9,
+            "turnover": 0.01,
+        }
+    )
+
+
+@pytest.fixture
+def bar_store(tmp_path):
+    """Provide a BarStore rooted in a temporary directory."""
+    from apps.factorhub.core.bar_store import BarStore
+
+    return BarStore(tmp_path / "bars")
+
+
+class TestBarStore:
+    """Test cases for the columnar bar store."""
+
+    def test_write_and_read_range(self, bar_store):
+        """Test that a range read returns only the requested rows and columns."""
+        bars = make_bars()
+        bar_store.write("600000", "qfq", bars)
+
+        df = bar_store.read("600000", "qfq", "2020-03-01", "2020-03-31", columns=["close"])
+
+        expected = bars[(bars["date"] >= "2020-03-01") & (bars["date"] <= "2020-03-31")]
+        assert list(df.columns) == ["date", "close", "symbol"]
+        assert len(df) == len(expected)
+        np.testing.assert_allclose(df["close"].values, expected["close"].values)
+
+    def test_append_only_adds_newer_rows(self, bar_store):
+        """Test that append skips rows already covered by the partition."""
+        bars = make_bars()
+        bar_store.write("600000", "qfq", bars.iloc[:100])
+        meta = bar_store.append("600000", "qfq", bars.iloc[50:])
+
+        assert meta["rows"] == len(bars)
+        assert meta["generation"] == 0
+        df = bar_store.read("600000", "qfq")
+        np.testing.assert_allclose(df["close"].values, bars["close"].values)
+
+    def test_rewrite_rereads_partition_under_lock(self, bar_store):
+        """Test that rewrite splices into the current partition, keeping rows appended meanwhile."""
+        bars = make_bars()
+        bar_store.write("600000", "qfq", bars.iloc[50:100])
+        stale = bar_store.read("600000", "qfq")
+        bar_store.append("600000", "qfq", bars.iloc[100:])
+
+        meta = bar_store.rewrite(
+            "600000", "qfq", lambda cached: pd.concat([bars.iloc[:50], cached])
+        )
+
+        assert len(stale) == 50
+        assert meta["rows"] == len(bars)
+        assert meta["generation"] == 1
+        df = bar_store.read("600000", "qfq")
+        np.testing.assert_allclose(df["close"].values, bars["close"].values)
+
+    def test_missing_partition(self, bar_store):
+        """Test that reading an unknown partition returns an empty frame."""
+        assert bar_store.info("600016", "qfq") is None
+        assert bar_store.read("600016", "qfq").empty
+
+    def test_manifest_tracks_coverage_and_checksum(self, bar_store):
+        """Test that the manifest records coverage and a checksum that survives appends."""
+        from apps.factorhub.core.bar_store import BarStore
+
+        bars = make_bars()
+        bar_store.write("600000", "qfq", bars.iloc[:100])
+        bar_store.append("600000", "qfq", bars.iloc[100:])
+
+        # A fresh store instance sees the same entry without touching column files
+        entry = BarStore(bar_store.root).info("600000", "qfq")
+        assert entry["rows"] == len(bars)
+        assert entry["start"] == "2020-01-01"
+        assert entry["end"] == bars["date"].iloc[-1].strftime("%Y-%m-%d")
+        assert bar_store.verify("600000", "qfq")
+
+    def test_manifest_journal_is_compacted(self, tmp_path, monkeypatch):
+        """Test that puts append to a journal that is compacted and replayed by other readers."""
+        from apps.factorhub.core import manifest as manifest_module
+
+        monkeypatch.setattr(manifest_module, "JOURNAL_COMPACT_MIN", 8)
+        writer = manifest_module.CacheManifest(tmp_path)
+        reader = manifest_module.CacheManifest(tmp_path)
+        for i in range(5):
+            writer.put({"symbol": f"60000{i}", "adjust": "qfq", "rows": i})
+        assert len(reader.entries()) == 5
+
+        for i in range(20):
+            writer.put({"symbol": f"60000{i % 5}", "adjust": "qfq", "rows": 100 + i})
+        writer.remove("600004", "qfq")
+
+        # The journal was folded into the snapshot instead of growing with every put
+        assert len(writer.journal_path.read_bytes().splitlines()) < 8
+        assert reader.get("600004", "qfq") is None
+        assert reader.get("600000", "qfq")["rows"] == 115
+        fresh = manifest_module.CacheManifest(tmp_path)
+        assert sorted(e["rows"] for e in fresh.entries()) == [115, 116, 117, 118]
+
+
+class TestFrameCache:
+    """Test cases for the in-process frame cache."""
+
+    def test_lru_eviction_and_version_invalidation(self):
+        """Test that the byte budget evicts LRU entries and stale versions miss."""
+        from apps.factorhub.core.frame_cache import FrameCache
+
+        frame = make_bars()
+        size = int(frame.memory_usage(index=True, deep=True).sum())
+        cache = FrameCache(max_bytes=size * 2)
+
+        cache.put("a", 1, frame)
+        cache.put("b", 1, frame)
+        assert cache.get("a", 1) is frame
+        cache.put("c", 1, frame)
+
+        assert cache.get("b", 1) is None
+        assert cache.get("a", 2) is None
+        stats = cache.stats()
+        assert stats["evictions"] == 1
+        assert stats["invalidations"] == 1
+        assert stats["hits"] == 1
+
+
+def make_upstream(latency=0.0, failing=()):
+    """Build a stand-in for ak.stock_zh_a_daily that sleeps to mimic network latency."""
+    calls = []
+
+    def stock_zh_a_daily(symbol="", start_date="19900101", end_date="21000118", adjust=""):
+        calls.append(symbol)
+        time.sleep(latency)
+        code = symbol[2:]
+        if code in failing:
+            raise ConnectionError(f"upstream error for {code}")
+        bars = make_bars("2019-01-01", "2021-12-31", seed=int(code))
+        dates = bars["date"]
+        return bars[
+            (dates >= pd.Timestamp(start_date)) & (dates <= pd.Timestamp(end_date))
+        ].reset_index(drop=True)
+
+    stock_zh_a_daily.calls = calls
+    return stock_zh_a_daily
+
+
+@pytest.fixture
+def provider_factory(tmp_path, monkeypatch):
+    """Build data providers backed by a temporary cache and a fake upstream."""
+    from apps.factorhub.core import data_provider
+    from apps.factorhub.core.frame_cache import FrameCache
+    from apps.factorhub.core.singleflight import SingleFlight
+    from apps.factorhub.core.throttle import TokenBucket
+
+    def factory(upstream, rate=0, burst=None):
+        monkeypatch.setattr(data_provider.ak, "stock_zh_a_daily", upstream)
+        return data_provider.AKShareDataProvider(
+            cache_dir=tmp_path,
+            frame_cache=FrameCache(64 * 1024 * 1024),
+            rate_limiter=TokenBucket(rate, burst),
+            singleflight=SingleFlight(),
+        )
+
+    return factory
+
+
+class TestMultipleStocksFetch:
+    """Test cases for concurrent multi-symbol fetching."""
+
+    symbols = ["600000", "600016", "600019", "600028", "600030", "600036", "600048", "600050"]
+
+    def test_concurrent_fetch_is_ordered_and_faster(self, provider_factory):
+        """Test that a concurrent fetch keeps input order and overlaps upstream latency."""
+        upstream = make_upstream(latency=0.25)
+        provider = provider_factory(upstream)
+        progress = []
+
+        started = time.monotonic()
+        df = provider.get_multiple_stocks_data(
+            self.symbols,
+            "2020-01-01",
+            "2020-12-31",
+            progress_callback=lambda p, s: progress.append((p, s)),
+            max_workers=8,
+        )
+        elapsed = time.monotonic() - started
+
+        assert elapsed < 0.25 * len(self.symbols) / 2
+        assert list(df["symbol"].unique()) == self.symbols
+        assert len(progress) == len(self.symbols)
+        assert progress[-1][0] == 1.0
+        assert df.attrs["failed_symbols"] == []
+
+    def test_failures_are_reported_without_aborting(self, provider_factory):
+        """Test that per-symbol upstream errors are reported and the batch completes."""
+        provider = provider_factory(make_upstream(failing={"600019"}))
+
+        df = provider.get_multiple_stocks_data(self.symbols, "2020-01-01", "2020-12-31")
+
+        assert "600019" not in set(df["symbol"])
+        assert df["symbol"].nunique() == len(self.symbols) - 1
+        failed = df.attrs["failed_symbols"]
+        assert [f["symbol"] for f in failed] == ["600019"]
+        assert "upstream error" in failed[0]["error"]
+
+    def test_get_panel_aligns_symbols(self, provider_factory):
+        """Test that get_panel returns a dates × symbols panel and reports failures."""
+        provider = provider_factory(make_upstream(failing={"600019"}))
+
+        panel = provider.get_panel(self.symbols[:4], "2020-01-01", "2020-03-31")
+
+        assert list(panel.symbols) == ["600000", "600016", "600028"]
+        assert panel["close"].shape == (len(panel.dates), 3)
+        assert [f["symbol"] for f in panel.attrs["failed_symbols"]] == ["600019"]
+
+    def test_upstream_rate_limit(self, provider_factory):
+        """Test that the token bucket bounds the upstream request rate."""
+        upstream = make_upstream()
+        provider = provider_factory(upstream, rate=20, burst=1)
+
+        started = time.monotonic()
+        provider.get_multiple_stocks_data(self.symbols[:5], "2020-01-01", "2020-12-31")
+
+        assert len(upstream.calls) == 5
+        assert time.monotonic() - started >= 4 / 20
+
+
+class TestSingleFlight:
+    """Test cases for coalescing identical upstream fetches."""
+
+    def test_concurrent_requests_share_one_fetch(self, provider_factory):
+        """Test that simultaneous requests for the same range hit the upstream once."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        upstream = make_upstream(latency=0.2)
+        provider = provider_factory(upstream)
+
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            futures = [
+                executor.submit(provider.get_daily_data, "600000", "2020-01-01", "2020-12-31")
+                for _ in range(6)
+            ]
+            frames = [f.result() for f in futures]
+
+        assert len(upstream.calls) == 1
+        assert all(len(df) == len(frames[0]) > 0 for df in frames)
+        assert provider.singleflight.stats() == {"executed": 1, "shared": 5}
+
+    def test_errors_propagate_to_waiters(self):
+        """Test that every waiter sees the leader's exception."""
+        import threading
+
+        from apps.factorhub.core.singleflight import SingleFlight
+
+        flight = SingleFlight()
+        started = threading.Event()
+
+        def failing():
+            started.set()
+            time.sleep(0.1)
+            raise ValueError("upstream down")
+
+        errors = []
+
+        def call():
+            try:
+                flight.do("key", failing)
+            except ValueError as e:
+                errors.append(str(e))
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=call)
+        follower.start()
+        leader.join()
+        follower.join()
+
+        assert errors == ["upstream down", "upstream down"]
+
+    def test_provider_singleton_is_created_once(self, monkeypatch):
+        """Test that concurrent first calls share one process-wide provider."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        import apps.factorhub.core as core
+        from apps.factorhub.core import data_provider
+
+        created = []
+
+        class SlowProvider:
+            def __init__(self):
+                time.sleep(0.05)
+                created.append(self)
+
+        monkeypatch.setattr(data_provider, "AKShareDataProvider", SlowProvider)
+        monkeypatch.setattr(core, "_data_provider", None)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            providers = list(executor.map(lambda _: core.get_data_provider(), range(4)))
+
+        assert len(created) == 1
+        assert all(p is created[0] for p in providers)
+
+
+class TestIncrementalUpdate:
+    """Test cases for incremental tail-append updates."""
+
+    def test_tail_append_matches_full_fetch(self, provider_factory):
+        """Test that extending the cache fetches only the tail and keeps derived columns exact."""
+        upstream = make_upstream()
+        provider = provider_factory(upstream)
+        provider.get_daily_data("600000", "2020-01-01", "2020-06-30")
+        meta = provider.store.info("600000", "qfq")
+
+        summary = provider.update_daily_data(end_date="2020-12-31")
+
+        assert summary["updated"] == 1
+        assert summary["failed"] == []
+        assert provider.store.info("600000", "qfq")["generation"] == meta["generation"]
+        assert (
+            summary["rows_appended"] == provider.store.info("600000", "qfq")["rows"] - meta["rows"]
+        )
+
+        expected = provider._fetch_and_process("600000", "2020-01-01", "2020-12-31", "qfq")
+        df = provider.get_daily_data("600000", "2020-01-01", "2020-12-31")
+        assert len(upstream.calls) == 3
+        for column in ["pct_change", "change", "return_1d", "return_5d"]:
+            np.testing.assert_allclose(df[column].values, expected[column].values)
+
+    def test_head_prepend_recomputes_boundary(self, provider_factory):
+        """Test that extending the cache backwards fixes derived columns at the old start."""
+        provider = provider_factory(make_upstream())
+        provider.get_daily_data("600000", "2020-07-01", "2020-12-31")
+        provider.get_daily_data("600000", "2020-01-01", "2020-12-31")
+
+        expected = provider._fetch_and_process("600000", "2020-01-01", "2020-12-31", "qfq")
+        df = provider.get_daily_data("600000", "2020-01-01", "2020-12-31")
+        np.testing.assert_allclose(df["return_5d"].values, expected["return_5d"].values)
+
+
+class TestTradingCalendar:
+    """Test cases for the SSE/SZSE trading calendar."""
+
+    def test_holidays_and_weekends_are_skipped(self):
+        """Test that National Day holidays and make-up Saturdays are not trading days."""
+        from apps.factorhub.core.trading_calendar import TradingCalendar
+
+        calendar = TradingCalendar("2024-01-01", "2024-12-31")
+
+        assert not calendar.is_trading_day("2024-10-01")
+        assert not calendar.is_trading_day("2024-09-29")
+        assert calendar.is_trading_day("2024-10-08")
+        assert calendar.count("2024-09-28", "2024-10-08") == 2
+        assert calendar.next_trading_day("2024-09-30") == pd.Timestamp("2024-10-08")
+
+    def test_rebalance_dates_are_first_trading_days(self):
+        """Test that monthly rebalancing lands on the first trading day of each month."""
+        from apps.factorhub.core.trading_calendar import TradingCalendar
+
+        calendar = TradingCalendar("2024-01-01", "2024-12-31")
+        dates = calendar.rebalance_dates("2024-09-01", "2024-11-30", "monthly")
+
+        assert list(dates.strftime("%Y-%m-%d")) == ["2024-09-02", "2024-10-08", "2024-11-01"]
+
+    def test_weekend_gap_does_not_refetch(self, provider_factory):
+        """Test that a cache ending on Friday covers a request ending on Sunday."""
+        upstream = make_upstream()
+        provider = provider_factory(upstream)
+        provider.get_daily_data("600000", "2020-01-01", "2020-06-05")
+
+        provider.max_missing_days = 0
+        provider.get_daily_data("600000", "2020-01-01", "2020-06-07")
+
+        assert len(upstream.calls) == 1
+
+
+def make_valuation_upstream():
+    """Build a stand-in for ak.stock_value_em with weekly snapshots."""
+    calls = []
+
+    def stock_value_em(symbol=""):
+        calls.append(symbol)
+        dates = pd.date_range("2019-12-06", "2020-12-31", freq="W-FRI")
+        pe = 10 + np.arange(len(dates)) * 0.1 + int(symbol) % 7
+        return pd.DataFrame(
+            {
+                "数据日期": dates.date,
+                "当日收盘价": 10.0,
+                "当日涨跌幅": 0.0,
+                "总市值": pe * 1e9,
+                "流通市值": pe * 5e8,
+                "总股本": 1e9,
+                "流通股本": 5e8,
+                "PE(TTM)": pe,
+                "PE(静)": pe * 1.1,
+                "市净率": pe / 10,
+                "PEG值": 1.0,
+                "市现率": pe * 2,
+                "市销率": pe / 5,
+            }
+        )
+
+    stock_value_em.calls = calls
+    return stock_value_em
+
+
+class TestValuationData:
+    """Test cases for valuation snapshot ingestion."""
+
+    def test_panel_forward_fills_snapshots(self, provider_factory, monkeypatch):
+        """Test that snapshots are stored once and forward-filled onto trading days."""
+        from apps.factorhub.core import data_provider
+        from apps.factorhub.core.factor_engine import FactorEngine
+
+        upstream = make_valuation_upstream()
+        monkeypatch.setattr(data_provider.ak, "stock_value_em", upstream)
+        provider = provider_factory(make_upstream())
+        symbols = ["600000", "600016"]
+
+        panel = provider.get_panel(symbols, "2020-03-01", "2020-06-30", valuation=True)
+
+        snapshots = upstream("600016").set_index("数据日期")["PE(TTM)"]
+        snapshots.index = pd.to_datetime(snapshots.index)
+        expected = snapshots.reindex(panel.dates, method="ffill").to_numpy()
+        np.testing.assert_allclose(panel["pe"][:, 1], expected)
+        assert not np.isnan(panel["market_cap"]).any()
+        assert "|" in panel.attrs["data_version"]["600000"]
+        assert {"close", "pe", "market_cap"} <= panel.attrs["stored_fields"]
+
+        block = FactorEngine().compute(panel, ["pe", "pb", "ps", "pcf"])
+        assert block.computed == ["pe", "pb", "ps", "pcf"]
+        np.testing.assert_array_equal(block["pb"], panel["pb"])
+
+        # 分区已覆盖截止日期时不再请求上游
+        provider.get_panel(symbols, "2020-03-01", "2020-06-30", valuation=True)
+        assert sorted(upstream.calls) == ["600000", "600016", "600016"]
+
+        # 再次加入估值不改变数据版本，也不修改原来的版本字典
+        version = panel.attrs["data_version"]
+        snapshot = dict(version)
+        provider.add_valuation(panel, sync=False)
+        assert panel.attrs["data_version"] == snapshot
+        assert panel.attrs["data_version"] is not version and version == snapshot
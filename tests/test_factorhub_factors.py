@@ -0,0 +1,926 @@
+"""
+Tests for factorhub factor computation and analysis.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def make_market(n_symbols=12, start="2022-01-01", end="2022-12-31", seed=0):
+    """Build a long-format market frame with a random factor column."""
+    dates = pd.bdate_range(start, end)
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(n_symbols):
+        close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, len(dates))))
+        frames.append(
+            pd.DataFrame(
+                {
+                    "date": dates,
+                    "symbol": f"{600000 + i}",
+                    "open": close * 0.99,
+                    "high": close * 1.02,
+                    "low": close * 0.98,
+                    "close": close,
+                    "volume": rng.integers(100000, 1000000, len(dates)).astype(float),
+                    "signal": rng.normal(size=len(dates)),
+                }
+            )
+        )
+    df = pd.concat(frames, ignore_index=True)
+    df["return_1d"] = df.groupby("symbol")["close"].pct_change()
+    return df
+
+
+@pytest.fixture
+def market():
+    return make_market()
+
+
+class TestMarketPanel:
+    """Test cases for the aligned dates × symbols panel."""
+
+    def test_round_trip_with_missing_rows(self, market):
+        """Test that long -> panel -> long preserves rows and marks gaps as NaN."""
+        from apps.factorhub.core.panel import MarketPanel
+
+        ragged = market.drop(index=[5, 6, 300]).reset_index(drop=True)
+        panel = MarketPanel.from_long(ragged, ["close", "volume"])
+
+        assert panel.shape == (market["date"].nunique(), market["symbol"].nunique())
+        assert panel.mask.sum() == len(ragged)
+        assert np.isnan(panel["close"][5, 0])
+
+        long = panel.to_long()
+        expected = ragged.sort_values(["symbol", "date"]).reset_index(drop=True)
+        assert list(long.columns) == ["date", "symbol", "close", "volume"]
+        np.testing.assert_allclose(long["close"].values, expected["close"].values)
+        assert (long["date"].values == expected["date"].values).all()
+
+    def test_ffill_carries_last_observation(self):
+        """Test that forward fill uses the last observed value per symbol."""
+        from apps.factorhub.core.panel import MarketPanel
+
+        close = np.array([[1.0, np.nan], [np.nan, 2.0], [3.0, np.nan]])
+        panel = MarketPanel(pd.bdate_range("2024-01-01", periods=3), ["a", "b"], {"close": close})
+
+        np.testing.assert_array_equal(
+            panel.ffill("close"), np.array([[1.0, np.nan], [1.0, 2.0], [3.0, 2.0]])
+        )
+
+
+class TestFactorCalculator:
+    """Test cases for panel-based factor computation."""
+
+    factors = [
+        "ma20",
+        "ema10",
+        "rsi",
+        "macd",
+        "boll_upper",
+        "boll_lower",
+        "atr",
+        "obv",
+        "roc",
+        "williams_r",
+        "volume_ratio",
+        "volume_ma5",
+        "momentum_1m",
+        "volatility_20",
+    ]
+
+    def test_matches_per_symbol_computation(self, market):
+        """Test that vectorized panel factors equal per-symbol time-series results."""
+        from apps.factorhub.core.factor_calculator import FactorCalculator
+        from apps.factorhub.core.factor_lib import FactorLibrary
+
+        result = FactorCalculator().calculate_factors(market, self.factors)
+
+        library = FactorLibrary()
+        for name in self.factors:
+            expected = np.concatenate(
+                [library.calculate_factor(name, g).values for _, g in market.groupby("symbol")]
+            )
+            np.testing.assert_allclose(result[name].values, expected, rtol=1e-7, equal_nan=True)
+
+    def test_suspension_windows_follow_panel_calendar(self, market):
+        """Test that rolling windows count panel dates, so a suspension blanks spanning windows."""
+        from apps.factorhub.core.factor_calculator import FactorCalculator
+        from apps.factorhub.core.panel import MarketPanel
+        from apps.factorhub.core.streaming import StreamingFactors
+
+        dates = np.sort(market["date"].unique())
+        suspended = (market["symbol"] == "600003") & market["date"].isin(dates[-7:-3])
+        panel = MarketPanel.from_long(market[~suspended])
+        j = panel.symbols.get_loc("600003")
+        assert not panel.mask[-7:-3, j].any()
+
+        values = FactorCalculator().compute_panel_factor(panel, "ma5")
+
+        # 停牌日及其后 4 个交易日的窗口覆盖停牌日，结果为 NaN；不按股票自身的交易行滚动
+        close = pd.Series(panel["close"][:, j])
+        np.testing.assert_allclose(values[:, j], close.rolling(5).mean(), equal_nan=True)
+        assert np.isnan(values[-7:, j]).all()
+        assert not np.isnan(values[-7:, np.arange(len(panel.symbols)) != j]).any()
+        # 流式计算的语义相同
+        streaming = StreamingFactors.from_library(["ma5"], panel.symbols).warm_up(panel)
+        np.testing.assert_allclose(streaming.values["ma5"], values[-1], equal_nan=True)
+
+    def test_kernels_match_pandas_with_gaps(self):
+        """Test that array kernels follow pandas NaN semantics for late listings and gaps."""
+        from apps.factorhub.core import kernels
+
+        rng = np.random.default_rng(1)
+        values = 10 + rng.normal(size=(80, 3)).cumsum(axis=0)
+        values[:15, 1] = np.nan
+        values[40:43, 2] = np.nan
+        frame = pd.DataFrame(values)
+
+        np.testing.assert_allclose(
+            kernels.ewm_mean(values, 12), frame.ewm(span=12, adjust=False).mean(), rtol=1e-10
+        )
+        np.testing.assert_allclose(
+            kernels.rolling_std(values, 10), frame.rolling(10).std(), rtol=1e-7
+        )
+        np.testing.assert_allclose(
+            kernels.rolling_max(values, 10), frame.rolling(10).max(), rtol=1e-12
+        )
+        np.testing.assert_allclose(kernels.pct_change(values, 5), frame.pct_change(5), rtol=1e-12)
+
+    def test_rolling_kernels_with_gaps_and_drift(self):
+        """Test O(n) rolling max/min/rank against pandas and std against an exact two-pass."""
+        from apps.factorhub.core import kernels
+
+        rng = np.random.default_rng(2)
+        values = 10 + rng.normal(size=(300, 3)).cumsum(axis=0)
+        values[:17, 1] = np.nan
+        values[100:104, 2] = np.nan
+        # large level with steady drift: a fixed-offset sum of squares loses precision here
+        values[:, 0] = 1e6 + 1e3 * np.arange(300) + rng.normal(scale=0.01, size=300)
+        frame = pd.DataFrame(values)
+
+        for window in (3, 14, 60):
+            rolling = frame.rolling(window)
+            np.testing.assert_array_equal(kernels.rolling_max(values, window), rolling.max())
+            np.testing.assert_array_equal(kernels.rolling_min(values, window), rolling.min())
+            np.testing.assert_allclose(
+                kernels.rolling_rank(values, window, pct=True), rolling.rank(pct=True)
+            )
+
+            windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=0)
+            np.testing.assert_allclose(
+                kernels.rolling_std(values, window)[window - 1 :],
+                windows.std(axis=-1, ddof=1),
+                rtol=1e-12,
+            )
+            np.testing.assert_allclose(
+                kernels.rolling_mean(values, window)[window - 1 :],
+                windows.mean(axis=-1),
+                rtol=1e-12,
+            )
+
+    def test_panel_input_returns_panel(self, market):
+        """Test that a MarketPanel input yields a panel with factor fields added."""
+        from apps.factorhub.core.factor_calculator import FactorCalculator
+        from apps.factorhub.core.panel import MarketPanel
+
+        panel = MarketPanel.from_long(market)
+        result = FactorCalculator().calculate_factors(panel, ["ma5", "rsi"])
+
+        assert isinstance(result, MarketPanel)
+        assert "ma5" in result and "ma5" not in panel
+        assert result["ma5"].shape == panel.shape
+
+
+class TestFactorGraph:
+    """Test cases for the shared-intermediate factor graph."""
+
+    def test_shared_intermediates_computed_once(self, market):
+        """Test that overlapping factors reuse one rolling mean per input and window."""
+        from apps.factorhub.core.factor_engine import FactorEngine
+        from apps.factorhub.core.panel import MarketPanel
+
+        names = ["ma20", "boll_upper", "boll_lower", "volume_ratio", "volume_ma20"]
+        block = FactorEngine().compute(MarketPanel.from_long(market), names)
+
+        stats = block.graph_stats
+        # rolling_mean(close), rolling_std(close), rolling_mean(volume), 2 * std,
+        # upper, lower, volume - ma, ratio; unshared trees need 1 + 4 + 4 + 4 + 1
+        assert stats["nodes"] == 8
+        assert stats["unshared_nodes"] == 14
+        assert stats["executed"] == stats["nodes"]
+        np.testing.assert_allclose(
+            (block["boll_upper"] + block["boll_lower"]) / 2, block["ma20"], rtol=1e-12
+        )
+
+    def test_parallel_schedule_matches_sequential(self, market):
+        """Test that running independent nodes on a thread pool gives identical results."""
+        from apps.factorhub.core.factor_engine import FactorEngine
+        from apps.factorhub.core.panel import MarketPanel
+
+        panel = MarketPanel.from_long(market)
+        names = ["macd", "rsi", "atr", "williams_r", "momentum_1m", "volatility_20"]
+        sequential = FactorEngine(max_workers=1).compute(panel, names)
+        parallel = FactorEngine(max_workers=4).compute(panel, names)
+
+        np.testing.assert_array_equal(parallel.values, sequential.values)
+        assert parallel.computed == names
+
+    def test_process_pool_matches_thread(self, market):
+        """Test that shared-memory process shards give the same block as in-process runs."""
+        from apps.factorhub.core.factor_engine import FactorEngine
+        from apps.factorhub.core.panel import MarketPanel
+
+        panel = MarketPanel.from_long(market)
+        names = ["ma20", "rsi", "macd", "atr", "obv", "volatility_20", "missing"]
+        threaded = FactorEngine().compute(panel, names)
+        pooled = FactorEngine(executor="process", processes=3).compute(panel, names)
+
+        assert pooled.graph_stats["shards"] == 3
+        assert pooled.computed == threaded.computed == names[:-1]
+        np.testing.assert_array_equal(pooled.values, threaded.values)
+
+    def test_intermediates_are_released(self):
+        """Test that an intermediate is dropped once its last consumer has run."""
+        from apps.factorhub.core import factor_graph as fg
+
+        close = fg.field("close")
+        chain = close
+        for _ in range(6):
+            chain = fg.rolling_mean(chain, 2)
+        graph = fg.FactorGraph({"smooth": chain})
+        values = np.arange(40, dtype=float).reshape(20, 2)
+
+        result = graph.run({"close": values})
+
+        assert graph.stats()["executed"] == 6
+        assert graph.stats()["peak_live"] <= 2
+        np.testing.assert_allclose(result["smooth"][6:], values[3:-3])
+
+
+class TestFactorExpression:
+    """Test cases for the factor expression language."""
+
+    def test_parse_folds_constants_and_shares_subexpressions(self):
+        """Test constant folding, identity removal and commutative canonical form."""
+        from apps.factorhub.core.expression import ExpressionError, compile_expressions, parse
+
+        assert repr(parse("close * (2 - 1) + 0")) == "close"
+        assert repr(parse("ts_sum(volume, 2 * 5)")) == "mul(10.0, rolling_mean(volume, 10))"
+        assert parse("max(close, open) + volume") == parse("volume + max(open, close)")
+
+        graph, errors = compile_expressions(
+            [
+                "rank(ts_mean(close, 5) / ts_mean(close, 20))",
+                "ts_mean(close, 5) - ts_mean(close, 20)",
+                "zscore(ts_mean(close, 20))",
+                "ts_mean(close, 2.5)",
+            ]
+        )
+        assert list(errors) == ["ts_mean(close, 2.5)"]
+        assert graph.stats()["nodes"] == 6
+        assert graph.stats()["unshared_nodes"] == 9
+        with pytest.raises(ExpressionError):
+            parse("rank(close")
+
+    def test_deep_nesting_is_an_expression_error(self):
+        """Test that deeply nested or chained expressions fail to compile instead of recursing."""
+        from apps.factorhub.core.expression import MAX_DEPTH, compile_expressions, parse
+
+        deep = [
+            "abs(" * 5000 + "close" + ")" * 5000,
+            "(" * 5000 + "close" + ")" * 5000,
+            "-" * 5000 + "close",
+            " + ".join(["close"] * 5000),
+        ]
+        graph, errors = compile_expressions(deep + ["abs(close)"])
+        assert sorted(errors) == sorted(deep)
+        assert all(str(MAX_DEPTH) in message for message in errors.values())
+        assert list(graph.outputs) == ["abs(close)"]
+        assert repr(parse("abs(" * 50 + "close" + ")" * 50)) == "abs(" * 50 + "close" + ")" * 50
+
+    def test_expressions_match_pandas(self, market):
+        """Test that compiled expressions equal the same formulas written in pandas."""
+        from apps.factorhub.core.expression import compile_expressions
+        from apps.factorhub.core.factor_engine import FactorEngine
+        from apps.factorhub.core.panel import MarketPanel
+
+        panel = MarketPanel.from_long(market)
+        expressions = [
+            "rank(ts_mean(close, 5) / ts_mean(close, 20))",
+            "zscore(decay_linear(volume, 4))",
+            "-delta(close, 3) / ts_std(close, 10)",
+            "ts_rank(close, 10) - demean(rsi)",
+            "close + unknown_field",
+        ]
+        block = FactorEngine().compute_expressions(panel, expressions)
+
+        close, volume = panel.frame("close"), panel.frame("volume")
+        ratio = close.rolling(5).mean() / close.rolling(20).mean()
+        weights = np.arange(1, 5) / 10.0
+        decayed = volume.rolling(4).apply(lambda x: x @ weights, raw=True)
+        zscore = decayed.sub(decayed.mean(axis=1), axis=0).div(decayed.std(axis=1), axis=0)
+        rsi = pd.DataFrame(FactorEngine().compute(panel, ["rsi"])["rsi"], index=close.index)
+        expected = [
+            ratio.rank(axis=1, pct=True),
+            zscore,
+            -close.diff(3) / close.rolling(10).std(),
+            close.rolling(10).rank(pct=True).values - rsi.sub(rsi.mean(axis=1), axis=0).values,
+        ]
+        for expression, frame in zip(expressions, expected):
+            np.testing.assert_allclose(block[expression], frame, rtol=1e-9, equal_nan=True)
+        assert block.computed == expressions[:-1]
+        assert "unknown_field" in block.errors["close + unknown_field"]
+
+        # 调用方编译好的计算图直接交给引擎，结果相同
+        engine = FactorEngine()
+        compiled = compile_expressions(expressions, engine.library)
+        reused = engine.compute_expressions(panel, expressions, compiled=compiled)
+        np.testing.assert_array_equal(reused.values, block.values)
+        assert reused.errors == block.errors and compiled[1] == {}
+
+
+class TestFactorFamily:
+    """Test cases for window-sweep factor families."""
+
+    def test_family_matches_single_window_factors(self, market):
+        """Test that each window of a family equals the corresponding single factor."""
+        from apps.factorhub.core import factor_graph as fg
+        from apps.factorhub.core import factor_lib
+        from apps.factorhub.core.factor_engine import FactorEngine
+        from apps.factorhub.core.panel import MarketPanel
+
+        panel = MarketPanel.from_long(market)
+        windows = [5, 14, 60, 300]
+        engine = FactorEngine()
+        single = {
+            "ma": lambda w: factor_lib.TrendFactor("MA", "", w),
+            "momentum": lambda w: factor_lib.MomentumFactor("MOM", "", w),
+            "roc": lambda w: factor_lib.ROC(period=w),
+            "rsi": lambda w: factor_lib.RSI(period=w),
+        }
+        for family, make in single.items():
+            block = engine.compute_family(panel, family, windows)
+            assert block.values.shape == (len(windows),) + panel.shape
+            for window in windows:
+                expected = fg.evaluate(make(window).graph(), panel.fields)
+                np.testing.assert_allclose(
+                    block.window(window), expected, rtol=1e-9, atol=1e-12, equal_nan=True
+                )
+
+    def test_rank_family_matches_ic_analysis(self, market):
+        """Test that family IC ranking agrees with per-factor IC analysis."""
+        from apps.factorhub.core.factor_analyzer import FactorAnalyzer
+        from apps.factorhub.core.factor_engine import FactorEngine
+        from apps.factorhub.core.panel import MarketPanel
+
+        panel = MarketPanel.from_long(market)
+        block = FactorEngine().compute_family(panel, "momentum", [1, 5, 20])
+        analyzer = FactorAnalyzer()
+
+        ranking = analyzer.rank_factor_family(block, panel)
+
+        assert len(ranking["windows"]) == 3
+        irs = [abs(row["ir"]) for row in ranking["windows"]]
+        assert irs == sorted(irs, reverse=True)
+        for row in ranking["windows"]:
+            single = analyzer.calculate_ic_analysis(block.to_panel(panel), row["factor"])
+            assert row["ic_mean"] == pytest.approx(single["ic_mean"], rel=1e-9)
+            assert row["sample_count"] == single["sample_count"]
+
+
+class TestStreamingFactors:
+    """Test cases for one-day incremental factor updates."""
+
+    factors = [
+        "ma60",
+        "ema20",
+        "rsi",
+        "atr",
+        "macd",
+        "boll_upper",
+        "williams_r",
+        "obv",
+        "momentum_1m",
+        "volatility_20",
+    ]
+
+    def test_daily_updates_match_batch(self, market, tmp_path):
+        """Test that warm-up plus daily appends equal batch results, across a save/load."""
+        from apps.factorhub.core.factor_engine import FactorEngine
+        from apps.factorhub.core.panel import MarketPanel
+        from apps.factorhub.core.streaming import StreamingFactors
+
+        market.loc[market.sample(frac=0.02, random_state=0).index, "close"] = np.nan
+        panel = MarketPanel.from_long(market)
+        batch = FactorEngine().compute(panel, self.factors)
+
+        stream = StreamingFactors.from_library(self.factors, panel.symbols)
+        stream.warm_up(panel.slice_dates(end_date=panel.dates[-6]))
+        stream.save(tmp_path / "state.npz")
+        stream = StreamingFactors.from_library(self.factors, panel.symbols)
+        stream.load(tmp_path / "state.npz")
+
+        for i in range(len(panel.dates) - 5, len(panel.dates)):
+            day = market[market["date"] == panel.dates[i]]
+            values = stream.update(day, panel.dates[i])
+            for name in self.factors:
+                np.testing.assert_allclose(
+                    values[name], batch[name][i], rtol=1e-8, atol=1e-10, equal_nan=True
+                )
+        assert stream.last_date == panel.dates[-1]
+
+    def test_stale_date_is_ignored(self, market):
+        """Test that re-sending an already appended day leaves state unchanged."""
+        from apps.factorhub.core.factor_lib import FactorLibrary
+        from apps.factorhub.core.panel import MarketPanel
+
+        panel = MarketPanel.from_long(market)
+        stream = FactorLibrary().get_factor("ma5").streaming(panel.symbols).warm_up(panel)
+        before = stream.values["MA5"].copy()
+
+        stream.update(market[market["date"] == panel.dates[-1]], panel.dates[-1])
+
+        np.testing.assert_array_equal(stream.values["MA5"], before)
+
+    def test_node_state_requires_update(self):
+        """Test that a node state without update fails at construction."""
+        from apps.factorhub.core.streaming import NodeState, RingState
+
+        class Incomplete(RingState):
+            pass
+
+        with pytest.raises(TypeError):
+            NodeState(3)
+        with pytest.raises(TypeError):
+            Incomplete(3, 5)
+
+
+class TestFactorResultCache:
+    """Test cases for the content-addressed factor result cache."""
+
+    def test_warm_compute_is_a_lookup(self, market, tmp_path):
+        """Test cache hits, sharing between equal definitions and invalidation."""
+        from apps.factorhub.core.factor_cache import FactorResultCache
+        from apps.factorhub.core.factor_engine import FactorEngine
+        from apps.factorhub.core.panel import MarketPanel
+
+        panel = MarketPanel.from_long(market)
+        engine = FactorEngine(cache=FactorResultCache(tmp_path))
+        cold = engine.compute(panel, ["ma20", "rsi", "macd"])
+        assert cold.cache_hits == []
+
+        warm = engine.compute(panel, ["ma20", "rsi", "macd"])
+        assert sorted(warm.cache_hits) == ["ma20", "macd", "rsi"]
+        assert warm.computed == cold.computed
+        np.testing.assert_array_equal(warm.values, cold.values)
+
+        # 表达式与因子库中定义相同的因子共用缓存
+        block = engine.compute_expressions(panel, ["ts_mean(close, 20)"])
+        assert block.cache_hits == ["ts_mean(close, 20)"]
+        np.testing.assert_array_equal(block["ts_mean(close, 20)"], cold["ma20"])
+
+        # 收盘价变化后 ma20 不再命中
+        changed = market.copy()
+        changed["close"] *= 1.01
+        block = engine.compute(MarketPanel.from_long(changed), ["ma20"])
+        assert block.cache_hits == []
+
+    def test_versioned_panel_hashes_fields_not_from_store(self, market, tmp_path):
+        """Test that only store-sourced fields are keyed by the data version."""
+        from apps.factorhub.core.factor_cache import FactorResultCache
+        from apps.factorhub.core.factor_engine import FactorEngine
+        from apps.factorhub.core.panel import MarketPanel
+
+        panel = MarketPanel.from_long(market, ["close", "signal"])
+        panel.attrs["data_version"] = {s: "0:250:abc" for s in panel.symbols}
+        panel.attrs["stored_fields"] = frozenset(["close"])
+        engine = FactorEngine(cache=FactorResultCache(tmp_path))
+        expressions = ["ts_mean(close, 5)", "ts_mean(signal, 5)"]
+        engine.compute_expressions(panel, expressions)
+        assert sorted(engine.compute_expressions(panel, expressions).cache_hits) == expressions
+
+        # 面板取出后修改的字段按内容计算指纹，不会命中旧结果
+        panel["signal"] = panel["signal"] * 2
+        block = engine.compute_expressions(panel, expressions)
+        assert block.cache_hits == ["ts_mean(close, 5)"]
+        np.testing.assert_allclose(
+            block["ts_mean(signal, 5)"],
+            FactorEngine().compute_expressions(panel, ["ts_mean(signal, 5)"])["ts_mean(signal, 5)"],
+        )
+        panel["close"] = panel["close"] * 1.01
+        assert "close" not in panel.attrs["stored_fields"]
+        assert engine.compute_expressions(panel, ["ts_mean(close, 5)"]).cache_hits == []
+
+    def test_lru_eviction(self, tmp_path):
+        """Test that the least recently used entries are evicted over budget."""
+        from apps.factorhub.core.factor_cache import FactorResultCache
+
+        values = np.ones((100, 10))
+        cache = FactorResultCache(tmp_path, max_bytes=int(values.nbytes * 3.5))
+        for key in ["a", "b", "c"]:
+            cache.put(cache.key("panel", key), values)
+        # 读取 a 刷新其使用时间，写入 d 时淘汰最久未使用的 b
+        assert cache.get(cache.key("panel", "a")) is not None
+        cache.put(cache.key("panel", "d"), values)
+
+        assert cache.get(cache.key("panel", "b")) is None
+        assert all(cache.get(cache.key("panel", k)) is not None for k in ["a", "c", "d"])
+        assert cache.stats()["evictions"] == 1
+
+
+class TestPreprocess:
+    """Test cases for the cross-sectional preprocessing stage."""
+
+    def test_matches_per_date_reference(self):
+        """Test winsorize, rank-normal and neutralization against per-date loops."""
+        from scipy import stats
+
+        from apps.factorhub.core.preprocess import (
+            neutralize,
+            rank_normal,
+            winsorize_mad,
+            winsorize_percentile,
+        )
+
+        rng = np.random.default_rng(3)
+        values = rng.standard_t(3, (40, 60))
+        values[rng.random(values.shape) < 0.1] = np.nan
+        values[:, :10] = np.round(values[:, :10])
+        industry = np.broadcast_to(rng.integers(0, 4, 60), values.shape)
+        market_cap = np.exp(rng.normal(10, 1, values.shape))
+
+        mad_result = winsorize_mad(values, 3.0)
+        pct_result = winsorize_percentile(values, 0.05, 0.95)
+        normal = rank_normal(values)
+        residual = neutralize(values, industry, market_cap)
+        for t in range(len(values)):
+            valid = ~np.isnan(values[t])
+            x = values[t, valid]
+            median = np.median(x)
+            mad = np.median(np.abs(x - median)) * 1.4826
+            np.testing.assert_allclose(
+                mad_result[t, valid], np.clip(x, median - 3 * mad, median + 3 * mad)
+            )
+            low, high = np.quantile(x, [0.05, 0.95])
+            np.testing.assert_allclose(pct_result[t, valid], np.clip(x, low, high))
+            expected = stats.norm.ppf((stats.rankdata(x) - 0.5) / len(x))
+            np.testing.assert_allclose(normal[t, valid], expected)
+            design = np.column_stack([np.eye(4)[industry[t, valid]], np.log(market_cap[t, valid])])
+            beta = np.linalg.lstsq(design, x, rcond=None)[0]
+            np.testing.assert_allclose(residual[t, valid], x - design @ beta, atol=1e-10)
+        for result in (mad_result, pct_result, normal, residual):
+            assert np.isnan(result[np.isnan(values)]).all()
+
+    def test_pipeline_between_calculator_and_analyzer(self, market):
+        """Test that the preprocessed factor feeds the analyzer."""
+        from apps.factorhub.core.factor_analyzer import FactorAnalyzer
+        from apps.factorhub.core.factor_calculator import FactorCalculator
+        from apps.factorhub.core.panel import MarketPanel
+        from apps.factorhub.core.preprocess import Preprocessor
+
+        panel = MarketPanel.from_long(market)
+        industry = {symbol: "bank" if i % 2 else "steel" for i, symbol in enumerate(panel.symbols)}
+        preprocessor = Preprocessor(neutralize=True, industry=industry)
+        result = FactorCalculator().calculate_factors(panel, ["rsi"], preprocessor=preprocessor)
+
+        values = result.frame("rsi").dropna(how="all")
+        np.testing.assert_allclose(values.mean(axis=1), 0, atol=1e-10)
+        np.testing.assert_allclose(values.std(axis=1), 1)
+        analysis = FactorAnalyzer().calculate_ic_analysis(result, "rsi")
+        assert "error" not in analysis
+
+
+@pytest.mark.django_db(transaction=True)
+class TestFactorStore:
+    """Test cases for bulk factor persistence."""
+
+    def test_write_upsert_and_read_panel(self, market):
+        """Test chunked COPY writes, upserts of existing rows and panel reads."""
+        from apps.factorhub.core.factor_engine import FactorBlock, FactorEngine
+        from apps.factorhub.core.factor_store import FactorStore
+        from apps.factorhub.core.panel import MarketPanel
+        from apps.factorhub.models import FactorComputation
+
+        panel = MarketPanel.from_long(market)
+        block = FactorEngine().compute(panel, ["ma20"])
+        store = FactorStore(chunk_rows=500)
+        written = store.write(block)
+        assert written["ma20"] == np.isfinite(block["ma20"]).sum()
+
+        block["ma20"][-1] += 1
+        store.write(block)
+        assert FactorComputation.objects.filter(name="ma20").count() == written["ma20"]
+
+        symbols = list(panel.symbols[:5])
+        result = store.read("ma20", symbols, "2022-03-01", "2022-06-30")
+        expected = block.to_panel().frame("ma20").loc["2022-03-01":"2022-06-30", symbols]
+        np.testing.assert_array_equal(result["ma20"], expected.to_numpy())
+        assert store.read("ma20", symbols, "2030-01-01", "2030-12-31").empty
+
+        # 因子名中的逗号、引号经 CSV 格式 COPY 原样往返
+        name = 'ts_mean(close, 5) "q"'
+        block = FactorBlock([name], block.dates, block.symbols, block.values.copy())
+        store.write(block, [name])
+        result = store.read(name, symbols, "2022-03-01", "2022-06-30")
+        np.testing.assert_array_equal(
+            result[name],
+            MarketPanel(block.dates, block.symbols, {name: block[name]})
+            .frame(name)
+            .loc["2022-03-01":"2022-06-30", symbols]
+            .to_numpy(),
+        )
+
+
+class TestForwardReturns:
+    """Test forward-return panels shared by the analysis stages."""
+
+    def test_shifted_returns_and_cache(self, market, tmp_path):
+        """Test close/open forward returns against pandas shifts and reuse through the cache."""
+        from apps.factorhub.core.factor_cache import FactorResultCache
+        from apps.factorhub.core.forward_returns import ForwardReturns
+        from apps.factorhub.core.panel import MarketPanel
+
+        data = market.drop(index=market.index[market.index % 11 == 0])
+        service = ForwardReturns([1, 5], cache=FactorResultCache(tmp_path))
+        panel = service.attach(MarketPanel.from_long(data))
+
+        close, open_ = panel.frame("close"), panel.frame("open")
+        expected = {
+            "fwd_close_1": close.shift(-1) / close - 1,
+            "fwd_close_5": close.shift(-5) / close - 1,
+            "fwd_open_1": open_.shift(-2) / open_.shift(-1) - 1,
+            "fwd_open_5": open_.shift(-6) / open_.shift(-1) - 1,
+        }
+        for name, frame in expected.items():
+            np.testing.assert_allclose(panel[name], frame.values, rtol=1e-12, equal_nan=True)
+
+        again = service.attach(MarketPanel.from_long(data))
+        assert service.cache.stats()["hits"] == 4
+        np.testing.assert_array_equal(again["fwd_open_5"], panel["fwd_open_5"])
+
+    def test_analyzer_defaults_to_next_day_return(self, market):
+        """Test that IC analysis uses the next-day return and adds it to the panel once."""
+        from apps.factorhub.core.factor_analyzer import FactorAnalyzer
+        from apps.factorhub.core.panel import MarketPanel
+
+        data = market.copy()
+        # 当日收益作为因子：与 return_1d 完全相关，与次日收益无关
+        data["same_day"] = data["return_1d"]
+        panel = MarketPanel.from_long(data, ["close", "return_1d", "same_day"])
+        analyzer = FactorAnalyzer()
+
+        lookahead = analyzer.calculate_ic_analysis(panel, "same_day", "return_1d")
+        result = analyzer.calculate_ic_analysis(panel, "same_day")
+
+        assert lookahead["ic_mean"] == pytest.approx(1.0)
+        assert abs(result["ic_mean"]) < 0.1
+        assert "fwd_close_1" in panel
+        assert "error" not in analyzer.calculate_decile_analysis(data, "same_day")
+
+
+class TestRankCache:
+    """Test the shared cross-sectional rank/bucket cache."""
+
+    def test_buckets_match_qcut(self):
+        """Test vectorized quantile buckets against per-date pd.qcut with ties and gaps."""
+        from apps.factorhub.core import kernels
+
+        rng = np.random.default_rng(2)
+        values = np.round(rng.normal(size=(200, 30)), 1)
+        values[rng.random(values.shape) < 0.2] = np.nan
+        values[3] = 1.0
+
+        for n in (5, 10):
+            buckets = kernels.cs_quantile_buckets(values, n)
+            assert buckets.dtype == np.int8
+            for row, result in zip(values, buckets):
+                present = ~np.isnan(row)
+                expected = pd.qcut(row[present], n, labels=False, duplicates="drop")
+                np.testing.assert_array_equal(result[present], np.nan_to_num(expected, nan=-1))
+                assert (result[~present] == -1).all()
+
+    def test_stages_share_buckets(self, market):
+        """Test that decile analysis and the backtester bucket a factor only once."""
+        from apps.factorhub.core.backtester import Backtester
+        from apps.factorhub.core.factor_analyzer import FactorAnalyzer
+        from apps.factorhub.core.panel import MarketPanel
+        from apps.factorhub.core.rank_cache import RankCache
+
+        cache = RankCache()
+        panel = MarketPanel.from_long(market, ["close", "signal"])
+        analyzer = FactorAnalyzer(rank_cache=cache)
+
+        assert "error" not in analyzer.calculate_ic_analysis(panel, "signal")
+        assert "error" not in analyzer.calculate_decile_analysis(panel, "signal")
+        assert "error" not in Backtester(rank_cache=cache).run_backtest(panel, "signal")
+
+        stats = cache.stats()
+        # 因子与收益各一个条目；回测复用分层分析的十分位分组
+        assert stats["entries"] == 2
+        assert stats["hits"] == 1
+
+
+class TestIncrementalStatistics:
+    """Test incremental IC/decile statistics persisted between runs."""
+
+    def test_append_matches_full_analysis(self, tmp_path):
+        """Test that daily updates reproduce a full analysis and recompute on rewrites."""
+        from apps.factorhub.core.analysis_state import AnalysisStateStore
+        from apps.factorhub.core.factor_analyzer import FactorAnalyzer
+        from apps.factorhub.core.panel import MarketPanel
+
+        data = make_market(n_symbols=30)
+        data.loc[data.index % 13 == 0, "signal"] = np.nan
+        panel = MarketPanel.from_long(data, ["close", "signal"])
+        panel.attrs["data_version"] = {s: "0:250:abc" for s in panel.symbols}
+        analyzer = FactorAnalyzer(state_store=AnalysisStateStore(tmp_path))
+
+        def update(p):
+            return analyzer.update_factor_statistics(p, "signal", "signal", n_deciles=5, window=20)
+
+        first = update(panel.slice_dates(end_date=panel.dates[-40]))
+        assert first["full_recompute"]
+        for end in panel.dates[-39:-1]:
+            daily = update(panel.slice_dates(end_date=end))
+            assert not daily["full_recompute"] and daily["new_dates"] == 1
+        last = update(panel)
+        assert last["last_date"] == str(panel.dates[-2].date())
+
+        full_ic = analyzer.calculate_ic_analysis(panel, "signal", window=20)
+        full_decile = analyzer.calculate_decile_analysis(panel, "signal", n_deciles=5)
+        for name in ("ic_mean", "ic_std", "ir", "ic_win_rate", "ic_abs_mean", "t_statistic"):
+            assert last["ic"][name] == pytest.approx(full_ic[name], rel=1e-9), name
+        assert last["ic"]["t_p_value"] == pytest.approx(full_ic["t_p_value"], rel=1e-6)
+        assert last["ic"]["rolling_ir_last"] == pytest.approx(full_ic["rolling_ir_last"])
+        assert last["ic"]["sample_count"] == full_ic["sample_count"]
+        decile = last["decile"]
+        for name in ("mean_return", "std_return", "turnover"):
+            np.testing.assert_allclose(
+                decile["avg_returns"][name], full_decile["avg_returns"][name], rtol=1e-9
+            )
+        for name in ("long_short_return", "long_short_std", "turnover_rate"):
+            assert decile[name] == pytest.approx(full_decile[name], rel=1e-9), name
+        np.testing.assert_allclose(decile["decile_nav"], np.array(full_decile["decile_nav"])[:, -1])
+
+        assert update(panel)["new_dates"] == 0
+        # 分区整体重写（generation 变化）后从头重算
+        panel.attrs["data_version"] = {s: "1:250:def" for s in panel.symbols}
+        rewritten = update(panel)
+        assert rewritten["full_recompute"]
+        assert rewritten["ic"]["ic_mean"] == pytest.approx(full_ic["ic_mean"], rel=1e-9)
+
+
+class TestPanelConsumers:
+    """Test cases for analyzer and backtester panel inputs."""
+
+    def test_analyzer_accepts_panel(self, market):
+        """Test that IC analysis gives the same result for long and panel inputs."""
+        from apps.factorhub.core.factor_analyzer import FactorAnalyzer
+        from apps.factorhub.core.panel import MarketPanel
+
+        analyzer = FactorAnalyzer()
+        long_result = analyzer.calculate_ic_analysis(market, "signal")
+        panel_result = analyzer.calculate_ic_analysis(
+            MarketPanel.from_long(market, ["signal", "close"]), "signal"
+        )
+
+        assert panel_result["ic_mean"] == pytest.approx(long_result["ic_mean"])
+        assert panel_result["ic_series"] == long_result["ic_series"]
+
+    def test_vectorized_ic_matches_scipy(self, market):
+        """Test the vectorized IC payload against per-date scipy correlations."""
+        from scipy import stats
+
+        from apps.factorhub.core.factor_analyzer import FactorAnalyzer
+
+        data = market.copy()
+        data.loc[data.index % 7 == 0, "signal"] = np.nan
+        # 并列值
+        data.loc[data["symbol"] == "600003", "signal"] = data["signal"].round(1)
+        analyzer = FactorAnalyzer()
+        for method, scipy_func in (("spearman", stats.spearmanr), ("pearson", stats.pearsonr)):
+            result = analyzer.calculate_ic_analysis(data, "signal", "return_1d", method)
+            for row in result["ic_series"][:50]:
+                day = data[(data["date"] == row["date"])].dropna(subset=["signal", "return_1d"])
+                ic, p_value = scipy_func(day["signal"], day["return_1d"])
+                assert row["ic"] == pytest.approx(ic, abs=1e-12)
+                assert row["p_value"] == pytest.approx(p_value, rel=1e-8)
+                assert row["count"] == len(day)
+            ic_series = pd.Series([row["ic"] for row in result["ic_series"]])
+            t_stat, _ = stats.ttest_1samp(ic_series, 0)
+            assert result["t_statistic"] == pytest.approx(t_stat)
+            assert result["sample_count"] == len(ic_series)
+
+    def test_ic_matrix_matches_per_pair_analysis(self, market):
+        """Test that the factor x horizon IC matrix equals one IC analysis per pair."""
+        from apps.factorhub.core.factor_analyzer import FactorAnalyzer
+        from apps.factorhub.core.factor_engine import FactorEngine
+        from apps.factorhub.core.panel import MarketPanel
+
+        panel = MarketPanel.from_long(market)
+        block = FactorEngine().compute(panel, ["momentum_1m", "roc", "rsi"])
+        analyzer = FactorAnalyzer()
+
+        result = analyzer.calculate_ic_matrix(block, panel, [5, 1], method="pearson")
+
+        assert result["horizons"] == [1, 5]
+        assert result["ic"].shape == (3, 2, len(panel.dates))
+        assert len(result["summary"]) == 6
+        pairs = block.to_panel(panel)
+        close = panel["close"]
+        for row in result["summary"]:
+            horizon = row["horizon"]
+            forward = np.full(close.shape, np.nan)
+            forward[:-horizon] = close[horizon:] / close[:-horizon] - 1
+            pairs["forward"] = forward
+            single = analyzer.calculate_ic_analysis(pairs, row["factor"], "forward", "pearson")
+            assert row["ic_mean"] == pytest.approx(single["ic_mean"], rel=1e-9)
+            assert row["t_statistic"] == pytest.approx(single["t_statistic"], rel=1e-9)
+            assert row["sample_count"] == single["sample_count"]
+
+    def test_spearman_ic_matrix_reranks_on_joint_sample(self):
+        """Test that spearman IC cube equals per-pair analysis when NaN patterns differ."""
+        from apps.factorhub.core.factor_analyzer import FactorAnalyzer
+        from apps.factorhub.core.factor_engine import FactorBlock
+        from apps.factorhub.core.forward_returns import forward_return_name
+        from apps.factorhub.core.panel import MarketPanel
+
+        data = make_market(n_symbols=20)
+        data["other"] = np.random.default_rng(1).normal(size=len(data))
+        data.loc[data.index % 7 == 0, "signal"] = np.nan
+        data.loc[data.index % 11 == 0, "close"] = np.nan
+        panel = MarketPanel.from_long(data, ["close", "signal", "other"])
+        analyzer = FactorAnalyzer()
+
+        names = ["signal", "other"]
+        block = FactorBlock(names, panel.dates, panel.symbols, np.stack([panel[n] for n in names]))
+        block.computed = names
+        result = analyzer.calculate_ic_matrix(block, panel, [1, 5])
+
+        for row in result["summary"]:
+            single = analyzer.calculate_ic_analysis(
+                panel, row["factor"], forward_return_name(row["horizon"])
+            )
+            assert row["ic_mean"] == pytest.approx(single["ic_mean"], rel=1e-9)
+            assert row["sample_count"] == single["sample_count"]
+
+    def test_decile_analysis_matches_per_date_loop(self, market):
+        """Test columnar decile statistics and turnover against a per-date qcut loop."""
+        from apps.factorhub.core.factor_analyzer import FactorAnalyzer
+        from apps.factorhub.core.panel import MarketPanel
+
+        data = make_market(n_symbols=30)
+        data.loc[data.index % 7 == 0, "signal"] = np.nan
+        # 因子有持续性，换手率低于随机分组
+        data["signal"] = data.groupby("symbol")["signal"].transform(
+            lambda x: x.rolling(5, min_periods=1).mean()
+        )
+        panel = MarketPanel.from_long(data, ["signal", "return_1d"])
+        result = FactorAnalyzer().calculate_decile_analysis(panel, "signal", "return_1d", 5)
+        # 结果为可直接序列化的列表与浮点数
+        json.dumps(result)
+        assert isinstance(result["turnover_rate"], float)
+        counts, mean_returns, turnover, nav = (
+            np.array(result[key])
+            for key in ("decile_counts", "decile_returns", "decile_turnover", "decile_nav")
+        )
+
+        factor, returns = panel["signal"], panel["return_1d"]
+        previous = None
+        for t, date in enumerate(result["dates"]):
+            i = panel.dates.get_loc(pd.Timestamp(date))
+            present = ~(np.isnan(factor[i]) | np.isnan(returns[i]))
+            labels = np.full(len(panel.symbols), -1)
+            labels[present] = pd.qcut(factor[i, present], 5, labels=False)
+            for b in range(5):
+                members = labels == b
+                assert counts[b, t] == members.sum()
+                assert mean_returns[b, t] == pytest.approx(returns[i, members].mean())
+                if previous is not None:
+                    stayed = (members & (previous == b)).sum()
+                    expected = 1 - stayed / members.sum()
+                    assert turnover[b, t] == pytest.approx(expected)
+            previous = labels
+
+        assert np.isnan(turnover[:, 0]).all()
+        assert 0 < result["turnover_rate"] < 0.8
+        np.testing.assert_allclose(result["long_short"], mean_returns[4] - mean_returns[0])
+        assert result["avg_returns"]["count"] == [len(result["dates"])] * 5
+        np.testing.assert_allclose(nav[:, -1], np.prod(1 + mean_returns, axis=1))
+
+    def test_backtester_accepts_panel(self, market):
+        """Test that the backtester gives the same result for long and panel inputs."""
+        from apps.factorhub.core.backtester import Backtester
+        from apps.factorhub.core.panel import MarketPanel
+
+        long_result = Backtester().run_backtest(market, "signal", "monthly")
+        panel_result = Backtester().run_backtest(
+            MarketPanel.from_long(market, ["close", "signal"]), "signal", "monthly"
+        )
+
+        assert "error" not in long_result
+        assert panel_result["portfolio_values"] == long_result["portfolio_values"]